@@ -0,0 +1,229 @@
+import struct
+
+
+AR_MAGIC = b'!<arch>\n'
+FAT_MAGIC = b'\xca\xfe\xba\xbe'
+ELF_MAGIC = b'\x7fELF'
+
+#e_machine values of the architectures we build for
+ELF_MACHINES = {
+    3: 'x86',
+    40: 'arm',
+    62: 'x86_64',
+    183: 'aarch64',
+}
+
+_AR_HEADER_SIZE = 60
+
+#section types of the full and dynamic ELF symbol tables
+_SHT_SYMTAB = 2
+_SHT_DYNSYM = 11
+#symbol types with a size: STT_OBJECT and STT_FUNC
+_SIZED_SYMBOL_TYPES = (1, 2)
+
+
+class ArchiveError(Exception):
+    "Raised when a static library can't be read."
+
+
+def _get_members(data):
+    "Yields (name, member data) for each member of an ar archive."
+
+    offset = len(AR_MAGIC)
+    while offset + _AR_HEADER_SIZE <= len(data):
+        header = data[offset:offset + _AR_HEADER_SIZE]
+        name = header[:16].decode('ascii', 'replace').rstrip()
+        try:
+            size = int(header[48:58].decode('ascii').strip())
+        except ValueError:
+            raise ArchiveError('Bad archive member header at offset %d' % offset)
+
+        offset += _AR_HEADER_SIZE
+        member = data[offset:offset + size]
+
+        #BSD long names are stored at the start of the member data
+        if name.startswith('#1/'):
+            name_length = int(name[3:])
+            name = member[:name_length].rstrip(b'\0').decode('utf-8', 'replace')
+            member = member[name_length:]
+
+        yield name, member
+        #members are 2-byte aligned
+        offset += size + size % 2
+
+
+def _read_gnu_symbols(member, word_size):
+    "Symbol index of GNU/SysV archives: count, offsets, then NUL-terminated names."
+
+    word_format = '>I' if word_size == 4 else '>Q'
+    count = struct.unpack_from(word_format, member)[0]
+    names = member[word_size * (count + 1):].split(b'\0')
+    return [n.decode('utf-8', 'replace') for n in names[:count]]
+
+
+def _read_bsd_symbols(member):
+    "Symbol index of BSD/Mach-O archives: (name offset, member offset) pairs, then a string table."
+
+    ranlib_size = struct.unpack_from('<I', member)[0]
+    strtab_offset = 4 + ranlib_size + 4
+    strtab = member[strtab_offset:strtab_offset + struct.unpack_from('<I', member, 4 + ranlib_size)[0]]
+
+    names = []
+    for i in range(ranlib_size // 8):
+        name_offset = struct.unpack_from('<I', member, 4 + i * 8)[0]
+        names.append(strtab[name_offset:strtab.index(b'\0', name_offset)].decode('utf-8', 'replace'))
+    return names
+
+
+def _get_archive_symbols(data):
+    if not data.startswith(AR_MAGIC):
+        raise ArchiveError('Not an ar archive')
+
+    for name, member in _get_members(data):
+        if name == '/':
+            return set(_read_gnu_symbols(member, 4))
+        if name == '/SYM64/':
+            return set(_read_gnu_symbols(member, 8))
+        if name in ('__.SYMDEF', '__.SYMDEF SORTED'):
+            return set(_read_bsd_symbols(member))
+        #the index is always the first member
+        break
+
+    raise ArchiveError('Archive has no symbol index (was ranlib run?)')
+
+
+def get_archive_symbols(path):
+    """
+    Returns the set of global symbols defined by the given static library,
+    read from its symbol index. Mach-O symbols keep their leading underscore.
+
+    Universal (lipo) libraries return the symbols of all their architectures.
+    """
+
+    with open(path, 'rb') as fd:
+        data = fd.read()
+
+    try:
+        if not data.startswith(FAT_MAGIC):
+            return _get_archive_symbols(data)
+
+        symbols = set()
+        arch_count = struct.unpack_from('>I', data, 4)[0]
+        for i in range(arch_count):
+            #cputype, cpusubtype, offset, size, align
+            _, _, offset, size, _ = struct.unpack_from('>5I', data, 8 + i * 20)
+            symbols.update(_get_archive_symbols(data[offset:offset + size]))
+        return symbols
+    except (struct.error, ValueError, ArchiveError) as e:
+        raise ArchiveError('Unable to read %s: %s' % (path, e))
+
+
+def find_missing_symbols(path, symbols):
+    "Returns the given symbols that aren't defined by the static library at path."
+
+    defined = get_archive_symbols(path)
+    return [s for s in symbols if s not in defined and '_' + s not in defined]
+
+
+def get_elf_machine(data):
+    "Returns the architecture name of an ELF object/library, or None if data isn't ELF."
+
+    if not data.startswith(ELF_MAGIC) or len(data) < 20:
+        return None
+
+    #EI_DATA: 1 is little endian, 2 big endian
+    byte_order = '<' if data[5] == 1 else '>'
+    machine = struct.unpack_from(byte_order + 'H', data, 18)[0]
+    return ELF_MACHINES.get(machine, 'unknown (%d)' % machine)
+
+
+def get_elf_machines(path):
+    """
+    Returns the set of ELF architectures of the given shared library, or of
+    the object files in the given static library. Members that aren't ELF
+    objects (eg: the symbol index) are ignored.
+    """
+
+    with open(path, 'rb') as fd:
+        data = fd.read()
+
+    if not data.startswith(AR_MAGIC):
+        machine = get_elf_machine(data)
+        return set([machine]) if machine is not None else set()
+
+    try:
+        machines = set()
+        for _, member in _get_members(data):
+            machine = get_elf_machine(member)
+            if machine is not None:
+                machines.add(machine)
+        return machines
+    except (struct.error, ValueError, ArchiveError) as e:
+        raise ArchiveError('Unable to read %s: %s' % (path, e))
+
+
+def _read_elf_sections(data, byte_order, is_64):
+    "Returns a list of (type, offset, size, link) for each section of an ELF file."
+
+    if is_64:
+        shoff = struct.unpack_from(byte_order + 'Q', data, 40)[0]
+        shentsize, shnum = struct.unpack_from(byte_order + 'HH', data, 58)
+        section_format = byte_order + 'IIQQQQII'
+    else:
+        shoff = struct.unpack_from(byte_order + 'I', data, 32)[0]
+        shentsize, shnum = struct.unpack_from(byte_order + 'HH', data, 46)
+        section_format = byte_order + 'IIIIIIII'
+
+    sections = []
+    for i in range(shnum):
+        #name, type, flags, addr, offset, size, link, info
+        _, sh_type, _, _, offset, size, link, _ = struct.unpack_from(section_format, data, shoff + i * shentsize)
+        sections.append((sh_type, offset, size, link))
+    return sections
+
+
+def get_elf_symbol_sizes(path):
+    """
+    Returns {name: size in bytes} for the functions and data objects defined
+    by the given ELF shared library, from its full symbol table, or its
+    dynamic one if it has been stripped. Local symbols with the same name
+    (eg: static functions from different files) are added together.
+    """
+
+    with open(path, 'rb') as fd:
+        data = fd.read()
+
+    if not data.startswith(ELF_MAGIC):
+        raise ArchiveError('%s is not an ELF file' % path)
+
+    #EI_CLASS: 1 is 32-bit, 2 64-bit
+    is_64 = data[4] == 2
+    byte_order = '<' if data[5] == 1 else '>'
+
+    try:
+        sections = _read_elf_sections(data, byte_order, is_64)
+        tables = [s for s in sections if s[0] == _SHT_SYMTAB] or [s for s in sections if s[0] == _SHT_DYNSYM]
+
+        sizes = {}
+        for _, offset, size, link in tables:
+            _, strtab_offset, strtab_size, _ = sections[link]
+            strtab = data[strtab_offset:strtab_offset + strtab_size]
+
+            entry_size = 24 if is_64 else 16
+            for entry_offset in range(offset, offset + size, entry_size):
+                if is_64:
+                    name_offset, info, _, shndx, _, sym_size = struct.unpack_from(
+                        byte_order + 'IBBHQQ', data, entry_offset)
+                else:
+                    name_offset, _, sym_size, info, _, shndx = struct.unpack_from(
+                        byte_order + 'IIIBBH', data, entry_offset)
+
+                #skip undefined symbols (section 0) and those without a size
+                if shndx == 0 or not sym_size or info & 0xf not in _SIZED_SYMBOL_TYPES:
+                    continue
+
+                name = strtab[name_offset:strtab.index(b'\0', name_offset)].decode('utf-8', 'replace')
+                sizes[name] = sizes.get(name, 0) + sym_size
+        return sizes
+    except (struct.error, ValueError, IndexError) as e:
+        raise ArchiveError('Unable to read %s: %s' % (path, e))
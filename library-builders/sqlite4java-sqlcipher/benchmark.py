@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the build orchestrator itself, independent of the real
+compilers: scheduling, checksumming, unpacking, template rendering and the
+per-platform build pipeline, using synthetic tarballs and stub toolchains.
+
+Everything runs offline; results are printed as JSON for regression tracking.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from os.path import join, dirname, abspath
+
+from build import BuildTask
+from config import process_config_file
+from extract import extract_tarball
+from state import TaskStateStore
+from tasks import Task, Tasks
+from timing import Timeline
+from utils import (make_dirs, unhoist_directory, unpack_source, get_sha256_checksum,
+                   get_static_lib_name_for_platform, Template, get_template, list_files)
+
+
+BENCHMARKS = ['scheduler', 'sha256', 'unpack', 'template', 'stub-build']
+
+#stub toolchain commands; they just produce the files the real tools would
+_STUB_CONFIGURE = '''#!/bin/bash
+echo "stub configure $*"
+'''
+
+_STUB_MAKE = '''#!/bin/bash
+#stub make: "install" writes the lib into $STUB_PREFIX
+for arg in "$@"; do
+    if [ "$arg" = install ]; then
+        mkdir -p "$STUB_PREFIX/lib" "$STUB_PREFIX/include"
+        echo stub > "$STUB_PREFIX/lib/$STUB_LIB"
+        echo stub > "$STUB_PREFIX/include/stub.h"
+    fi
+done
+'''
+
+_STUB_GANT = '''#!/bin/bash
+echo "stub gant $*"
+'''
+
+_STUB_BUILD_SCRIPT = '''#!/bin/bash
+set -eu
+export STUB_PREFIX="{{prefix}}"
+export STUB_LIB="{{lib}}"
+configure --prefix="$STUB_PREFIX"
+make
+make install
+'''
+
+
+def make_synthetic_tarball(path, file_count, file_size, dir_fanout=50):
+    """
+    Writes a .tar.gz with a single top-level directory containing file_count
+    files of file_size bytes each, spread over subdirectories like a source tree.
+    """
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        top_dir = join(tmp_dir, 'synthetic-1.0')
+        #text-like content so the compression ratio resembles real sources
+        line = b'static int synthetic_function(int a, int b) { return a + b; }\n'
+        content = (line * (file_size // len(line) + 1))[:file_size]
+
+        for i in range(file_count):
+            dir_path = join(top_dir, 'dir%d' % (i // dir_fanout))
+            make_dirs(dir_path)
+            with open(join(dir_path, 'file%d.c' % i), 'wb') as fd:
+                fd.write(content)
+
+        with tarfile.open(path, 'w:gz') as tar:
+            tar.add(top_dir, 'synthetic-1.0')
+
+
+def make_stub_toolchain(path):
+    "Writes stub configure, make and gant commands into path; returns it for use in PATH."
+
+    make_dirs(path)
+    for name, text in [('configure', _STUB_CONFIGURE), ('make', _STUB_MAKE), ('gant', _STUB_GANT)]:
+        command_path = join(path, name)
+        with open(command_path, 'w', encoding='utf-8') as fd:
+            fd.write(text)
+        os.chmod(command_path, 0o755)
+
+    return path
+
+
+def _best_of(func, repeat):
+    "Returns the best wall time in seconds of repeat calls to func()."
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+class _NoopTask(Task):
+    def __init__(self, name, dependencies, output_path=None):
+        super().__init__(name)
+        self.output_path = output_path
+        for dependency in dependencies:
+            self.add_dependency(dependency)
+
+    def get_outputs(self, task_context):
+        return [self.output_path] if self.output_path is not None else []
+
+    def run(self, task_context):
+        if self.output_path is not None:
+            with open(self.output_path, 'w') as fd:
+                fd.write(self.name)
+
+
+def _make_task_graph(task_count, width, output_dir=None):
+    "Returns (Tasks, final task name) for layers of `width` tasks, each depending on the whole previous layer."
+
+    tasks = Tasks()
+    previous = []
+    for layer in range(0, task_count, width):
+        current = []
+        for i in range(layer, min(layer + width, task_count)):
+            output_path = join(output_dir, 'task%d' % i) if output_dir is not None else None
+            tasks.add(_NoopTask('task%d' % i, previous, output_path))
+            current.append('task%d' % i)
+        previous = current
+
+    tasks.add(_NoopTask('all', previous))
+    return tasks, 'all'
+
+
+def bench_scheduler(work_dir, task_count=500, width=10, jobs=4, repeat=3):
+    "Returns the per-task overhead of Tasks.run in microseconds, with and without state tracking."
+
+    def run(jobs, state_path=None, output_dir=None):
+        tasks, target = _make_task_graph(task_count, width, output_dir)
+        context = {'timeline': Timeline()}
+        state = TaskStateStore(state_path) if state_path is not None else None
+        tasks.run(target, context, jobs, state)
+
+    output_dir = join(work_dir, 'scheduler-outputs')
+    state_path = join(work_dir, 'scheduler-state.json')
+    make_dirs(output_dir)
+    #first run creates the outputs and state, so the timed runs skip every task
+    run(1, state_path, output_dir)
+
+    results = {
+        'serial': _best_of(lambda: run(1), repeat),
+        'parallel-j%d' % jobs: _best_of(lambda: run(jobs), repeat),
+        'serial-up-to-date': _best_of(lambda: run(1, state_path, output_dir), repeat),
+    }
+
+    return {'tasks': task_count + 1, 'us-per-task': {k: v * 1e6 / (task_count + 1) for k, v in results.items()}}
+
+
+def bench_sha256(work_dir, size_mb=64, repeat=3):
+    "Returns get_sha256_checksum throughput in MiB/s, and the cost of a cached TaskStateStore lookup."
+
+    path = join(work_dir, 'sha256-input')
+    chunk = os.urandom(1024*1024)
+    with open(path, 'wb') as fd:
+        for _ in range(size_mb):
+            fd.write(chunk)
+
+    elapsed = _best_of(lambda: get_sha256_checksum(path), repeat)
+
+    state = TaskStateStore(join(work_dir, 'sha256-state.json'))
+    state.get_file_checksum(path)
+    cached = _best_of(lambda: state.get_file_checksum(path), repeat)
+
+    return {'size-mb': size_mb, 'mb-per-sec': size_mb / elapsed, 'cached-lookup-us': cached * 1e6}
+
+
+def _legacy_unpack(src_path, output_path):
+    "The previous unpack_source implementation: extractall, then unhoist."
+
+    with tarfile.open(src_path) as tar:
+        tar.extractall(output_path)
+
+    unhoist_directory(output_path)
+
+
+def _time_unpack(unpack, src_path, work_dir, repeat):
+    timings = []
+    for _ in range(repeat):
+        output_path = join(work_dir, 'out')
+        if os.path.exists(output_path):
+            shutil.rmtree(output_path)
+        make_dirs(output_path)
+
+        start = time.perf_counter()
+        unpack(src_path, output_path)
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def bench_unpack(src_path, work_dir, repeat=3):
+    "Returns the best time in seconds for each way of unpacking src_path."
+
+    return {
+        'legacy-extractall-unhoist': _time_unpack(_legacy_unpack, src_path, work_dir, repeat),
+        'streaming': _time_unpack(lambda s, o: extract_tarball(s, o), src_path, work_dir, repeat),
+        'streaming-threaded': _time_unpack(lambda s, o: extract_tarball(s, o, threaded=True), src_path, work_dir, repeat),
+        'unpack_source': _time_unpack(unpack_source, src_path, work_dir, repeat),
+    }
+
+
+def bench_template(renders=2000, repeat=3):
+    """
+    Returns the average time in microseconds to parse, fetch from the
+    template registry and render each bundled build template.
+    """
+
+    template_dir = join(dirname(abspath(__file__)), 'templates')
+    results = {'us-per-parse': {}, 'us-per-cached-get': {}, 'us-per-render': {}}
+    for path in sorted(list_files(template_dir)):
+        name = os.path.basename(path)
+        template = get_template(name)
+        context = {key: 'value' for key in template.placeholders}
+
+        def parse():
+            for _ in range(renders):
+                Template(template.template_text)
+
+        def get():
+            for _ in range(renders):
+                get_template(name)
+
+        def render():
+            for _ in range(renders):
+                template.substitute(**context)
+
+        results['us-per-parse'][name] = _best_of(parse, repeat) * 1e6 / renders
+        results['us-per-cached-get'][name] = _best_of(get, repeat) * 1e6 / renders
+        results['us-per-render'][name] = _best_of(render, repeat) * 1e6 / renders
+
+    return results
+
+
+class _StubBuildTask(BuildTask):
+    "BuildTask running a stub build.sh against the synthetic tarball (saved as the sqlcipher source)."
+
+    def __init__(self):
+        super().__init__('build-stub', 'sqlcipher', 'stub')
+
+    def get_build_files(self, task_context, platform, prefix_dir, variant):
+        context = {
+            'prefix': prefix_dir,
+            'lib': get_static_lib_name_for_platform(platform, self.lib_name),
+        }
+        return {'build.sh': Template(_STUB_BUILD_SCRIPT).substitute(**context)}
+
+
+def _get_stub_context(root, platforms):
+    config = {key: join(root, 'unused') for key in [
+        'android-ndk-home', 'android-sdk-home', 'groovy-home', 'libtool-home',
+        'linux-jdk-home', 'osx-jdk-home', 'win32-jdk-home', 'gant-home']}
+    config.update({
+        'root': root,
+        'platforms': ', '.join(platforms),
+        'build-cache-size': '256',
+    })
+    context = process_config_file(config)
+    context['timeline'] = Timeline()
+    return context
+
+
+def bench_stub_build(src_path, work_dir, platform_count=4):
+    """
+    Returns wall times of a per-platform build using stub build.sh and
+    gant scripts: cold (unpack, clone, build, store), rebuilt from the build
+    cache, and up to date.
+    """
+
+    toolchain_path = make_stub_toolchain(join(work_dir, 'stub-toolchain'))
+    env_path = os.environ['PATH']
+    os.environ['PATH'] = toolchain_path + os.pathsep + env_path
+
+    root = join(work_dir, 'stub-root')
+    platforms = ['stub-%d' % i for i in range(platform_count)]
+    context = _get_stub_context(root, platforms)
+    make_dirs(context['root-src-path'])
+    shutil.copy(src_path, join(context['root-src-path'], 'sqlcipher.tar.gz'))
+    for platform_name in platforms:
+        make_dirs(join(context['root-prefix-path'], platform_name))
+
+    task = _StubBuildTask()
+    timeline = Timeline()
+
+    def run():
+        task.run(context)
+
+    def clear_prefixes():
+        for platform_name in platforms:
+            shutil.rmtree(join(context['root-prefix-path'], platform_name))
+            make_dirs(join(context['root-prefix-path'], platform_name))
+
+    try:
+        results = {'platforms': platform_count}
+
+        results['cold'] = _best_of(run, 1)
+        results['up-to-date'] = _best_of(run, 1)
+        clear_prefixes()
+        results['restored-from-build-cache'] = _best_of(run, 1)
+
+        #bypass both caches; only the pristine source tree is reused
+        clear_prefixes()
+        context['build-cache-size'] = 0
+        results['rebuilt-from-source-cache'] = _best_of(run, 1)
+
+        gant = join(toolchain_path, 'gant')
+        results['gant-run_command'] = _best_of(
+            lambda: timeline.run_command([gant, 'stub'], 'gant', stdout=subprocess.DEVNULL), 5)
+        results['gant-check_call'] = _best_of(
+            lambda: subprocess.check_call([gant, 'stub'], stdout=subprocess.DEVNULL), 5)
+    finally:
+        os.environ['PATH'] = env_path
+
+    return results
+
+
+def run_benchmarks(selected, args):
+    "Runs the selected benchmarks, returning {benchmark name: results}."
+
+    benchmarks = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        src_path = args.tarball
+        if src_path is None and ('unpack' in selected or 'stub-build' in selected):
+            src_path = join(work_dir, 'synthetic.tar.gz')
+            make_synthetic_tarball(src_path, args.files, args.file_size)
+
+        for name in selected:
+            print('Running %s benchmark' % name)
+            if name == 'scheduler':
+                benchmarks[name] = bench_scheduler(work_dir, repeat=args.repeat)
+            elif name == 'sha256':
+                benchmarks[name] = bench_sha256(work_dir, repeat=args.repeat)
+            elif name == 'unpack':
+                benchmarks[name] = bench_unpack(src_path, work_dir, args.repeat)
+            elif name == 'template':
+                benchmarks[name] = bench_template(repeat=args.repeat)
+            elif name == 'stub-build':
+                benchmarks[name] = bench_stub_build(src_path, work_dir)
+
+    return benchmarks
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the build orchestrator')
+    parser.add_argument('tarball', nargs='?', help='tarball to unpack (default: a generated synthetic one)')
+    parser.add_argument('--files', type=int, default=2000, help='file count of the synthetic tarball')
+    parser.add_argument('--file-size', type=int, default=16*1024, help='file size of the synthetic tarball')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', help='comma separated benchmarks to run (%s)' % ', '.join(BENCHMARKS))
+    parser.add_argument('--output', help='write the JSON results to this file instead of stdout')
+    args = parser.parse_args()
+
+    selected = BENCHMARKS if args.only is None else [b.strip() for b in args.only.split(',')]
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        parser.error('unknown benchmarks: %s' % ', '.join(sorted(unknown)))
+
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'synthetic-tarball': {'files': args.files, 'file-size': args.file_size} if args.tarball is None else None,
+    }
+
+    #keep stdout for the results; build output from the benchmarks goes to stderr
+    sys.stdout.flush()
+    stdout_fd = os.dup(1)
+    os.dup2(2, 1)
+
+    try:
+        results['benchmarks'] = run_benchmarks(selected, args)
+    finally:
+        sys.stdout.flush()
+        os.dup2(stdout_fd, 1)
+        os.close(stdout_fd)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as fd:
+            fd.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,20 +2,35 @@
 #requires: patch, gant, bash
 #TODO task help
 #TODO improve logging
-#unsupported platforms: android-x86_64, android-arm64-v8a (the openssl setenv script needs to be modified to support this)
 import subprocess
 import shutil
-from urllib import request
-from os import environ, unlink
-from os.path import exists, join
-
-from tasks import Task
+import hashlib
+import functools
+import json
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from os import environ, uname, rename
+from os.path import exists, join, basename, dirname, getsize
+
+from tasks import Task, estimate_makespan
+from archive import ArchiveError, find_missing_symbols, get_elf_machines, get_elf_symbol_sizes
+from cache import BuildCache, snapshot_tree, get_changed_files
+from compiler_cache import get_compiler_cache, get_stats_delta, format_stats
+from download import download_file, is_downloaded
+from logs import capture_output, track_log, untrack_log, print_log_tail
+from sources import SourceCache
+from scratch import ScratchSpace
+from timing import get_timeline
 from utils import (make_dirs, write_to_file, get_static_lib_name_for_platform,
-                   unpack_source, get_template, get_file_path,
+                   copy_file, get_template, get_file_path,
                    arch_to_setenv_info, platform_is_android,
-                   get_android_configure_host_type, apply_patch,
-                   get_sha256_checksum, get_os_from_platform,
-                   get_dynamic_lib_name_for_platform)
+                   get_android_configure_host_type, get_android_openssl_target, get_patch_template,
+                   get_os_from_platform,
+                   get_dynamic_lib_name_for_platform,
+                   get_template_path, get_patch_path, remove_path, read_file, get_sha256_checksum,
+                   get_host_platform, get_android_api, get_elf_machine_for_platform)
 
 
 DOWNLOAD_URLS = {
@@ -42,6 +57,84 @@ PLATFORM_WINDOWS = 'win32-x64'
 PLATFORM_IOS = 'ios'
 
 
+#extensions+col metadata are required by default for sqlite4java; build
+#profiles add their flags after these
+SQLCIPHER_REQUIRED_CFLAGS = '-DSQLITE_TEMP_STORE=3 -DSQLITE_ENABLE_COLUMN_METADATA -DSQLITE_HAS_CODEC -DSQLITE_OMIT_DEPRECATED'
+
+#workload run by the instrumented linux sqlcipher build (sqlcipher-pgo), in order
+SQLCIPHER_PGO_TRAINING_FILES = ['sqlcipher-train-insert.sql', 'sqlcipher-train-select.sql', 'sqlcipher-train-scan.sql']
+
+#(metric, whether higher is better) reported by files/sqlcipher-bench.c
+SQLCIPHER_BENCH_METRICS = [
+    ('open-ms', False),
+    ('insert-rows-per-s', True),
+    ('lookup-us', False),
+    ('scan-mb-per-s', True),
+]
+
+#assembly entry points that must be in libcrypto (for profiles without
+#no-asm), by get_openssl_arch(); AES-NI/SSSE3 on x86, NEON (bit-sliced AES)
+#and the ARMv8 crypto extensions on arm
+OPENSSL_ACCELERATED_SYMBOLS = {
+    'x86_64': ['OPENSSL_ia32_cpuid', 'aesni_cbc_encrypt', 'aesni_cbc_sha1_enc', 'vpaes_cbc_encrypt'],
+    'x86': ['OPENSSL_ia32_cpuid', 'aesni_cbc_encrypt', 'vpaes_cbc_encrypt'],
+    'armv7': ['_armv7_neon_probe', 'bsaes_cbc_encrypt', 'aes_v8_cbc_encrypt'],
+    'arm64': ['_armv8_aes_probe', '_armv8_sha1_probe', 'aes_v8_cbc_encrypt'],
+}
+
+#fat objects keep the static libs usable by links that don't use LTO
+LTO_CFLAGS = '-flto -ffat-lto-objects'
+
+#generated by prepare-sqlcipher-amalgamation and compiled by every sqlcipher build
+SQLCIPHER_AMALGAMATION_FILES = ['sqlite3.c', 'sqlite3.h']
+
+#compiler commands run by the (non-android) sqlcipher build scripts, without the
+#compiler cache; their identity is part of the autoconf cache fingerprint
+SQLCIPHER_COMPILERS = {
+    PLATFORM_LINUX: ['gcc'],
+    PLATFORM_OSX: ['x86_64-apple-darwin15-clang'],
+    PLATFORM_WINDOWS: ['x86_64-w64-mingw32-gcc'],
+    PLATFORM_IOS: ['xcrun', 'clang'],
+}
+
+#with size-optimize, every function and data object gets its own section, so the
+#sqlite4java link can drop the unused ones; hidden visibility keeps the openssl and
+#sqlcipher symbols out of the shared libraries' export tables (JNIEXPORT sets
+#default visibility on the JNI entry points)
+SIZE_CFLAGS = '-ffunction-sections -fdata-sections'
+SIZE_VISIBILITY_CFLAGS = '-fvisibility=hidden'
+
+#linker flags for the sqlite4java shared libraries with size-optimize;
+#--exclude-libs also hides the openssl assembly symbols, which -fvisibility
+#doesn't reach
+SIZE_LDFLAGS = {
+    PLATFORM_LINUX: '-Wl,--gc-sections -Wl,--exclude-libs,ALL',
+    PLATFORM_OSX: '-Wl,-dead_strip',
+    PLATFORM_WINDOWS: '-Wl,--gc-sections',
+    'android': '-Wl,--gc-sections -Wl,--exclude-libs,ALL',
+}
+
+#strip commands for the shipped desktop sqlite4java libraries; ndk-build
+#already strips the android ones, and the iOS static lib is left for the app's
+#link
+SQLITE4JAVA_STRIP_COMMANDS = {
+    PLATFORM_LINUX: ['strip', '--strip-unneeded'],
+    #-x: only the local symbols, the exports are the JNI entry points
+    PLATFORM_OSX: ['x86_64-apple-darwin15-strip', '-x'],
+    PLATFORM_WINDOWS: ['x86_64-w64-mingw32-strip', '--strip-unneeded'],
+}
+
+#number of symbols shown for each library by report-sizes
+SIZE_REPORT_SYMBOLS = 10
+
+#openssl headers sqlcipher's crypto_openssl.c includes (directly or through
+#the others), checked after installing openssl
+OPENSSL_MANIFEST_HEADERS = ['opensslconf.h', 'evp.h', 'hmac.h', 'rand.h']
+
+#guards the creation of the context's SourceCache by concurrent tasks
+_source_cache_lock = threading.Lock()
+
+
 class CreateWorkDirsTask(Task):
     "Creates the top-level work directories."
 
@@ -86,100 +179,507 @@ class DownloadTask(Task):
 
         self.add_dependency('create-work-dirs')
 
+    def get_input_values(self, task_context):
+        return [self.url, self.sha256_checksum]
+
+    def get_outputs(self, task_context):
+        return [join(task_context['root-src-path'], self.save_filename)]
+
     def run(self, task_context):
         save_path = join(task_context['root-src-path'], self.save_filename)
 
-        if exists(save_path):
+        timeline = get_timeline(task_context)
+
+        with timeline.span('checksum', 'phase'):
+            downloaded = is_downloaded(save_path, self.sha256_checksum)
+
+        if downloaded:
             print('%s already exists, not downloading' % save_path)
             return
 
         print('Downloading %s -> %s' % (self.url, save_path))
-        request.urlretrieve(self.url, save_path)
-        print('Verifying checksum... ', end='', flush=True)
-        got = get_sha256_checksum(save_path)
-        if got != self.sha256_checksum:
-            print('FAILED')
-            unlink(save_path)
-            raise RuntimeError('SHA256 checksum verification failed for %s: got %s but expected %s' % (self.lib_name, got, self.sha256_checksum))
-        else:
-            print('OK')
+        with timeline.span('download', 'phase', url=self.url):
+            download_file(self.url, save_path, self.sha256_checksum)
+        print('Downloaded and verified %s' % save_path)
+
+
+class DownloadAllTask(Task):
+    "Depends on every download task, so they can all be run (concurrently, with -j) at once."
+
+    def __init__(self, download_tasks):
+        super().__init__('download-all', 'Download all sources')
+
+        for task in download_tasks:
+            self.add_dependency(task.name)
+
+    def run(self, task_context):
+        pass
 
 
 class BuildTask(Task):
-    "Generic per-platform build Task base."
+    """
+    Generic per-platform build Task base.
+
+    Each platform may be built in several variants (eg: with different
+    compiler flags), each installed into its own prefix; the None variant is
+    installed into the platform's prefix under root/.
+    """
+
+    #whether the build script's makes may draw parallel jobs from the jobserver
+    parallel_make = True
 
-    def __init__(self, task_name, build_item_name, lib_name):
-        super().__init__(task_name, 'Build ' + build_item_name)
+    def __init__(self, task_name, build_item_name, lib_name, description=None):
+        super().__init__(task_name, description or 'Build ' + build_item_name)
         self.build_item_name = build_item_name
         self.lib_name = lib_name
 
         self.add_dependency('create-platform-dirs')
 
-    def do_build(self, text_context, platform, prefix_dir, build_dir):
+    def get_variants(self, task_context):
+        "Returns the variants built for each platform."
+        return [None]
+
+    def get_build_files(self, task_context, platform, prefix_dir, variant):
+        """
+        Returns a dict of file name -> contents to write into the build dir.
+        Must contain build.sh, which is run to build and install into prefix_dir.
+        """
         raise NotImplementedError()
 
-    def run_build_script(self, build_dir, template):
+    def get_patches(self, task_context, platform):
+        "Returns a list of (patch_name, patch_context) applied to the pristine source tree."
+        return []
+
+    def get_toolchain_info(self, task_context, platform):
+        "Returns a list of toolchain paths from the config that the build depends on."
+        if platform_is_android(platform):
+            return [task_context['android-ndk-home'], task_context['android-sdk-home'], task_context['libtool-home']]
+        return []
+
+    def get_dependency_items(self, platform):
+        "Returns the build items (installed into the platform's prefix) this build depends on."
+        return []
+
+    def get_prefix_dir(self, task_context, platform, variant):
+        "Returns the prefix the given variant is installed into."
+        return get_prefix_dir(task_context, platform, variant)
+
+    def _get_target_name(self, platform, variant):
+        return get_target_name(platform, variant)
+
+    def _get_targets(self, task_context):
+        "Returns a (platform, variant) pair for every build of this task."
+        return [(platform, variant) for variant in self.get_variants(task_context)
+                for platform in task_context['platforms']]
+
+    def prepare_build_dir(self, task_context, platform, build_dir):
+        "Hook to modify the (already patched) source tree before the build script is run."
+
+    def get_manifest(self, task_context, platform):
+        """
+        Returns the paths, relative to the prefix, that a complete install must
+        contain; the static lib by default.
+        """
+        return [join('lib', get_static_lib_name_for_platform(platform, self.lib_name))]
+
+    def _get_missing_outputs(self, task_context, platform, prefix_dir):
+        "Returns the manifest paths that are missing (or empty) in prefix_dir."
+
+        missing = []
+        for path in self.get_manifest(task_context, platform):
+            full_path = join(prefix_dir, path)
+            if not exists(full_path) or getsize(full_path) == 0:
+                missing.append(path)
+        return missing
+
+    def verify_build(self, task_context, platform, prefix_dir):
+        """
+        Checks the installed build (or one restored from the build cache);
+        raises RuntimeError on failure. By default checks that the static lib
+        was built for the platform's architecture.
+        """
+
+        verify_elf_machine(join(prefix_dir, 'lib', get_static_lib_name_for_platform(platform, self.lib_name)), platform)
+
+    def get_cc_launcher(self, task_context, platform):
+        "Returns the compiler cache command templates prefix the compiler with ({{cc-launcher}})."
+
+        compiler_cache = get_compiler_cache(task_context, platform)
+        return compiler_cache.launcher if compiler_cache is not None else ''
+
+    def do_build(self, task_context, platform, prefix_dir, build_dir, variant):
+        """
+        Builds and installs into prefix_dir. Returns the compiler cache's
+        (hits, misses) for the build, or None.
+        """
+
+        self.prepare_build_dir(task_context, platform, build_dir)
+
+        build_files = self.get_build_files(task_context, platform, prefix_dir, variant)
+        for name, text in build_files.items():
+            if name != 'build.sh':
+                write_to_file(join(build_dir, name), text)
+
+        compiler_cache = get_compiler_cache(task_context, platform)
+        if compiler_cache is None:
+            self.run_build_script(task_context, build_dir, build_files['build.sh'])
+            return None
+
+        before = compiler_cache.get_stats()
+        self.run_build_script(task_context, build_dir, build_files['build.sh'], compiler_cache.get_env(environ))
+        return get_stats_delta(before, compiler_cache.get_stats())
+
+    def run_build_script(self, task_context, build_dir, template, env=None):
+        """
+        Runs the build script, recording it (and its configure/make steps) to
+        the context's timeline.
+        """
+
         script_name = 'build.sh'
         script_path = join(build_dir, script_name)
         print('Writing build script to %s' % script_path)
         write_to_file(script_path, template)
 
-        print('Starting build')
-        subprocess.check_call(['bash', script_name], cwd=build_dir)
+        timeline = get_timeline(task_context)
+        jobserver = task_context.get('jobserver')
+        if jobserver is None:
+            print('Starting build')
+            timeline.run_script(script_name, script_name, cwd=build_dir, env=env)
+            return
+
+        #the script's top-level make runs in the slot of the token we hold
+        with jobserver.token():
+            print('Starting build')
+            if self.parallel_make:
+                timeline.run_script(script_name, script_name, cwd=build_dir,
+                                    env=jobserver.get_env(env if env is not None else environ),
+                                    pass_fds=jobserver.fds)
+            else:
+                timeline.run_script(script_name, script_name, cwd=build_dir, env=env)
+
+    def _get_stamp_path(self, prefix_dir, build_item_name):
+        return join(prefix_dir, '.build-%s.key' % build_item_name)
+
+    def _read_stamp(self, prefix_dir, build_item_name):
+        try:
+            with open(self._get_stamp_path(prefix_dir, build_item_name), 'r', encoding='utf-8') as fd:
+                return fd.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def get_cache_key(self, task_context, platform, prefix_dir, variant):
+        """
+        Returns a hash of everything that determines this build's installed
+        output: the source tarball, rendered build files, patches, toolchain
+        paths and the builds of any dependencies in the platform's prefix.
+        """
+
+        build_files = self.get_build_files(task_context, platform, prefix_dir, variant)
+        patches = [get_patch_template(name).substitute(**context)
+                   for name, context in self.get_patches(task_context, platform)]
+        deps_prefix_dir = self.get_prefix_dir(task_context, platform, None)
+        dependencies = [(item, self._read_stamp(deps_prefix_dir, item))
+                        for item in self.get_dependency_items(platform)]
+
+        inputs = [
+            self.name,
+            platform,
+            DOWNLOAD_HASHES[self.build_item_name],
+            sorted(build_files.items()),
+            patches,
+            self.get_toolchain_info(task_context, platform),
+            dependencies,
+        ]
+        return hashlib.sha256(json.dumps(inputs).encode('utf-8')).hexdigest()
+
+    def get_inputs(self, task_context):
+        return [join(task_context['root-src-path'], '%s.tar.gz' % self.build_item_name)]
+
+    def get_input_values(self, task_context):
+        values = {}
+        for platform, variant in self._get_targets(task_context):
+            prefix_dir = self.get_prefix_dir(task_context, platform, variant)
+            values[self._get_target_name(platform, variant)] = self.get_cache_key(
+                task_context, platform, prefix_dir, variant)
+        return values
+
+    def get_outputs(self, task_context):
+        outputs = []
+        for platform, variant in self._get_targets(task_context):
+            prefix_dir = self.get_prefix_dir(task_context, platform, variant)
+            outputs.append(join(prefix_dir, 'lib', get_static_lib_name_for_platform(platform, self.lib_name)))
+            outputs.append(self._get_stamp_path(prefix_dir, self.build_item_name))
+        return outputs
+
+    def _get_build_cache(self, task_context):
+        max_size = task_context['build-cache-size'] * 1024 * 1024
+        if max_size <= 0:
+            return None
+        return BuildCache(task_context['build-cache-path'], max_size)
+
+    def _build_platform(self, task_context, src_path, platform, variant, print_tail=True):
+        """
+        Builds (or restores) a single platform variant, logging its output to
+        the platform's log. Returns a dict with the result (built, restored
+        or up-to-date), its duration and the compiler cache stats of the
+        build (or None).
+        """
+
+        start = time.time()
+        target = self._get_target_name(platform, variant)
+        log_path = self._get_log_path(task_context, platform, variant)
+        with capture_output(log_path, target, print_tail):
+            with get_timeline(task_context).span(target, 'platform', task=self.name, platform=platform) as trace_args:
+                cc_stats = self._build_platform_traced(task_context, src_path, platform, variant, trace_args)
+
+        return {'result': trace_args['result'], 'duration': time.time() - start, 'compiler-cache': cc_stats}
+
+    def _build_platform_traced(self, task_context, src_path, platform, variant, trace_args):
+        timeline = get_timeline(task_context)
+        target = self._get_target_name(platform, variant)
+        prefix_dir = self.get_prefix_dir(task_context, platform, variant)
+        make_dirs(prefix_dir)
+
+        key = self.get_cache_key(task_context, platform, prefix_dir, variant)
+
+        if (self._read_stamp(prefix_dir, self.build_item_name) == key and
+                not self._get_missing_outputs(task_context, platform, prefix_dir)):
+            print('%s lib is up to date, skipping build' % self.lib_name)
+            trace_args['result'] = 'up-to-date'
+            return None
+
+        cache = self._get_build_cache(task_context)
+        cc_stats = None
+
+        with timeline.span('restore', 'phase'):
+            restored = cache is not None and cache.restore(key, prefix_dir)
+
+        if restored:
+            print('Restored %s for %s from build cache (%s)' % (self.build_item_name, target, key))
+            trace_args['result'] = 'restored'
+        else:
+            print('Building for ' + target)
+            trace_args['result'] = 'built'
+            before = snapshot_tree(prefix_dir)
+
+            scratch = get_scratch_space(task_context)
+            source_cache = get_source_cache(task_context)
+            with scratch.build_dir(platform, self._get_build_dir_name(variant)) as build_dir:
+                with timeline.span('prepare-source', 'phase'):
+                    tree_path = source_cache.prepare(
+                        src_path, DOWNLOAD_HASHES[self.build_item_name], self.get_patches(task_context, platform),
+                        build_dir)
+
+                cc_stats = self.do_build(task_context, platform, prefix_dir, build_dir, variant)
+                source_cache.check_tree(tree_path)
+
+            if cache is not None and not self._get_missing_outputs(task_context, platform, prefix_dir):
+                print('Storing %s for %s in build cache (%s)' % (self.build_item_name, target, key))
+                with timeline.span('store', 'phase'):
+                    cache.store(key, prefix_dir, get_changed_files(before, snapshot_tree(prefix_dir)))
+
+        print('Verifying build output')
+        missing = self._get_missing_outputs(task_context, platform, prefix_dir)
+        if missing:
+            raise RuntimeError('%s build failed, missing from %s: %s' % (
+                self.build_item_name, prefix_dir, ', '.join(missing)))
+        self.verify_build(task_context, platform, prefix_dir)
+
+        write_to_file(self._get_stamp_path(prefix_dir, self.build_item_name), key)
+        return cc_stats
+
+    def _get_build_dir_name(self, variant):
+        return self.build_item_name if variant is None else '%s-%s' % (self.build_item_name, variant)
+
+    def _get_log_path(self, task_context, platform, variant):
+        return join(task_context['root-build-path'], platform, '%s-build.log' % self._get_build_dir_name(variant))
+
+    def _build_platform_in_worker(self, task_context, src_path, platform, variant):
+        "Runs _build_platform in a worker process. Returns (result, timing events)."
+
+        #the tail of the log is printed by the parent, below its status line
+        result = self._build_platform(task_context, src_path, platform, variant, print_tail=False)
+        return result, get_timeline(task_context).events
+
+    def _get_platform_durations(self, task_context, targets):
+        "Returns {target name: duration of its last build, or None}."
+
+        state = task_context.get('state')
+        names = [self._get_target_name(platform, variant) for platform, variant in targets]
+        return {n: state.get_duration(self.name, n) if state is not None else None for n in names}
+
+    def _run_parallel(self, task_context, src_path, targets):
+        """
+        Builds each (platform, variant) in a separate worker process, logging
+        to a per-platform file. Returns {target name: _build_platform result}.
+        """
+
+        jobs = min(task_context['platform-jobs'], len(targets))
+        #start the platforms that took longest last time first, so a slow one
+        #isn't left running alone at the end
+        durations = self._get_platform_durations(task_context, targets)
+        ordered = sorted(targets, key=lambda t: -(durations[self._get_target_name(*t)] or 0.0))
+
+        futures = {}
+        with create_platform_executor(jobs) as executor:
+            for platform, variant in ordered:
+                log_path = self._get_log_path(task_context, platform, variant)
+                target = self._get_target_name(platform, variant)
+                print('Building %s for %s (log: %s)' % (self.build_item_name, target, log_path))
+                track_log(log_path, target)
+                future = executor.submit(self._build_platform_in_worker, task_context, src_path, platform, variant)
+                futures[future] = (platform, variant)
+
+            failed = []
+            results = {}
+            for future in as_completed(futures):
+                platform, variant = futures[future]
+                target = self._get_target_name(platform, variant)
+                log_path = self._get_log_path(task_context, platform, variant)
+                untrack_log(log_path)
+                exc = future.exception()
+                if exc is None:
+                    results[target], events = future.result()
+                    print('%s for %s: %s' % (self.build_item_name, target, results[target]['result']))
+                    get_timeline(task_context).add_events(events)
+                else:
+                    print('%s for %s: FAILED (%s)' % (self.build_item_name, target, exc))
+                    print_log_tail(log_path)
+                    failed.append(target)
+
+        if failed:
+            raise RuntimeError('%s build failed for: %s' % (self.build_item_name, ', '.join(sorted(failed))))
+
+        return results
+
+    def _print_compiler_cache_stats(self, task_context, results):
+        #platforms that were up to date or restored from the build cache have no stats
+        for platform, variant in self._get_targets(task_context):
+            target = self._get_target_name(platform, variant)
+            cc_stats = results[target]['compiler-cache']
+            if cc_stats is not None:
+                print('%s stats for %s on %s: %s' % (task_context['compiler-cache'], self.build_item_name,
+                                                     target, format_stats(cc_stats)))
+
+    def _record_platform_durations(self, task_context, results):
+        state = task_context.get('state')
+        if state is None:
+            return
+
+        #only actual builds are representative of how long a platform takes
+        for target, result in results.items():
+            if result['result'] == 'built':
+                state.record_duration(self.name, result['duration'], target)
+
+    def get_plan(self, task_context, state, dependencies_stale):
+        cache = self._get_build_cache(task_context)
+        targets = self._get_targets(task_context)
+        durations = self._get_platform_durations(task_context, targets)
+        items = []
+        build_durations = {}
+
+        for platform, variant in targets:
+            target = self._get_target_name(platform, variant)
+            prefix_dir = self.get_prefix_dir(task_context, platform, variant)
+            key = self.get_cache_key(task_context, platform, prefix_dir, variant)
+
+            if dependencies_stale:
+                #the dependencies' rebuilt stamps will change the cache key
+                status = 'build'
+            elif (self._read_stamp(prefix_dir, self.build_item_name) == key and
+                  not self._get_missing_outputs(task_context, platform, prefix_dir)):
+                status = 'up-to-date'
+            elif cache is not None and cache.contains(key):
+                status = 'cached'
+            else:
+                status = 'build'
+
+            if status == 'build':
+                build_durations[target] = durations[target]
+                items.append((target, status, durations[target]))
+            else:
+                items.append((target, status, 0.0))
+
+        if None in build_durations.values():
+            return None, items
+
+        return estimate_makespan(build_durations, {}, task_context['platform-jobs']), items
 
     def run(self, task_context):
         src_path = join(task_context['root-src-path'], '%s.tar.gz' % self.build_item_name)
+        targets = self._get_targets(task_context)
 
-        for platform in task_context['platforms']:
-            prefix_dir = join(task_context['root-prefix-path'], platform)
+        if task_context['platform-jobs'] > 1 and len(targets) > 1:
+            results = self._run_parallel(task_context, src_path, targets)
+        else:
+            results = {}
+            for platform, variant in targets:
+                target = self._get_target_name(platform, variant)
+                print('Building %s for %s (log: %s)' % (
+                    self.build_item_name, target, self._get_log_path(task_context, platform, variant)))
+                results[target] = self._build_platform(task_context, src_path, platform, variant)
+                print('%s for %s: %s' % (self.build_item_name, target, results[target]['result']))
 
-            lib_path = join(prefix_dir, 'lib', get_static_lib_name_for_platform(platform, self.lib_name))
-            if exists(lib_path):
-                print('%s lib present, skipping build' % self.lib_name)
-                continue
+        self._record_platform_durations(task_context, results)
+        self._print_compiler_cache_stats(task_context, results)
 
-            print('Building for ' + platform)
-            build_dir = join(task_context['root-build-path'], platform, self.build_item_name)
-            unpack_source(src_path, build_dir)
 
-            self.do_build(task_context, platform, prefix_dir, build_dir)
+class BuildOpenSSLTaskBase(BuildTask):
+    def get_configure_options(self, task_context):
+        "Returns the configure options of the openssl-profile build profile."
+        return task_context['openssl-profiles'][task_context['openssl-profile']]
 
-            print('Verifying build output')
-            if not exists(lib_path):
-                raise RuntimeError('%s build failed, unable to find lib at %s' % (self.build_item_name, lib_path))
+    def get_manifest(self, task_context, platform):
+        return super().get_manifest(task_context, platform) + [
+            join('include', 'openssl', h) for h in OPENSSL_MANIFEST_HEADERS]
 
+    def verify_build(self, task_context, platform, prefix_dir):
+        super().verify_build(task_context, platform, prefix_dir)
 
-class BuildOpenSSLTaskBase(BuildTask):
-    #CAST causes some text relocations to be generated so we need to disable it
-    _configure_options = 'no-ssl2 no-ssl3 no-cast no-comp no-dso no-hw no-engine no-shared'
+        symbols = OPENSSL_ACCELERATED_SYMBOLS.get(get_openssl_arch(platform))
+        if symbols is None or 'no-asm' in self.get_configure_options(task_context).split():
+            return
+
+        lib_path = join(prefix_dir, 'lib', get_static_lib_name_for_platform(platform, self.lib_name))
+        try:
+            missing = find_missing_symbols(lib_path, symbols)
+        except ArchiveError as e:
+            raise RuntimeError(str(e))
+
+        if missing:
+            raise RuntimeError('%s for %s was built without its assembly implementations (missing: %s); '
+                               'check the configure target and options' % (
+                                   self.build_item_name, platform, ', '.join(missing)))
+        print('Found accelerated implementations in %s: %s' % (lib_path, ', '.join(symbols)))
 
     def _get_template_filename(self, platform):
         return 'openssl-%s-build.sh' % get_os_from_platform(platform)
 
-    def _get_template(self, platform, prefix_dir):
+    def _get_template(self, task_context, platform, prefix_dir):
         template = get_template(self._get_template_filename(platform))
         context = {
             'prefix': prefix_dir,
-            'configure-options': self._configure_options,
+            'configure-options': self.get_configure_options(task_context),
+            'minimal-install': get_minimal_install(task_context),
+            'cc-launcher': self.get_cc_launcher(task_context, platform),
+            'size-cflags': get_size_cflags(task_context, platform),
         }
         return template.substitute(**context)
 
 
 class IOSBuildOpenSSLTask(BuildOpenSSLTaskBase):
+    #build-libssl.sh runs the whole 1.0.2 build, which isn't safe with parallel make
+    parallel_make = False
+
     def __init__(self):
         super().__init__('build-openssl-ios', 'openssl-for-iphone', 'crypto')
         self.add_dependency('download-openssl-for-iphone')
 
-    def do_build(self, text_context, platform, prefix_dir, build_dir):
-        template = self._get_template(platform, prefix_dir)
-
-        self.run_build_script(build_dir, template)
+    def get_build_files(self, task_context, platform, prefix_dir, variant):
+        return {'build.sh': self._get_template(task_context, platform, prefix_dir)}
 
 
 class BuildOpenSSLTask(BuildOpenSSLTaskBase):
-    #CAST causes some text relocations to be generated so we need to disable it
-    _configure_options = 'no-ssl2 no-ssl3 no-cast no-comp no-dso no-hw no-engine no-shared'
-
     def __init__(self):
         super().__init__('build-openssl', 'openssl', 'crypto')
         self.add_dependency('download-openssl')
@@ -190,10 +690,15 @@ class BuildOpenSSLTask(BuildOpenSSLTaskBase):
             'prefix': prefix_dir,
             'sdk-root': task_context['android-sdk-home'],
             'ndk-root': task_context['android-ndk-home'],
+            'target': get_android_openssl_target(platform),
+            'configure-options': self.get_configure_options(task_context),
+            'minimal-install': get_minimal_install(task_context),
+            'cc-launcher': self.get_cc_launcher(task_context, platform),
+            'size-cflags': get_size_cflags(task_context, platform),
         }
         return template.substitute(**context)
 
-    def _write_setenv_android(self, build_dir, platform):
+    def _get_setenv_android(self, platform):
         template = get_template('setenv-android.sh')
         aarch, eabi = arch_to_setenv_info(platform)
         context = {
@@ -202,24 +707,30 @@ class BuildOpenSSLTask(BuildOpenSSLTaskBase):
             'eabi': eabi,
             #x86 or arm (nothing else supported by script)
             'arch': aarch,
-            'api': '19',
+            'api': str(get_android_api(platform)),
         }
-        write_to_file(join(build_dir, 'setenv-android.sh'), template.substitute(**context))
+        return template.substitute(**context)
 
-    def do_build(self, task_context, platform, prefix_dir, build_dir):
+    def get_build_files(self, task_context, platform, prefix_dir, variant):
         if platform_is_android(platform):
-            self._write_setenv_android(build_dir, platform)
-            template = self._get_android_template(task_context, prefix_dir, platform)
-        else:
-            template = self._get_template(platform, prefix_dir)
+            return {
+                'setenv-android.sh': self._get_setenv_android(platform),
+                'build.sh': self._get_android_template(task_context, prefix_dir, platform),
+            }
 
-        self.run_build_script(build_dir, template)
+        return {'build.sh': self._get_template(task_context, platform, prefix_dir)}
 
 
 class BuildSQLCipher(BuildTask):
-    def __init__(self):
-        super().__init__('build-sqlcipher', 'sqlcipher', 'sqlcipher')
+    """
+    Builds sqlcipher with the flags of the sqlcipher-profile build profile,
+    into each platform's prefix (where sqlite4java links against it).
+    """
+
+    def __init__(self, task_name='build-sqlcipher', description=None):
+        super().__init__(task_name, 'sqlcipher', 'sqlcipher', description)
         self.add_dependency('download-sqlcipher')
+        self.add_dependency('prepare-sqlcipher-amalgamation')
 
     def configure(self, context):
         for platform in context['platforms']:
@@ -228,13 +739,69 @@ class BuildSQLCipher(BuildTask):
             else:
                 self.add_dependency('build-openssl')
 
-    def _get_android_template(self, task_context, prefix_dir, platform):
+    def get_dependency_items(self, platform):
+        if platform == PLATFORM_IOS:
+            return ['openssl-for-iphone']
+        return ['openssl']
+
+    def get_profile(self, task_context, variant):
+        "Returns the build profile name used for the given variant."
+        return task_context['sqlcipher-profile'] if variant is None else variant
+
+    def get_cflags(self, task_context, platform, variant):
+        "Returns the defines sqlite4java requires followed by the build profile's (and LTO and size) flags."
+
+        profile_flags = task_context['sqlcipher-profiles'][self.get_profile(task_context, variant)]
+        lto_flags = LTO_CFLAGS if uses_lto(task_context, platform) else ''
+        size_flags = get_size_cflags(task_context, platform)
+        return ' '.join(f for f in [SQLCIPHER_REQUIRED_CFLAGS, profile_flags, lto_flags, size_flags] if f)
+
+    def get_manifest(self, task_context, platform):
+        return super().get_manifest(task_context, platform) + [join('include', 'sqlcipher', 'sqlite3.h')]
+
+    def _get_compiler_command(self, task_context, platform):
+        "Returns the compiler command the build script uses (without the compiler cache)."
+
+        if platform_is_android(platform):
+            _, eabi = arch_to_setenv_info(platform)
+            #see host-arch in _get_android_template
+            return [join(task_context['android-ndk-home'], 'toolchains', eabi, 'prebuilt', 'linux-x86_64', 'bin',
+                         '%s-gcc' % get_android_configure_host_type(platform))]
+        return SQLCIPHER_COMPILERS[platform]
+
+    def get_autoconf_cache(self, task_context, platform, variant):
+        """
+        Returns the path (without extension) of the autoconf cache the build
+        script passes to configure, named by a fingerprint of everything
+        configure's cached results (and the variables autoconf refuses to
+        reuse a cache across) depend on: the toolchain, compiler cache and
+        flags.
+        """
+
+        fingerprint = [
+            platform,
+            self.get_toolchain_info(task_context, platform),
+            get_compiler_identity(tuple(self._get_compiler_command(task_context, platform))),
+            self.get_cc_launcher(task_context, platform),
+            self.get_prefix_dir(task_context, platform, None),
+            self.get_cflags(task_context, platform, variant),
+        ]
+        h = hashlib.sha256(json.dumps(fingerprint).encode('utf-8')).hexdigest()[:16]
+        return join(task_context['autoconf-cache-path'], '%s-%s' % (platform, h))
+
+    def get_amalgamation_dir(self, task_context, variant):
+        "Returns the directory of the amalgamation prepare-sqlcipher-amalgamation generates for the variant."
+        profile = self.get_profile(task_context, variant)
+        return get_amalgamation_dir(task_context, get_sqlcipher_feature_flags(task_context, profile))
+
+    def _get_android_template(self, task_context, prefix_dir, platform, variant):
         template = get_template('sqlcipher-android-build.sh')
         aarch, eabi = arch_to_setenv_info(platform)
         context = {
             'prefix': prefix_dir,
+            'deps-prefix': self.get_prefix_dir(task_context, platform, None),
             'ndk-home': task_context['android-ndk-home'],
-            'api': '19',
+            'api': str(get_android_api(platform)),
             'eabi': eabi,
             'host': get_android_configure_host_type(platform),
             #arm/mips/x86
@@ -242,40 +809,311 @@ class BuildSQLCipher(BuildTask):
             #FIXME
             #this is the building system's platform
             'host-arch': 'linux-x86_64',
+            'minimal-install': get_minimal_install(task_context),
+            'amalgamation-dir': self.get_amalgamation_dir(task_context, variant),
+            'autoconf-cache': self.get_autoconf_cache(task_context, platform, variant),
+            'cc-launcher': self.get_cc_launcher(task_context, platform),
+            'sqlcipher-cflags': self.get_cflags(task_context, platform, variant),
         }
         return template.substitute(**context)
 
-    def _get_template_filename(self, platform):
+    def _uses_pgo(self, task_context, platform):
+        #the training workload has to run on the build host
+        return task_context['sqlcipher-pgo'] and platform == PLATFORM_LINUX
+
+    def _get_template_filename(self, task_context, platform):
+        if self._uses_pgo(task_context, platform):
+            return 'sqlcipher-linux-pgo-build.sh'
         return 'sqlcipher-%s-build.sh' % get_os_from_platform(platform)
 
-    def _get_template(self, platform, prefix_dir):
-        template = get_template(self._get_template_filename(platform))
+    def _get_template(self, task_context, platform, prefix_dir, variant):
+        template = get_template(self._get_template_filename(task_context, platform))
         context = {
             'prefix': prefix_dir,
+            'deps-prefix': self.get_prefix_dir(task_context, platform, None),
+            'minimal-install': get_minimal_install(task_context),
+            'amalgamation-dir': self.get_amalgamation_dir(task_context, variant),
+            'autoconf-cache': self.get_autoconf_cache(task_context, platform, variant),
+            'cc-launcher': self.get_cc_launcher(task_context, platform),
+            'sqlcipher-cflags': self.get_cflags(task_context, platform, variant),
         }
         return template.substitute(**context)
 
-    def _apply_windows_patch(self, build_dir):
-        print('Applying windows patch')
-        apply_patch(build_dir, 'sqlcipher-win32', {})
-
-    def do_build(self, task_context, platform, prefix_dir, build_dir):
+    def get_build_files(self, task_context, platform, prefix_dir, variant):
         if platform_is_android(platform):
-            template = self._get_android_template(task_context, prefix_dir, platform)
-        else:
-            template = self._get_template(platform, prefix_dir)
+            return {'build.sh': self._get_android_template(task_context, prefix_dir, platform, variant)}
+
+        build_files = {'build.sh': self._get_template(task_context, platform, prefix_dir, variant)}
+        if self._uses_pgo(task_context, platform):
+            for name in SQLCIPHER_PGO_TRAINING_FILES:
+                build_files[name] = read_file(get_file_path(name))
 
+        return build_files
+
+    def get_patches(self, task_context, platform):
         if platform == PLATFORM_WINDOWS:
-            self._apply_windows_patch(build_dir)
-            subprocess.check_call(['autoreconf'], cwd=build_dir)
+            return [('sqlcipher-win32', {})]
+        return []
+
+    def prepare_build_dir(self, task_context, platform, build_dir):
+        super().prepare_build_dir(task_context, platform, build_dir)
+
+        if platform == PLATFORM_WINDOWS:
+            get_timeline(task_context).run_command(['autoreconf'], 'autoreconf', cwd=build_dir)
 
         if platform_is_android(platform):
             #need to copy more recent config.sub/guess scripts (for android)
             libtool_dir = join(task_context['libtool-home'], 'build-aux')
             for ext in ['sub', 'guess']:
-                shutil.copy(join(libtool_dir, 'config.' + ext), build_dir)
+                copy_file(join(libtool_dir, 'config.' + ext), build_dir)
+
+
+class BuildSQLCipherVariantsTask(BuildSQLCipher):
+    """
+    Builds sqlcipher once for each profile in sqlcipher-variants, into
+    variants/<profile>/<platform>, so the profiles can be compared. The
+    variants aren't used by sqlite4java.
+    """
+
+    def __init__(self):
+        super().__init__('build-sqlcipher-variants', 'Build sqlcipher with each profile in sqlcipher-variants')
+
+    def get_variants(self, task_context):
+        return task_context['sqlcipher-variants']
+
+
+class PrepareSQLCipherAmalgamationTask(Task):
+    """
+    Generates the sqlcipher amalgamation (sqlite3.c and sqlite3.h) on the
+    build host, once for each set of feature flags used by the sqlcipher
+    build profile and its variants. The amalgamation doesn't depend on the
+    platform, so the sqlcipher builds only compile it.
+
+    Amalgamations are kept under amalgamation-cache-path, by a hash of the
+    source tarball and the feature flags, and are only generated when
+    missing.
+    """
+
+    input_context_keys = ['sqlcipher-profiles', 'sqlcipher-profile', 'sqlcipher-variants']
+
+    def __init__(self):
+        super().__init__('prepare-sqlcipher-amalgamation', 'Generate the sqlcipher amalgamation for all platforms')
+        self.add_dependency('download-sqlcipher')
+
+    def _get_feature_flag_sets(self, task_context):
+        "Returns the distinct feature flags of the main sqlcipher build profile and the variants."
+
+        flag_sets = []
+        for profile in [task_context['sqlcipher-profile']] + task_context['sqlcipher-variants']:
+            feature_flags = get_sqlcipher_feature_flags(task_context, profile)
+            if feature_flags not in flag_sets:
+                flag_sets.append(feature_flags)
+        return flag_sets
+
+    def _get_src_path(self, task_context):
+        return join(task_context['root-src-path'], 'sqlcipher.tar.gz')
+
+    def get_inputs(self, task_context):
+        return [self._get_src_path(task_context)]
+
+    def get_outputs(self, task_context):
+        outputs = []
+        for feature_flags in self._get_feature_flag_sets(task_context):
+            output_dir = get_amalgamation_dir(task_context, feature_flags)
+            outputs.extend(join(output_dir, name) for name in SQLCIPHER_AMALGAMATION_FILES)
+        return outputs
+
+    def _generate(self, task_context, feature_flags, output_dir):
+        source_cache = get_source_cache(task_context)
+        with get_scratch_space(task_context).build_dir('host', 'sqlcipher-amalgamation') as build_dir:
+            tree_path = source_cache.prepare(
+                self._get_src_path(task_context), DOWNLOAD_HASHES['sqlcipher'], [], build_dir)
+
+            #generated next to output_dir, then renamed, so an interrupted run
+            #never leaves a partial amalgamation behind
+            tmp_dir = output_dir + '.tmp'
+            remove_path(tmp_dir)
+
+            template = get_template('sqlcipher-amalgamation-build.sh')
+            script = template.substitute(**{'feature-flags': ' '.join(feature_flags), 'output-dir': tmp_dir})
+            write_to_file(join(build_dir, 'build.sh'), script)
+
+            timeline = get_timeline(task_context)
+            jobserver = task_context.get('jobserver')
+            if jobserver is None:
+                timeline.run_script('build.sh', 'build.sh', cwd=build_dir)
+            else:
+                with jobserver.token():
+                    timeline.run_script('build.sh', 'build.sh', cwd=build_dir)
+
+            source_cache.check_tree(tree_path)
+
+        remove_path(output_dir)
+        rename(tmp_dir, output_dir)
+
+    def run(self, task_context):
+        timeline = get_timeline(task_context)
+        for feature_flags in self._get_feature_flag_sets(task_context):
+            output_dir = get_amalgamation_dir(task_context, feature_flags)
+            description = ' '.join(feature_flags) or 'no feature flags'
+
+            if all(exists(join(output_dir, name)) for name in SQLCIPHER_AMALGAMATION_FILES):
+                print('sqlcipher amalgamation for %s is up to date (%s)' % (description, output_dir))
+                continue
 
-        self.run_build_script(build_dir, template)
+            log_path = join(task_context['root-build-path'], 'host',
+                            'sqlcipher-amalgamation-%s.log' % basename(output_dir))
+            print('Generating sqlcipher amalgamation for %s (log: %s)' % (description, log_path))
+            with capture_output(log_path, 'amalgamation'):
+                with timeline.span(basename(output_dir), 'platform', task=self.name, platform='host'):
+                    self._generate(task_context, feature_flags, output_dir)
+
+
+class BenchSQLCipherTask(Task):
+    """
+    Links files/sqlcipher-bench.c against the sqlcipher build for the build
+    host and each of its variants, and measures keyed-open latency (key
+    derivation), bulk insert rate, point lookup latency and full scan
+    throughput at every configured cipher page size and KDF iteration count.
+
+    Results are written to bench/sqlcipher-results.json and compared against
+    the baseline results (bench-sqlcipher-baseline), which are created from
+    the first run if missing.
+    """
+
+    input_context_keys = ['sqlcipher-variants', 'bench-sqlcipher-page-sizes', 'bench-sqlcipher-kdf-iters',
+                          'bench-sqlcipher-rows', 'bench-sqlcipher-repeat', 'bench-sqlcipher-baseline']
+
+    def __init__(self):
+        super().__init__('bench-sqlcipher', 'Benchmark the sqlcipher builds that run on this host')
+        self.add_dependency('build-sqlcipher')
+
+    def configure(self, context):
+        if context['sqlcipher-variants']:
+            self.add_dependency('build-sqlcipher-variants')
+
+    def _get_targets(self, task_context):
+        "Returns a list of (target name, platform, prefix dir) for the builds runnable on this host."
+
+        platform = get_host_platform()
+        if platform not in task_context['platforms']:
+            return []
+
+        return [(get_target_name(platform, variant), platform, get_prefix_dir(task_context, platform, variant))
+                for variant in [None] + task_context['sqlcipher-variants']]
+
+    def _get_results_path(self, task_context):
+        return join(task_context['root-bench-path'], 'sqlcipher-results.json')
+
+    def get_inputs(self, task_context):
+        inputs = [get_file_path('sqlcipher-bench.c')]
+        for _, platform, prefix_dir in self._get_targets(task_context):
+            inputs.append(join(prefix_dir, 'lib', get_static_lib_name_for_platform(platform, 'sqlcipher')))
+        return inputs
+
+    def get_outputs(self, task_context):
+        return [self._get_results_path(task_context)]
+
+    def _build_driver(self, task_context, platform, prefix_dir, output_dir):
+        "Links the benchmark driver against the given prefix's libsqlcipher. Returns its path."
+
+        deps_prefix_dir = get_prefix_dir(task_context, platform)
+        exe_path = join(output_dir, 'sqlcipher-bench')
+        argv = [
+            environ.get('CC', 'cc'), '-O2',
+            #sqlcipher installs its headers under include/sqlcipher
+            '-I' + join(prefix_dir, 'include', 'sqlcipher'),
+            '-I' + join(prefix_dir, 'include'),
+            '-o', exe_path,
+            get_file_path('sqlcipher-bench.c'),
+            join(prefix_dir, 'lib', get_static_lib_name_for_platform(platform, 'sqlcipher')),
+            join(deps_prefix_dir, 'lib', get_static_lib_name_for_platform(platform, 'crypto')),
+            '-lpthread', '-ldl', '-lm',
+        ]
+
+        get_timeline(task_context).run_command(argv, 'cc', args={'output': exe_path})
+        return exe_path
+
+    def _run_driver(self, task_context, exe_path, output_dir):
+        "Returns {'<page size>/<kdf iterations>': {metric: best value}}."
+
+        results = {}
+        db_path = join(output_dir, 'bench.db')
+        for page_size in task_context['bench-sqlcipher-page-sizes']:
+            for kdf_iter in task_context['bench-sqlcipher-kdf-iters']:
+                argv = [exe_path, db_path, str(page_size), str(kdf_iter), str(task_context['bench-sqlcipher-rows'])]
+                runs = [json.loads(subprocess.check_output(argv, universal_newlines=True))
+                        for _ in range(task_context['bench-sqlcipher-repeat'])]
+
+                best = {}
+                for metric, higher_is_better in SQLCIPHER_BENCH_METRICS:
+                    values = [run[metric] for run in runs]
+                    best[metric] = max(values) if higher_is_better else min(values)
+                results['%d/%d' % (page_size, kdf_iter)] = best
+
+        return results
+
+    def _read_baseline(self, task_context):
+        try:
+            with open(task_context['bench-sqlcipher-baseline'], 'r', encoding='utf-8') as fd:
+                return json.load(fd)['results']
+        except FileNotFoundError:
+            return None
+
+    def _print_results(self, results, comparison):
+        print('%-28s %-12s %12s %12s %12s %12s' % ('Build', 'Page/KDF', 'Open ms', 'Inserts/s', 'Lookup us',
+                                                  'Scan MB/s'))
+        for target, configs in sorted(results.items()):
+            for config, metrics in sorted(configs.items()):
+                changes = comparison.get(target, {}).get(config, {})
+                columns = []
+                for metric, _ in SQLCIPHER_BENCH_METRICS:
+                    change = changes.get(metric)
+                    columns.append('%.1f%s' % (metrics[metric], '' if change is None else ' (%+.0f%%)' % change))
+                print('%-28s %-12s %12s %12s %12s %12s' % tuple([target, config] + columns))
+
+    def run(self, task_context):
+        targets = self._get_targets(task_context)
+        if not targets:
+            print('No sqlcipher builds can run on this host (%s); nothing to benchmark' % get_host_platform())
+            return
+
+        timeline = get_timeline(task_context)
+        results = {}
+        for target, platform, prefix_dir in targets:
+            output_dir = join(task_context['root-build-path'], platform, 'bench-sqlcipher', target.replace('/', '-'))
+            make_dirs(output_dir)
+            print('Benchmarking sqlcipher for %s' % target)
+            with timeline.span(target, 'platform', task=self.name, platform=platform):
+                exe_path = self._build_driver(task_context, platform, prefix_dir, output_dir)
+                with timeline.span('bench', 'phase'):
+                    results[target] = self._run_driver(task_context, exe_path, output_dir)
+
+        baseline_path = task_context['bench-sqlcipher-baseline']
+        baseline = self._read_baseline(task_context)
+        comparison = compare_bench_results(results, baseline) if baseline is not None else {}
+
+        report = {'host': list(uname()), 'results': results, 'baseline': baseline_path, 'comparison': comparison}
+        make_dirs(task_context['root-bench-path'])
+        write_to_file(self._get_results_path(task_context), json.dumps(report, indent=1, sort_keys=True))
+
+        if baseline is None:
+            print('No baseline found; saving these results as the baseline (%s)' % baseline_path)
+            make_dirs(dirname(baseline_path))
+            write_to_file(baseline_path, json.dumps(report, indent=1, sort_keys=True))
+        else:
+            print('Changes are relative to the baseline in %s (positive is faster)' % baseline_path)
+
+        self._print_results(results, comparison)
+
+        main_target = targets[0][0]
+        if len(targets) > 1:
+            print('Variants relative to %s (positive is faster):' % main_target)
+            variants = {target: results[target] for target, _, _ in targets[1:]}
+            self._print_results(variants, compare_bench_results(
+                variants, {target: results[main_target] for target in variants}))
+
+        print('Wrote %s' % self._get_results_path(task_context))
 
 
 class BuildSQLite4JavaTask(Task):
@@ -284,6 +1122,10 @@ class BuildSQLite4JavaTask(Task):
 
     The desktop version uses build-<os>.properties files for values of cc, etc.
 
+    Every platform (desktop platform, android ABI or ios) is built on its own,
+    in build/<platform>/sqlite4java with the patch applied for just that
+    platform, so that with platform-jobs > 1 they can be built concurrently.
+
     Currently we only support a single architecture for each platform.
     """
 
@@ -293,19 +1135,22 @@ class BuildSQLite4JavaTask(Task):
         self.add_dependency('build-sqlcipher')
         self.add_dependency('download-sqlite4java')
 
-    def _apply_patch(self, android_abis, root_prefix_dir, build_dir, desktop_platforms):
-        print('Applying patch')
-
+    def _get_patch_context(self, task_context, android_abis, root_prefix_dir, desktop_platforms):
         platforms = ', '.join('"%s"' % p for p in desktop_platforms)
+        #android abis built together share the same Android.mk
+        lto = any(uses_lto(task_context, 'android-' + abi) for abi in android_abis)
+        api = max([get_android_api('android-' + abi) for abi in android_abis] or [get_android_api(None)])
 
-        patch_context = {
+        return {
             'root_prefix': root_prefix_dir,
             'abi_list': ' '.join(android_abis),
-            'platforms': platforms
+            'api': str(api),
+            'platforms': platforms,
+            'lto_flags': '-flto' if lto else '',
+            'size_cflags': get_size_cflags(task_context, 'android') if android_abis else '',
+            'size_ldflags': get_size_ldflags(task_context, 'android') if android_abis else '',
         }
 
-        apply_patch(build_dir, 'sqlite4java', patch_context)
-
     def _copy_build_templates(self, build_dir, task_context, desktop_platforms):
         for platform in desktop_platforms:
             prefix_dir = join(task_context['root-prefix-path'], platform)
@@ -315,117 +1160,643 @@ class BuildSQLite4JavaTask(Task):
             context = {
                 'prefix': prefix_dir,
                 'jdk-home': task_context['%s-jdk-home' % get_os_from_platform(platform)],
+                'lto-flags': '-flto' if uses_lto(task_context, platform) else '',
+                'size-cflags': get_size_cflags(task_context, platform),
+                'size-ldflags': get_size_ldflags(task_context, platform),
             }
 
             path = join(build_dir, 'ant', 'build-%s.properties' % platform)
             write_to_file(path, template.substitute(**context))
 
-    def run(self, task_context):
-        desktop_platforms = []
-        android_abis = []
-        build_for_ios = False
+    def _get_platform_inputs(self, task_context, platform):
+        inputs = [
+            join(task_context['root-src-path'], 'sqlite4java.tar.gz'),
+            get_patch_path('sqlite4java'),
+        ]
 
-        for platform in task_context['platforms']:
-            if platform_is_android(platform):
-                #we just want the abi arch, so strip off the android- prefix
-                abi = platform.split('-', 1)[1]
+        lib_prefix = join(task_context['root-prefix-path'], platform, 'lib')
+        inputs.append(join(lib_prefix, 'libsqlcipher.a'))
+        inputs.append(join(lib_prefix, 'libcrypto.a'))
 
-                so_path = join(task_context['root-android-output-path'], abi, 'libsqlite4java-android.so')
-                if not exists(so_path):
-                    android_abis.append(abi)
-                else:
-                    print('%s already present, not building' % abi)
+        if platform == PLATFORM_IOS:
+            inputs.append(get_file_path('jni.h'))
+        elif not platform_is_android(platform):
+            inputs.append(get_template_path('sqlite4java-build-%s.properties' % platform))
 
-            elif platform == PLATFORM_IOS:
-                lib_name = 'libsqlite4java.a'
+        return inputs
 
-                a_path = join(task_context['root-ios-output-path'], lib_name)
-                build_for_ios = not exists(a_path)
-                if not build_for_ios:
-                    print('%s already present, not building' % platform)
+    def _get_platform_input_values(self, task_context, platform):
+        keys = ['root-prefix-path', 'android-ndk-home', 'gant-home', 'groovy-home', 'sqlcipher-lto', 'size-optimize']
+        if not platform_is_android(platform) and platform != PLATFORM_IOS:
+            keys.append('%s-jdk-home' % get_os_from_platform(platform))
 
-            else:
-                lib_name = get_dynamic_lib_name_for_platform(platform, 'sqlite4java')
+        return [task_context[key] for key in keys]
 
-                so_path = join(task_context['root-output-path'], lib_name)
-                if not exists(so_path):
-                    desktop_platforms.append(platform)
-                else:
-                    print('%s already present, not building' % platform)
+    def _get_platform_outputs(self, task_context, platform):
+        outputs = [get_sqlite4java_lib_path(task_context, platform)]
+        if platform == PLATFORM_IOS:
+            outputs.append(join(task_context['root-ios-output-path'], 'libsqlcipher.a'))
+            outputs.append(join(task_context['root-ios-output-path'], 'libcrypto.a'))
+        else:
+            outputs.append(get_unstripped_lib_path(task_context, platform))
+        return outputs
 
-        src_path = join(task_context['root-src-path'], 'sqlite4java.tar.gz')
-        #we can build for every platform using the same src setup
-        build_dir = join(task_context['root-build-path'], 'sqlite4java')
-        unpack_source(src_path, build_dir)
+    def get_inputs(self, task_context):
+        inputs = []
+        for platform in task_context['platforms']:
+            inputs.extend(path for path in self._get_platform_inputs(task_context, platform) if path not in inputs)
+        return inputs
 
-        gant_targets = []
+    def get_input_values(self, task_context):
+        return [task_context['platforms']] + [self._get_platform_input_values(task_context, platform)
+                                              for platform in task_context['platforms']]
 
-        if len(desktop_platforms) > 0:
-            gant_targets.append('sqlcipher-desktop')
-            self._copy_build_templates(build_dir, task_context, desktop_platforms)
+    def get_outputs(self, task_context):
+        outputs = []
+        for platform in task_context['platforms']:
+            outputs.extend(self._get_platform_outputs(task_context, platform))
+            outputs.append(self._get_stamp_path(task_context, platform))
+        return outputs
+
+    def _get_stamp_path(self, task_context, platform):
+        return join(task_context['root-build-path'], platform, '.build-sqlite4java.key')
+
+    def _read_stamp(self, task_context, platform):
+        try:
+            with open(self._get_stamp_path(task_context, platform), 'r', encoding='utf-8') as fd:
+                return fd.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def _get_file_checksum(self, task_context, path):
+        state = task_context.get('state')
+        if state is not None:
+            return state.get_file_checksum(path)
+        return get_sha256_checksum(path) if exists(path) else None
+
+    def get_platform_key(self, task_context, platform):
+        """
+        Returns a hash of everything that determines the platform's build:
+        the source, the patch, the platform's sqlcipher and openssl libs, its
+        build files and toolchain paths.
+        """
+
+        inputs = [
+            self.name,
+            platform,
+            [(path, self._get_file_checksum(task_context, path))
+             for path in self._get_platform_inputs(task_context, platform)],
+            self._get_platform_input_values(task_context, platform),
+        ]
+        return hashlib.sha256(json.dumps(inputs).encode('utf-8')).hexdigest()
 
-        if len(android_abis) > 0:
-            gant_targets.append('sqlcipher-android')
+    def _is_platform_up_to_date(self, task_context, platform):
+        return (self._read_stamp(task_context, platform) == self.get_platform_key(task_context, platform) and
+                all(exists(path) for path in self._get_platform_outputs(task_context, platform)))
 
-        if build_for_ios:
-            gant_targets.append('sqlcipher-ios')
+    def _move_output(self, path, output_dir):
+        print('Moving %s -> %s' % (path, output_dir))
+        remove_path(join(output_dir, basename(path)))
+        shutil.move(path, output_dir)
 
-        if len(gant_targets) <= 0:
-            print('Nothing to build')
-            return
+    def _get_gant_target(self, platform):
+        if platform_is_android(platform):
+            return 'sqlcipher-android'
+        elif platform == PLATFORM_IOS:
+            return 'sqlcipher-ios'
+        else:
+            return 'sqlcipher-desktop'
 
-        if build_for_ios:
+    def _get_log_path(self, task_context, platform):
+        return join(task_context['root-build-path'], platform, 'sqlite4java-build.log')
+
+    def _prepare_build_dir(self, task_context, src_path, platform, build_dir):
+        "Clones the source into build_dir, patched for the given platform only. Returns the pristine tree's path."
+
+        if platform_is_android(platform):
+            patch_context = self._get_patch_context(task_context, [platform.split('-', 1)[1]],
+                                                    task_context['root-prefix-path'], [])
+        elif platform == PLATFORM_IOS:
+            patch_context = self._get_patch_context(task_context, [], task_context['root-prefix-path'], [])
+        else:
+            patch_context = self._get_patch_context(task_context, [], task_context['root-prefix-path'], [platform])
+
+        with get_timeline(task_context).span('prepare-source', 'phase'):
+            tree_path = get_source_cache(task_context).prepare(
+                src_path, DOWNLOAD_HASHES['sqlite4java'], [('sqlite4java', patch_context)], build_dir)
+
+        if platform == PLATFORM_IOS:
             print('Copying jni.h file for IOS build')
             include_dir = join(build_dir, 'include')
             make_dirs(include_dir)
             jni_h_path = get_file_path('jni.h')
-            shutil.copy(jni_h_path, include_dir)
+            copy_file(jni_h_path, include_dir)
+        elif not platform_is_android(platform):
+            self._copy_build_templates(build_dir, task_context, [platform])
 
-        self._apply_patch(
-            android_abis,
-            task_context['root-prefix-path'],
-            build_dir,
-            desktop_platforms)
+        return tree_path
 
-        argv = [
-            join(task_context['gant-home'], 'bin/gant'),
-            '-Dndk.home=' + task_context['android-ndk-home'],
-        ]
+    def _keep_unstripped(self, task_context, platform, path):
+        "Copies the unstripped library to root-symbols-path, for debugging and report-sizes."
 
-        argv.extend(gant_targets)
+        unstripped_path = get_unstripped_lib_path(task_context, platform)
+        print('Keeping unstripped %s -> %s' % (path, unstripped_path))
+        make_dirs(dirname(unstripped_path))
+        shutil.copy(path, unstripped_path)
 
-        env = {
-            'GROOVY_HOME': task_context['groovy-home'],
-            'PATH': environ['PATH']
-        }
+    def _strip_output(self, task_context, platform):
+        path = get_sqlite4java_lib_path(task_context, platform)
+        size = getsize(path)
+        argv = SQLITE4JAVA_STRIP_COMMANDS[platform] + [path]
+        get_timeline(task_context).run_command(argv, 'strip', args={'output': path})
+        print('Stripped %s: %d -> %d bytes' % (path, size, getsize(path)))
 
-        subprocess.check_call(argv, cwd=join(build_dir, 'ant'), env=env)
-
-        base_lib_path = join(build_dir, 'build', 'android', 'project', 'libs')
-        for abi in android_abis:
-            abi_dir = join(base_lib_path, abi)
-            output_path = task_context['root-android-output-path']
-            print('Moving %s -> %s' % (abi_dir, output_path))
-            shutil.move(abi_dir, output_path)
-
-        for platform in desktop_platforms:
-            #output is in BUILD_DIR/build/lib.release.<platform>/<lib-name>
-            lib_name = get_dynamic_lib_name_for_platform(platform, 'sqlite4java')
-            so_path = join(build_dir, 'build', 'lib.release.%s' % platform, lib_name)
-            output_path = task_context['root-output-path']
-            print('Moving %s -> %s' % (so_path, output_path))
-            shutil.move(so_path, output_path)
-
-        if build_for_ios:
+    def _move_outputs(self, task_context, platform, build_dir):
+        if platform_is_android(platform):
+            abi = platform.split('-', 1)[1]
+            project_dir = join(build_dir, 'build', 'android', 'project')
+            #ndk-build installs a stripped copy of obj/local/<abi>/<lib> into libs/<abi>
+            self._keep_unstripped(task_context, platform,
+                                  join(project_dir, 'obj', 'local', abi, 'libsqlite4java-android.so'))
+            self._move_output(join(project_dir, 'libs', abi), task_context['root-android-output-path'])
+            verify_elf_machine(get_sqlite4java_lib_path(task_context, platform), platform)
+        elif platform == PLATFORM_IOS:
             a_path = join(build_dir, 'build', 'lib.ios', 'libsqlite4java.a')
             output_path = task_context['root-ios-output-path']
-            print('Moving %s -> %s' % (a_path, output_path))
-            shutil.move(a_path, output_path)
+            self._move_output(a_path, output_path)
             #XXX this is hacky; move into separate final copy task or something
             lib_prefix = join(task_context['root-prefix-path'], 'ios', 'lib')
             print('Moving secondary libs to output folder')
             shutil.copy(join(lib_prefix, 'libsqlcipher.a'), output_path)
             shutil.copy(join(lib_prefix, 'libcrypto.a'), output_path)
+        else:
+            #output is in BUILD_DIR/build/lib.release.<platform>/<lib-name>
+            lib_name = get_dynamic_lib_name_for_platform(platform, 'sqlite4java')
+            so_path = join(build_dir, 'build', 'lib.release.%s' % platform, lib_name)
+            self._keep_unstripped(task_context, platform, so_path)
+            self._move_output(so_path, task_context['root-output-path'])
+            if task_context['size-optimize']:
+                self._strip_output(task_context, platform)
+            verify_elf_machine(get_sqlite4java_lib_path(task_context, platform), platform)
+
+    def _build_platform(self, task_context, src_path, platform, print_tail=True):
+        """
+        Builds sqlite4java for a single platform, logging its output to the
+        platform's log, and moves it to the output dir. Returns the build's
+        duration.
+        """
+
+        start = time.time()
+        timeline = get_timeline(task_context)
+        key = self.get_platform_key(task_context, platform)
+        with capture_output(self._get_log_path(task_context, platform), platform, print_tail), \
+                timeline.span(platform, 'platform', task=self.name, platform=platform):
+            print('Building sqlite4java for ' + platform)
+            with get_scratch_space(task_context).build_dir(platform, 'sqlite4java') as build_dir:
+                tree_path = self._prepare_build_dir(task_context, src_path, platform, build_dir)
+
+                gant_target = self._get_gant_target(platform)
+                argv = [
+                    join(task_context['gant-home'], 'bin/gant'),
+                    '-Dndk.home=' + task_context['android-ndk-home'],
+                    gant_target,
+                ]
+
+                env = {
+                    'GROOVY_HOME': task_context['groovy-home'],
+                    'PATH': environ['PATH']
+                }
+
+                timeline.run_command(argv, 'gant', args={'targets': [gant_target]}, cwd=join(build_dir, 'ant'),
+                                     env=env)
+                get_source_cache(task_context).check_tree(tree_path)
+
+                self._move_outputs(task_context, platform, build_dir)
+
+            write_to_file(self._get_stamp_path(task_context, platform), key)
+
+        return time.time() - start
+
+    def _build_platform_in_worker(self, task_context, src_path, platform):
+        "Runs _build_platform in a worker process. Returns (duration, timing events)."
+
+        #the tail of the log is printed by the parent, below its status line
+        duration = self._build_platform(task_context, src_path, platform, print_tail=False)
+        return duration, get_timeline(task_context).events
+
+    def _run_parallel(self, task_context, src_path, platforms):
+        """
+        Builds each platform in a separate worker process, logging to a
+        per-platform file. Returns {platform: duration}.
+        """
+
+        jobs = min(task_context['platform-jobs'], len(platforms))
+        state = task_context.get('state')
+        #start the platforms that took longest last time first
+        durations = {p: state.get_duration(self.name, p) if state is not None else None for p in platforms}
+        ordered = sorted(platforms, key=lambda p: -(durations[p] or 0.0))
+
+        futures = {}
+        with create_platform_executor(jobs) as executor:
+            for platform in ordered:
+                log_path = self._get_log_path(task_context, platform)
+                print('Building sqlite4java for %s (log: %s)' % (platform, log_path))
+                track_log(log_path, platform)
+                futures[executor.submit(self._build_platform_in_worker, task_context, src_path, platform)] = platform
+
+            failed = []
+            results = {}
+            for future in as_completed(futures):
+                platform = futures[future]
+                log_path = self._get_log_path(task_context, platform)
+                untrack_log(log_path)
+                exc = future.exception()
+                if exc is None:
+                    print('sqlite4java for %s: OK' % platform)
+                    results[platform], events = future.result()
+                    get_timeline(task_context).add_events(events)
+                else:
+                    print('sqlite4java for %s: FAILED (%s)' % (platform, exc))
+                    print_log_tail(log_path)
+                    failed.append(platform)
+
+        if failed:
+            raise RuntimeError('sqlite4java build failed for: %s' % ', '.join(sorted(failed)))
+
+        return results
+
+    def get_plan(self, task_context, state, dependencies_stale):
+        items = []
+        durations = {}
+        for platform in task_context['platforms']:
+            #the dependencies' rebuilt libs will change the platform's key
+            if not dependencies_stale and self._is_platform_up_to_date(task_context, platform):
+                items.append((platform, 'up-to-date', 0.0))
+            else:
+                durations[platform] = state.get_duration(self.name, platform) if state is not None else None
+                items.append((platform, 'build', durations[platform]))
+
+        if None in durations.values():
+            return None, items
+
+        return estimate_makespan(durations, {}, task_context['platform-jobs']), items
+
+    def run(self, task_context):
+        platforms = []
+        for platform in task_context['platforms']:
+            if self._is_platform_up_to_date(task_context, platform):
+                print('sqlite4java for %s is up to date, skipping build' % platform)
+            else:
+                platforms.append(platform)
+
+        src_path = join(task_context['root-src-path'], 'sqlite4java.tar.gz')
+        if task_context['platform-jobs'] > 1 and len(platforms) > 1:
+            durations = self._run_parallel(task_context, src_path, platforms)
+        else:
+            durations = {}
+            for platform in platforms:
+                print('Building sqlite4java for %s (log: %s)' % (platform, self._get_log_path(task_context, platform)))
+                durations[platform] = self._build_platform(task_context, src_path, platform)
+                print('sqlite4java for %s: OK' % platform)
+
+        state = task_context.get('state')
+        if state is not None:
+            for platform, duration in durations.items():
+                state.record_duration(self.name, duration, platform)
+
+
+class ReportSizesTask(Task):
+    """
+    Reports the size of each shipped sqlite4java library and, for the ELF
+    (linux and android) ones, of the functions and data objects in it (read
+    from the unstripped copies under root-symbols-path), compared with the
+    previous build's report.
+    """
+
+    def __init__(self):
+        super().__init__('report-sizes', 'Report the sizes of the sqlite4java libraries and their symbols')
+
+        self.add_dependency('build-sqlite4java')
+
+    def _get_report_path(self, task_context):
+        return join(task_context['root-size-path'], 'size-report.json')
+
+    def _get_previous_report_path(self, task_context):
+        return join(task_context['root-size-path'], 'size-report-previous.json')
+
+    def get_inputs(self, task_context):
+        inputs = []
+        for platform in task_context['platforms']:
+            inputs.append(get_sqlite4java_lib_path(task_context, platform))
+            unstripped_path = get_unstripped_lib_path(task_context, platform)
+            if unstripped_path is not None:
+                inputs.append(unstripped_path)
+        return inputs
+
+    def get_outputs(self, task_context):
+        return [self._get_report_path(task_context)]
+
+    def _get_library_sizes(self, task_context, platform):
+        path = get_sqlite4java_lib_path(task_context, platform)
+        unstripped_path = get_unstripped_lib_path(task_context, platform)
+        if unstripped_path is not None and not exists(unstripped_path):
+            unstripped_path = None
+
+        symbols = None
+        if get_elf_machine_for_platform(platform) is not None:
+            try:
+                symbols = get_elf_symbol_sizes(unstripped_path or path)
+            except ArchiveError as e:
+                raise RuntimeError(str(e))
+
+        return {
+            'path': path,
+            'size': getsize(path),
+            'unstripped-size': getsize(unstripped_path) if unstripped_path is not None else None,
+            'symbols': symbols,
+        }
+
+    def _read_report(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as fd:
+                return json.load(fd)['libraries']
+        except FileNotFoundError:
+            return None
+
+    def _print_library(self, platform, library, changes):
+        size_change = changes.get('size')
+        print('%-24s %12d %14s %14s' % (
+            platform, library['size'],
+            '' if size_change is None else '%+d' % size_change,
+            '' if library['unstripped-size'] is None else library['unstripped-size']))
+
+    def _print_symbols(self, platform, library, changes):
+        symbol_changes = changes.get('symbols')
+        if symbol_changes:
+            print('  Largest symbol changes in %s:' % platform)
+            top = sorted(symbol_changes.items(), key=lambda item: (-abs(item[1]), item[0]))
+            for name, change in top[:SIZE_REPORT_SYMBOLS]:
+                print('    %+10d  %s' % (change, name))
+        elif library['symbols'] and changes.get('size') is None:
+            print('  Largest symbols in %s:' % platform)
+            top = sorted(library['symbols'].items(), key=lambda item: (-item[1], item[0]))
+            for name, size in top[:SIZE_REPORT_SYMBOLS]:
+                print('    %10d  %s' % (size, name))
+
+    def run(self, task_context):
+        libraries = {}
+        for platform in task_context['platforms']:
+            libraries[platform] = self._get_library_sizes(task_context, platform)
+
+        report_path = self._get_report_path(task_context)
+        previous_path = self._get_previous_report_path(task_context)
+        make_dirs(task_context['root-size-path'])
+        if exists(report_path):
+            rename(report_path, previous_path)
+
+        previous = self._read_report(previous_path)
+        comparison = compare_size_reports(libraries, previous) if previous is not None else {}
+
+        report = {'libraries': libraries, 'previous': previous_path, 'comparison': comparison}
+        write_to_file(report_path, json.dumps(report, indent=1, sort_keys=True))
+
+        if previous is None:
+            print('No previous report found; sizes will be compared from the next build on')
+        else:
+            print('Changes are relative to the previous build (%s)' % previous_path)
+
+        print('%-24s %12s %14s %14s' % ('Library', 'Bytes', 'Change', 'Unstripped'))
+        for platform, library in sorted(libraries.items()):
+            self._print_library(platform, library, comparison.get(platform, {}))
+        for platform, library in sorted(libraries.items()):
+            self._print_symbols(platform, library, comparison.get(platform, {}))
+
+        print('Wrote %s' % report_path)
+
+
+def get_openssl_arch(platform):
+    "Returns the CPU architecture of the given platform's libcrypto, or None if it isn't checked."
+
+    if platform == PLATFORM_IOS:
+        #build-libssl.sh picks its own (no-asm) targets
+        return None
+    if platform_is_android(platform):
+        return {'x86': 'x86', 'armeabi-v7a': 'armv7', 'x86_64': 'x86_64', 'arm64-v8a': 'arm64'}[platform.split('-', 1)[1]]
+    return 'x86_64'
+
+
+def get_prefix_dir(task_context, platform, variant=None):
+    "Returns the prefix a platform's build (or a variant of it) is installed into."
+
+    if variant is None:
+        return join(task_context['root-prefix-path'], platform)
+    return join(task_context['root-variants-path'], variant, platform)
+
+
+def get_target_name(platform, variant=None):
+    "Returns the name of a platform's build (or a variant of it), eg: in logs and task-state.json."
+    return platform if variant is None else '%s/%s' % (variant, platform)
+
+
+def uses_lto(task_context, platform):
+    "Whether sqlcipher and sqlite4java are built with LTO for the given platform (sqlcipher-lto)."
+
+    #only the gcc cross toolchains; linux uses PGO and the clang targets embed bitcode
+    return task_context['sqlcipher-lto'] and (platform == PLATFORM_WINDOWS or platform_is_android(platform))
+
+
+def get_size_cflags(task_context, platform):
+    "Returns the compiler flags for the openssl, sqlcipher and sqlite4java builds with size-optimize."
+
+    #the iOS static libs are dead-stripped by the app's link
+    if not task_context['size-optimize'] or platform == PLATFORM_IOS:
+        return ''
+    #symbol visibility doesn't apply to PE; exports are chosen with dllexport
+    if platform == PLATFORM_WINDOWS:
+        return SIZE_CFLAGS
+    return '%s %s' % (SIZE_CFLAGS, SIZE_VISIBILITY_CFLAGS)
+
+
+def get_size_ldflags(task_context, platform):
+    "Returns the linker flags for the sqlite4java shared library with size-optimize."
+
+    if not task_context['size-optimize'] or platform == PLATFORM_IOS:
+        return ''
+    return SIZE_LDFLAGS['android' if platform_is_android(platform) else platform]
+
+
+def get_sqlite4java_lib_path(task_context, platform):
+    "Returns the path of the sqlite4java library shipped for the given platform."
+
+    if platform_is_android(platform):
+        #we just want the abi arch, so strip off the android- prefix
+        abi = platform.split('-', 1)[1]
+        return join(task_context['root-android-output-path'], abi, 'libsqlite4java-android.so')
+    elif platform == PLATFORM_IOS:
+        return join(task_context['root-ios-output-path'], 'libsqlite4java.a')
+    else:
+        lib_name = get_dynamic_lib_name_for_platform(platform, 'sqlite4java')
+        return join(task_context['root-output-path'], lib_name)
+
+
+def get_unstripped_lib_path(task_context, platform):
+    "Returns the path build-sqlite4java keeps the unstripped library at, or None for iOS (never stripped)."
+
+    if platform == PLATFORM_IOS:
+        return None
+    return join(task_context['root-symbols-path'], platform, basename(get_sqlite4java_lib_path(task_context, platform)))
+
+
+def get_sqlcipher_feature_flags(task_context, profile):
+    """
+    Returns the SQLITE_OMIT/SQLITE_ENABLE defines of the given sqlcipher build
+    profile (with the ones sqlite4java requires), sorted. These are the only
+    flags the generated amalgamation depends on.
+    """
+
+    cflags = (SQLCIPHER_REQUIRED_CFLAGS + ' ' + task_context['sqlcipher-profiles'][profile]).split()
+    return sorted(set(f for f in cflags if f.startswith(('-DSQLITE_OMIT_', '-DSQLITE_ENABLE_'))))
+
+
+def get_amalgamation_dir(task_context, feature_flags):
+    "Returns the directory the amalgamation generated with the given feature flags is kept in."
+
+    h = hashlib.sha256()
+    h.update(DOWNLOAD_HASHES['sqlcipher'].encode('utf-8'))
+    for flag in feature_flags:
+        h.update(b'\0' + flag.encode('utf-8'))
+    return join(task_context['amalgamation-cache-path'], h.hexdigest()[:16])
+
+
+@functools.lru_cache(maxsize=None)
+def get_compiler_identity(command):
+    """
+    Returns the resolved path and --version output of the given compiler
+    command (a tuple), or None if it can't be run.
+    """
+
+    try:
+        version = subprocess.check_output(list(command) + ['--version'], stderr=subprocess.STDOUT,
+                                          universal_newlines=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return [shutil.which(command[0]), version]
+
+
+def verify_elf_machine(path, platform):
+    """
+    Raises RuntimeError unless the given (static or shared) library only
+    contains code for the platform's architecture. Platforms whose binaries
+    aren't ELF aren't checked.
+    """
+
+    expected = get_elf_machine_for_platform(platform)
+    if expected is None:
+        return
+
+    try:
+        machines = get_elf_machines(path)
+    except ArchiveError as e:
+        raise RuntimeError(str(e))
+
+    if machines != set([expected]):
+        raise RuntimeError('%s was built for %s, expected %s for %s' % (
+            path, ', '.join(sorted(machines)) or 'no known architecture', expected, platform))
+    print('Verified %s is %s' % (path, expected))
+
+
+def get_minimal_install(task_context):
+    """
+    Returns whether openssl and sqlcipher only build and install what
+    sqlite4java and bench-sqlcipher use (build-artifacts), as yes/no for the
+    build script templates.
+    """
+    return 'yes' if task_context['build-artifacts'] == 'minimal' else 'no'
+
+
+def compare_bench_results(results, baseline):
+    """
+    Given bench-sqlcipher results and baseline results of the same form,
+    returns {target: {config: {metric: % change}}}, where positive changes
+    are improvements.
+    """
+
+    comparison = {}
+    for target, configs in results.items():
+        for config, metrics in configs.items():
+            base = baseline.get(target, {}).get(config)
+            if base is None:
+                continue
+
+            changes = {}
+            for metric, higher_is_better in SQLCIPHER_BENCH_METRICS:
+                if not base.get(metric) or not metrics[metric]:
+                    continue
+                if higher_is_better:
+                    changes[metric] = 100.0 * (metrics[metric] / base[metric] - 1)
+                else:
+                    changes[metric] = 100.0 * (base[metric] / metrics[metric] - 1)
+            comparison.setdefault(target, {})[config] = changes
+
+    return comparison
+
+
+def compare_size_reports(libraries, previous):
+    """
+    Given the libraries of a report-sizes report and those of the previous
+    report, returns {platform: {'size': change in bytes, 'symbols': {name:
+    change in bytes}}}. Added and removed symbols count from/to 0; unchanged
+    symbols are left out.
+    """
+
+    comparison = {}
+    for platform, library in libraries.items():
+        base = previous.get(platform)
+        if base is None:
+            continue
+
+        changes = {'size': library['size'] - base['size']}
+        if library['symbols'] is not None and base.get('symbols') is not None:
+            symbol_changes = {}
+            for name in set(library['symbols']) | set(base['symbols']):
+                change = library['symbols'].get(name, 0) - base['symbols'].get(name, 0)
+                if change:
+                    symbol_changes[name] = change
+            changes['symbols'] = symbol_changes
+        comparison[platform] = changes
+
+    return comparison
+
+
+def get_source_cache(task_context):
+    "Returns the context's SourceCache, created on first use so its reflink support check is shared."
+
+    with _source_cache_lock:
+        source_cache = task_context.get('source-cache')
+        if source_cache is None:
+            source_cache = SourceCache(task_context['source-cache-path'], task_context['source-clone-mode'],
+                                       get_timeline(task_context))
+            task_context['source-cache'] = source_cache
+        return source_cache
+
+
+def create_platform_executor(jobs):
+    """
+    Returns a ProcessPoolExecutor for building platforms concurrently.
+
+    Workers are started by a forkserver rather than forked from this
+    process, whose other threads (concurrent tasks, the log multiplexer and
+    the status line) may hold locks a forked child would deadlock on.
+    Everything a worker needs is pickled, including the jobserver, which
+    workers reopen by path.
+    """
+
+    return ProcessPoolExecutor(max_workers=jobs, mp_context=get_context('forkserver'))
+
+
+def get_scratch_space(task_context):
+    return ScratchSpace(task_context['scratch-path'], task_context['root-build-path'],
+                        task_context['scratch-space-per-build'] * 1024 * 1024, get_timeline(task_context))
 
 
 def create_download_task(key):
@@ -434,7 +1805,10 @@ def create_download_task(key):
 
 
 def add_download_tasks(tasks):
-    "Adds all required download tasks to the given Tasks."
+    "Adds all required download tasks, plus download-all, to the given Tasks."
+
+    download_tasks = [create_download_task(key) for key in DOWNLOAD_URLS.keys()]
+    for task in download_tasks:
+        tasks.add(task)
 
-    for key in DOWNLOAD_URLS.keys():
-        tasks.add(create_download_task(key))
+    tasks.add(DownloadAllTask(download_tasks))
@@ -0,0 +1,101 @@
+import tarfile
+from os import listdir, lstat, unlink, utime, replace, getpid, walk
+from os.path import join, relpath, exists
+
+from utils import make_dirs
+
+
+def snapshot_tree(path):
+    "Returns a dict of relative path -> (size, mtime) for every non-directory under path."
+
+    r = {}
+    for dirpath, dirnames, filenames in walk(path):
+        for filename in filenames:
+            full_path = join(dirpath, filename)
+            st = lstat(full_path)
+            r[relpath(full_path, path)] = (st.st_size, st.st_mtime_ns)
+
+    return r
+
+
+def get_changed_files(before, after):
+    "Given two snapshot_tree results, returns the sorted paths that were added or modified."
+
+    return sorted(p for p, info in after.items() if before.get(p) != info)
+
+
+class BuildCache(object):
+    """
+    Local content-addressed store of installed build outputs.
+
+    Each entry is a tar of the files a build added to its prefix, named after
+    the build's cache key. Entries are touched on every hit, and the least
+    recently used ones are evicted once the cache grows past max_size bytes.
+    """
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+
+    def _get_entry_path(self, key):
+        return join(self.path, key + '.tar')
+
+    def contains(self, key):
+        return exists(self._get_entry_path(key))
+
+    def restore(self, key, prefix_dir):
+        "Extracts the entry for the given key into prefix_dir. Returns False on a miss."
+
+        entry_path = self._get_entry_path(key)
+        try:
+            utime(entry_path)
+            with tarfile.open(entry_path) as tar:
+                #rejects members (or links) that would land outside prefix_dir
+                tar.extractall(prefix_dir, filter='data')
+        except FileNotFoundError:
+            return False
+
+        return True
+
+    def store(self, key, prefix_dir, paths):
+        "Stores the given paths (relative to prefix_dir) under key, then evicts old entries."
+
+        make_dirs(self.path)
+        entry_path = self._get_entry_path(key)
+        tmp_path = '%s.%d.tmp' % (entry_path, getpid())
+
+        with tarfile.open(tmp_path, 'w') as tar:
+            for path in paths:
+                tar.add(join(prefix_dir, path), path, recursive=False)
+
+        replace(tmp_path, entry_path)
+
+        self.evict()
+
+    def evict(self):
+        "Removes least recently used entries until the cache fits within max_size."
+
+        entries = []
+        for name in listdir(self.path):
+            if not name.endswith('.tar'):
+                continue
+            entry_path = join(self.path, name)
+            try:
+                st = lstat(entry_path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry_path))
+
+        entries.sort()
+        total_size = sum(size for _, size, _ in entries)
+
+        for _, size, entry_path in entries:
+            if total_size <= self.max_size:
+                break
+
+            print('Evicting %s from build cache' % entry_path)
+            try:
+                unlink(entry_path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
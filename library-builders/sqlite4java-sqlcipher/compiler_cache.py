@@ -0,0 +1,96 @@
+import json
+import subprocess
+from os import environ
+from os.path import join
+
+from utils import make_dirs
+
+
+COMPILER_CACHES = ['none', 'ccache', 'sccache']
+
+#--print-stats key names differ between ccache versions
+_CCACHE_HIT_KEYS = ['direct_cache_hit', 'preprocessed_cache_hit', 'cache_hit_direct', 'cache_hit_preprocessed']
+_CCACHE_MISS_KEYS = ['cache_miss']
+
+
+class CompilerCache(object):
+    """
+    A ccache or sccache compiler launcher with its own cache directory.
+
+    Build templates prefix the compiler with {{cc-launcher}}; the cache
+    directory is given through the environment of the build script.
+
+    sccache keeps the cache directory of its server, so it is only scoped
+    when the server is started by the build.
+    """
+
+    def __init__(self, tool, cache_dir):
+        self.tool = tool
+        self.cache_dir = cache_dir
+
+    @property
+    def launcher(self):
+        return self.tool + ' '
+
+    def get_env(self, env):
+        env = dict(env)
+        if self.tool == 'ccache':
+            env['CCACHE_DIR'] = self.cache_dir
+            #build dirs are freshly cloned, so only the contents of headers matter
+            env['CCACHE_SLOPPINESS'] = 'include_file_mtime,include_file_ctime'
+        else:
+            env['SCCACHE_DIR'] = self.cache_dir
+        return env
+
+    def _get_ccache_stats(self):
+        output = subprocess.check_output(['ccache', '--print-stats'], env=self.get_env(environ),
+                                         universal_newlines=True)
+        stats = dict(line.split('\t', 1) for line in output.splitlines() if '\t' in line)
+        hits = sum(int(stats.get(k, 0)) for k in _CCACHE_HIT_KEYS)
+        misses = sum(int(stats.get(k, 0)) for k in _CCACHE_MISS_KEYS)
+        return hits, misses
+
+    def _get_sccache_stats(self):
+        output = subprocess.check_output(['sccache', '--show-stats', '--stats-format=json'],
+                                         env=self.get_env(environ), universal_newlines=True)
+        stats = json.loads(output)['stats']
+        hits = sum(stats['cache_hits']['counts'].values())
+        misses = sum(stats['cache_misses']['counts'].values())
+        return hits, misses
+
+    def get_stats(self):
+        "Returns the cache's cumulative (hits, misses), or None if they can't be read."
+
+        make_dirs(self.cache_dir)
+        try:
+            if self.tool == 'ccache':
+                return self._get_ccache_stats()
+            return self._get_sccache_stats()
+        except (OSError, subprocess.CalledProcessError, ValueError, KeyError):
+            return None
+
+
+def get_compiler_cache(task_context, platform):
+    "Returns the CompilerCache for the given platform's toolchain, or None if disabled."
+
+    tool = task_context['compiler-cache']
+    if tool == 'none':
+        return None
+
+    return CompilerCache(tool, join(task_context['compiler-cache-dir'], platform))
+
+
+def get_stats_delta(before, after):
+    "Returns (hits, misses) between two get_stats() results, or None if either is missing."
+
+    if before is None or after is None:
+        return None
+
+    return after[0] - before[0], after[1] - before[1]
+
+
+def format_stats(stats):
+    hits, misses = stats
+    total = hits + misses
+    rate = 100.0 * hits / total if total > 0 else 0.0
+    return '%d hits, %d misses (%.0f%% hit rate)' % (hits, misses, rate)
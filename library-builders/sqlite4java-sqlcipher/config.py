@@ -1,6 +1,6 @@
 import re
 import itertools
-from os import environ
+from os import environ, cpu_count
 from os.path import join
 from configparser import ConfigParser, Interpolation, BasicInterpolation, InterpolationError
 
@@ -39,6 +39,102 @@ class ConfigError(Exception):
         super().__init__('Configuration file error: ' + msg)
 
 
+def get_int(config, key, default, minimum=1):
+    "Returns the given optional key as an int >= minimum."
+
+    value = config.get(key, str(default))
+    try:
+        n = int(value)
+    except ValueError:
+        raise ConfigError('%s must be an integer, got %s' % (key, value))
+
+    if n < minimum:
+        raise ConfigError('%s must be >= %d' % (key, minimum))
+
+    return n
+
+
+def get_int_list(config, key, default, minimum=1):
+    "Returns the given optional comma-separated key as a list of ints >= minimum."
+
+    values = []
+    for value in config.get(key, default).split(','):
+        try:
+            n = int(value)
+        except ValueError:
+            raise ConfigError('%s must be a list of integers, got %s' % (key, value.strip()))
+
+        if n < minimum:
+            raise ConfigError('%s values must be >= %d' % (key, minimum))
+        values.append(n)
+
+    return values
+
+
+def get_choice(config, key, choices, default):
+    "Returns the given optional key, which must be one of choices."
+
+    value = config.get(key, default)
+    if value not in choices:
+        raise ConfigError('%s must be one of %s, got %s' % (key, ', '.join(choices), value))
+
+    return value
+
+
+#built-in SQLCipher build profiles: compiler flags added after the defines
+#sqlite4java requires. More can be defined with sqlcipher-profile-<name> keys.
+SQLCIPHER_PROFILES = {
+    #the original flags; note there's no optimization level
+    'default': '',
+    'release': '-O2 -DSQLITE_DEFAULT_MEMSTATUS=0 -DSQLITE_LIKE_DOESNT_MATCH_BLOBS -DSQLITE_MAX_EXPR_DEPTH=0',
+    'release-o3': '-O3 -DSQLITE_DEFAULT_MEMSTATUS=0 -DSQLITE_LIKE_DOESNT_MATCH_BLOBS -DSQLITE_MAX_EXPR_DEPTH=0',
+}
+
+#CAST causes some text relocations to be generated so we need to disable it
+_OPENSSL_DEFAULT_OPTIONS = 'no-ssl2 no-ssl3 no-cast no-comp no-dso no-hw no-engine no-shared'
+
+#built-in OpenSSL configure options. More can be defined with
+#openssl-profile-<name> keys. Profiles without no-asm are checked for the
+#accelerated AES/SHA implementations after building.
+OPENSSL_PROFILES = {
+    'default': _OPENSSL_DEFAULT_OPTIONS,
+    #sqlcipher only needs AES-256-CBC, HMAC-SHA1, PBKDF2 and the RNG
+    'sqlcipher': _OPENSSL_DEFAULT_OPTIONS + ' no-idea no-mdc2 no-seed no-camellia no-whirlpool no-srp no-gost',
+}
+
+
+def get_profiles(config, name, builtin_profiles):
+    """
+    Returns ({profile name: options}, selected profile name) for the
+    <name>-profile key, from the built-in profiles and any
+    <name>-profile-<profile name> keys.
+    """
+
+    key_prefix = name + '-profile-'
+    profiles = dict(builtin_profiles)
+    for key in config:
+        if key.startswith(key_prefix) and len(key) > len(key_prefix):
+            profiles[key[len(key_prefix):]] = ' '.join(config[key].split())
+
+    return profiles, get_choice(config, name + '-profile', sorted(profiles), 'default')
+
+
+def get_sqlcipher_profiles(config):
+    """
+    Returns ({profile name: flags}, main profile name, [variant profile names])
+    from the sqlcipher-profile* keys.
+    """
+
+    profiles, profile = get_profiles(config, 'sqlcipher', SQLCIPHER_PROFILES)
+
+    variants = [a.strip() for a in config.get('sqlcipher-variants', '').split(',') if a.strip()]
+    for variant in variants:
+        if variant not in profiles:
+            raise ConfigError('sqlcipher-variants: unknown profile %s' % variant)
+
+    return profiles, profile, variants
+
+
 def process_config_file(config):
     "Returns a dictionary using the given config file as a base."
 
@@ -64,6 +160,26 @@ def process_config_file(config):
 
     r['platforms'] = [a.strip() for a in config['platforms'].split(',')]
 
+    #optional keys
+    r['platform-jobs'] = get_int(config, 'platform-jobs', 1)
+    r['make-jobs'] = get_int(config, 'make-jobs', cpu_count() or 1)
+    r['source-clone-mode'] = get_choice(config, 'source-clone-mode', ['auto', 'reflink', 'hardlink', 'copy'], 'auto')
+    r['compiler-cache'] = get_choice(config, 'compiler-cache', ['none', 'ccache', 'sccache'], 'none')
+    r['build-artifacts'] = get_choice(config, 'build-artifacts', ['minimal', 'full'], 'full')
+    r['openssl-profiles'], r['openssl-profile'] = get_profiles(config, 'openssl', OPENSSL_PROFILES)
+    r['sqlcipher-profiles'], r['sqlcipher-profile'], r['sqlcipher-variants'] = get_sqlcipher_profiles(config)
+    r['sqlcipher-pgo'] = get_choice(config, 'sqlcipher-pgo', ['no', 'yes'], 'no') == 'yes'
+    r['sqlcipher-lto'] = get_choice(config, 'sqlcipher-lto', ['no', 'yes'], 'no') == 'yes'
+    r['size-optimize'] = get_choice(config, 'size-optimize', ['no', 'yes'], 'no') == 'yes'
+    r['bench-sqlcipher-page-sizes'] = get_int_list(config, 'bench-sqlcipher-page-sizes', '1024, 4096', minimum=512)
+    r['bench-sqlcipher-kdf-iters'] = get_int_list(config, 'bench-sqlcipher-kdf-iters', '4000, 64000')
+    r['bench-sqlcipher-rows'] = get_int(config, 'bench-sqlcipher-rows', 20000)
+    r['bench-sqlcipher-repeat'] = get_int(config, 'bench-sqlcipher-repeat', 3)
+    #in MiB; 0 disables the build cache
+    r['build-cache-size'] = get_int(config, 'build-cache-size', 2048, minimum=0)
+    #in MiB
+    r['scratch-space-per-build'] = get_int(config, 'scratch-space-per-build', 512, minimum=0)
+
     root_path = r['root']
 
     #derived values
@@ -71,8 +187,21 @@ def process_config_file(config):
     r['root-build-path'] = join(root_path, 'build')
     r['root-prefix-path'] = join(root_path, 'root')
     r['root-output-path'] = join(root_path, 'output')
+    r['root-variants-path'] = join(root_path, 'variants')
     r['root-android-output-path'] = join(r['root-output-path'], 'android')
     r['root-ios-output-path'] = join(r['root-output-path'], 'ios')
+    r['root-symbols-path'] = join(root_path, 'symbols')
+    r['root-size-path'] = join(root_path, 'size')
+    r['build-cache-path'] = config.get('build-cache-path', join(root_path, 'cache', 'builds'))
+    r['source-cache-path'] = config.get('source-cache-path', join(root_path, 'cache', 'sources'))
+    r['amalgamation-cache-path'] = config.get('amalgamation-cache-path', join(root_path, 'cache', 'amalgamation'))
+    r['autoconf-cache-path'] = config.get('autoconf-cache-path', join(root_path, 'cache', 'autoconf'))
+    r['root-bench-path'] = join(root_path, 'bench')
+    r['bench-sqlcipher-baseline'] = config.get('bench-sqlcipher-baseline',
+                                               join(r['root-bench-path'], 'sqlcipher-baseline.json'))
+    r['compiler-cache-dir'] = config.get('compiler-cache-dir', join(root_path, 'cache', 'compiler'))
+    #unset keeps build trees under root-build-path
+    r['scratch-path'] = config.get('scratch-path')
 
     return r
 
@@ -0,0 +1,121 @@
+import re
+import hashlib
+from urllib import request
+from urllib.error import HTTPError
+from os import replace, unlink
+from os.path import exists, getsize
+
+
+CHUNK_SIZE = 64*1024
+
+_content_range_re = re.compile(r'bytes (\d+)-\d+/(?:\d+|\*)')
+
+
+class DownloadError(RuntimeError):
+    pass
+
+
+def _hash_file(hasher, path):
+    with open(path, 'rb') as fd:
+        while True:
+            chunk = fd.read(CHUNK_SIZE)
+            if len(chunk) <= 0:
+                break
+            hasher.update(chunk)
+
+
+def _get_resume_offset(response):
+    "Returns the starting offset of a 206 response, or None if it isn't a valid partial response."
+
+    if response.status != 206:
+        return None
+
+    m = _content_range_re.match(response.headers.get('Content-Range', ''))
+    if m is None:
+        return None
+
+    return int(m.group(1))
+
+
+def _fetch(url, part_path, offset, timeout):
+    """
+    Appends the content of url starting at offset to part_path, hashing the
+    data as it's written. Returns the hasher for the complete file.
+    """
+
+    hasher = hashlib.sha256()
+
+    req = request.Request(url)
+    if offset > 0:
+        req.add_header('Range', 'bytes=%d-' % offset)
+
+    with request.urlopen(req, timeout=timeout) as response:
+        if offset > 0 and _get_resume_offset(response) == offset:
+            print('Resuming %s at byte %d' % (url, offset))
+            _hash_file(hasher, part_path)
+            mode = 'ab'
+        else:
+            if offset > 0:
+                print('Server did not resume %s, restarting download' % url)
+            mode = 'wb'
+
+        with open(part_path, mode) as fd:
+            while True:
+                chunk = response.read(CHUNK_SIZE)
+                if len(chunk) <= 0:
+                    break
+                hasher.update(chunk)
+                fd.write(chunk)
+
+    return hasher
+
+
+def is_downloaded(save_path, sha256_checksum):
+    """
+    True if save_path exists and matches the given checksum. A file that
+    doesn't match (eg: an older version) is removed.
+    """
+
+    if not exists(save_path):
+        return False
+
+    hasher = hashlib.sha256()
+    _hash_file(hasher, save_path)
+    if hasher.hexdigest() == sha256_checksum:
+        return True
+
+    print('%s does not match the expected checksum, removing' % save_path)
+    unlink(save_path)
+    return False
+
+
+def download_file(url, save_path, sha256_checksum, timeout=60):
+    """
+    Downloads url to save_path, verifying its SHA256 checksum.
+
+    Data is hashed as it arrives and written to save_path + '.part', which
+    is only renamed to save_path once verified. An existing .part file from
+    an interrupted download is resumed using an HTTP Range request.
+    """
+
+    part_path = save_path + '.part'
+    offset = getsize(part_path) if exists(part_path) else 0
+
+    try:
+        hasher = _fetch(url, part_path, offset, timeout)
+    except HTTPError as e:
+        #the part file is already complete (or bogus); check it, otherwise start over
+        if e.code != 416:
+            raise
+        hasher = hashlib.sha256()
+        _hash_file(hasher, part_path)
+        if hasher.hexdigest() != sha256_checksum:
+            unlink(part_path)
+            hasher = _fetch(url, part_path, 0, timeout)
+
+    got = hasher.hexdigest()
+    if got != sha256_checksum:
+        unlink(part_path)
+        raise DownloadError('SHA256 checksum verification failed for %s: got %s but expected %s' % (url, got, sha256_checksum))
+
+    replace(part_path, save_path)
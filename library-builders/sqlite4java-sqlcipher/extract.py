@@ -0,0 +1,251 @@
+import os
+import queue
+import tarfile
+import threading
+import zlib
+from os import makedirs, symlink, link, chmod, utime
+from os.path import join, dirname, realpath
+
+
+#size of compressed reads done by the decompression thread
+READ_SIZE = 256*1024
+#max number of decompressed chunks buffered between the threads
+QUEUE_SIZE = 64
+
+
+class ExtractError(Exception):
+    pass
+
+
+class _DecompressingReader(object):
+    """
+    Read-only file-like object yielding the decompressed contents of a gzip
+    file, which is read and decompressed on a separate thread.
+
+    Only forward seeks are supported, which is all tarfile needs to read
+    members in order.
+    """
+
+    def __init__(self, path):
+        self._queue = queue.Queue(QUEUE_SIZE)
+        self._buffer = b''
+        self._pos = 0
+        self._offset = 0
+        self._eof = False
+        self._error = None
+        self._thread = threading.Thread(target=self._decompress, args=(path,), daemon=True)
+        self._thread.start()
+
+    def _decompress(self, path):
+        try:
+            with open(path, 'rb') as fd:
+                #multiple gzip members are valid, so restart the decompressor on each one
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                while True:
+                    chunk = fd.read(READ_SIZE)
+                    if len(chunk) <= 0:
+                        break
+
+                    while chunk:
+                        data = decompressor.decompress(chunk)
+                        if data:
+                            self._queue.put(data)
+                        chunk = decompressor.unused_data
+                        if chunk:
+                            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+                data = decompressor.flush()
+                if data:
+                    self._queue.put(data)
+        except Exception as e:
+            self._error = e
+        finally:
+            self._queue.put(None)
+
+    def read(self, size=-1):
+        chunks = []
+        while size != 0:
+            if self._pos >= len(self._buffer):
+                if self._eof:
+                    break
+
+                data = self._queue.get()
+                if data is None:
+                    self._eof = True
+                    if self._error is not None:
+                        raise self._error
+                    break
+
+                self._buffer = data
+                self._pos = 0
+
+            available = len(self._buffer) - self._pos
+            n = available if size < 0 else min(size, available)
+            chunks.append(self._buffer[self._pos:self._pos + n])
+            self._pos += n
+            if size > 0:
+                size -= n
+
+        r = b''.join(chunks)
+        self._offset += len(r)
+        return r
+
+    def tell(self):
+        return self._offset
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._offset
+        elif whence != 0 or offset < self._offset:
+            raise OSError('Only forward seeks are supported')
+
+        while self._offset < offset:
+            if len(self.read(min(offset - self._offset, READ_SIZE))) <= 0:
+                break
+
+        return self._offset
+
+    def close(self):
+        #unblock and drain the decompression thread if we stop reading early
+        while not self._eof:
+            if self._queue.get() is None:
+                self._eof = True
+        self._thread.join()
+
+
+def _strip_path(name, strip_components, top_level):
+    "Returns (stripped name, top-level component), raising on unsafe paths."
+
+    parts = [p for p in name.split('/') if p not in ('', '.')]
+
+    if name.startswith('/') or '..' in parts:
+        raise ExtractError('Refusing to extract unsafe path: %s' % name)
+
+    if len(parts) < strip_components:
+        return None, top_level
+
+    prefix = '/'.join(parts[:strip_components])
+    if top_level is not None and prefix != top_level:
+        raise ExtractError('Archive has more than one top-level entry (%s, %s)' % (top_level, prefix))
+
+    return '/'.join(parts[strip_components:]), prefix
+
+
+def _check_not_through_symlink(name, symlinks):
+    """
+    Raises if the (stripped) name, or a directory above it, is a symlink
+    extracted earlier, which the member would otherwise be written through.
+    """
+
+    parts = name.split('/')
+    for i in range(1, len(parts) + 1):
+        if '/'.join(parts[:i]) in symlinks:
+            raise ExtractError('Refusing to extract %s through the symlink %s' % (name, '/'.join(parts[:i])))
+
+
+def _check_symlink_target(output_path, name, linkname):
+    "Raises unless the symlink at the (stripped) name points inside output_path."
+
+    root = realpath(output_path)
+    target = realpath(join(output_path, dirname(name), linkname))
+    if linkname.startswith('/') or (target != root and not target.startswith(root + os.sep)):
+        raise ExtractError('Refusing to extract symlink %s pointing outside the tree: %s' % (name, linkname))
+
+
+def _write_member(fileobj, member, path):
+    "Copies a regular file member's data straight from the archive stream."
+
+    fileobj.seek(member.offset_data)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        remaining = member.size
+        while remaining > 0:
+            chunk = fileobj.read(min(remaining, READ_SIZE))
+            if len(chunk) <= 0:
+                raise ExtractError('Unexpected end of archive in %s' % member.name)
+            os.write(fd, chunk)
+            remaining -= len(chunk)
+
+        os.fchmod(fd, member.mode)
+        os.utime(fd, (member.mtime, member.mtime))
+    finally:
+        os.close(fd)
+
+
+def extract_tarball(src_path, output_path, strip_components=1, threaded=False):
+    """
+    Extracts a tarball in a single streaming pass, stripping the first
+    strip_components path components (which must be the same for every
+    member) as it goes.
+
+    output_path must already exist. If threaded is True, a .tar.gz is
+    decompressed on a separate thread while files are being written.
+    """
+
+    created_dirs = set([output_path])
+    #stripped names of the symlinks extracted so far
+    symlinks = set()
+    #applied at the end, in case a directory is read-only
+    dir_attrs = []
+
+    def make_parent(path):
+        parent = dirname(path)
+        if parent not in created_dirs:
+            makedirs(parent, exist_ok=True)
+            created_dirs.add(parent)
+
+    #members are read strictly in order; the non-stream modes are used since
+    #tarfile's stream buffering is slow with highly compressed sources
+    if threaded:
+        fileobj = _DecompressingReader(src_path)
+        tar = tarfile.open(fileobj=fileobj, mode='r:')
+    else:
+        fileobj = None
+        tar = tarfile.open(src_path, mode='r:*')
+
+    top_level = None
+    try:
+        for member in tar:
+            name, top_level = _strip_path(member.name, strip_components, top_level)
+            if not name:
+                continue
+
+            _check_not_through_symlink(name, symlinks)
+            path = join(output_path, name)
+
+            if member.isdir():
+                if path not in created_dirs:
+                    makedirs(path, exist_ok=True)
+                    created_dirs.add(path)
+                dir_attrs.append((path, member.mode, member.mtime))
+
+            elif member.isreg() and not member.issparse():
+                make_parent(path)
+                _write_member(tar.fileobj, member, path)
+
+            elif member.issym():
+                _check_symlink_target(output_path, name, member.linkname)
+                make_parent(path)
+                symlink(member.linkname, path)
+                symlinks.add(name)
+
+            elif member.islnk():
+                target, _ = _strip_path(member.linkname, strip_components, top_level)
+                if not target:
+                    raise ExtractError('Refusing to extract hardlink %s to %s, outside the tree' % (
+                        member.name, member.linkname))
+                _check_not_through_symlink(target, symlinks)
+                make_parent(path)
+                link(join(output_path, target), path)
+
+            else:
+                #sparse files, devices and fifos have no place in source tarballs
+                raise ExtractError('Unsupported member type for %s' % member.name)
+    finally:
+        tar.close()
+        if fileobj is not None:
+            fileobj.close()
+
+    for path, mode, mtime in reversed(dir_attrs):
+        chmod(path, mode)
+        utime(path, (mtime, mtime))
@@ -0,0 +1,192 @@
+/*
+ * SQLCipher throughput benchmark, run by the bench-sqlcipher task.
+ *
+ * usage: sqlcipher-bench <db path> <cipher page size> <kdf iterations> <rows>
+ *
+ * Creates an encrypted message table at the given path and prints a JSON
+ * object with:
+ *   open-ms: latency of opening and keying the database (PBKDF2 key
+ *            derivation) up to the first read
+ *   insert-rows-per-s: rows inserted per second in a single transaction
+ *   lookup-us: average latency of a lookup by a random row id
+ *   scan-mb-per-s: full table scan throughput, with a page cache small
+ *                  enough that every page is read and decrypted
+ */
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+
+#include "sqlite3.h"
+
+#define OPEN_REPEAT 5
+#define BODY_SIZE 200
+
+static double now(void)
+{
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec + ts.tv_nsec / 1e9;
+}
+
+static void fail(sqlite3 *db, const char *what)
+{
+    fprintf(stderr, "%s: %s\n", what, db != NULL ? sqlite3_errmsg(db) : "out of memory");
+    exit(1);
+}
+
+static void exec(sqlite3 *db, const char *sql)
+{
+    if (sqlite3_exec(db, sql, NULL, NULL, NULL) != SQLITE_OK)
+        fail(db, sql);
+}
+
+static sqlite3_stmt *prepare(sqlite3 *db, const char *sql)
+{
+    sqlite3_stmt *stmt;
+    if (sqlite3_prepare_v2(db, sql, -1, &stmt, NULL) != SQLITE_OK)
+        fail(db, sql);
+    return stmt;
+}
+
+static sqlite3 *open_keyed(const char *path, int page_size, int kdf_iter)
+{
+    sqlite3 *db;
+    char sql[64];
+
+    if (sqlite3_open(path, &db) != SQLITE_OK)
+        fail(db, path);
+
+    exec(db, "PRAGMA key = 'sqlcipher-bench'");
+    snprintf(sql, sizeof(sql), "PRAGMA cipher_page_size = %d", page_size);
+    exec(db, sql);
+    snprintf(sql, sizeof(sql), "PRAGMA kdf_iter = %d", kdf_iter);
+    exec(db, sql);
+    /* the key is derived on first access */
+    exec(db, "SELECT count(*) FROM sqlite_master");
+
+    return db;
+}
+
+static sqlite3_int64 query_int(sqlite3 *db, const char *sql)
+{
+    sqlite3_stmt *stmt = prepare(db, sql);
+    sqlite3_int64 value;
+
+    if (sqlite3_step(stmt) != SQLITE_ROW)
+        fail(db, sql);
+    value = sqlite3_column_int64(stmt, 0);
+    sqlite3_finalize(stmt);
+    return value;
+}
+
+/* deterministic pseudo-random numbers, so every build inserts the same data */
+static unsigned int next_random(unsigned int *state)
+{
+    *state = *state * 1103515245 + 12345;
+    return (*state >> 16) & 0x7fff;
+}
+
+static double bench_insert(sqlite3 *db, int rows)
+{
+    sqlite3_stmt *stmt;
+    unsigned int state = 1;
+    char body[BODY_SIZE + 1];
+    double start;
+    int i, j;
+
+    exec(db, "CREATE TABLE messages (id INTEGER PRIMARY KEY, conversation_id INTEGER NOT NULL, "
+             "timestamp INTEGER NOT NULL, body TEXT NOT NULL)");
+    exec(db, "CREATE INDEX messages_conversation_timestamp ON messages (conversation_id, timestamp)");
+
+    stmt = prepare(db, "INSERT INTO messages (conversation_id, timestamp, body) VALUES (?, ?, ?)");
+
+    start = now();
+    exec(db, "BEGIN");
+    for (i = 0; i < rows; i++) {
+        int length = 20 + next_random(&state) % (BODY_SIZE - 20);
+        for (j = 0; j < length; j++)
+            body[j] = 'a' + next_random(&state) % 26;
+        body[length] = '\0';
+
+        sqlite3_bind_int(stmt, 1, next_random(&state) % 200);
+        sqlite3_bind_int64(stmt, 2, 1460000000000LL + i * 1000LL);
+        sqlite3_bind_text(stmt, 3, body, length, SQLITE_STATIC);
+        if (sqlite3_step(stmt) != SQLITE_DONE)
+            fail(db, "insert");
+        sqlite3_reset(stmt);
+    }
+    exec(db, "COMMIT");
+
+    sqlite3_finalize(stmt);
+    return rows / (now() - start);
+}
+
+static double bench_lookup(sqlite3 *db, int rows)
+{
+    sqlite3_stmt *stmt = prepare(db, "SELECT body FROM messages WHERE id = ?");
+    unsigned int state = 2;
+    double start = now();
+    int i;
+
+    for (i = 0; i < rows; i++) {
+        unsigned int id = next_random(&state) << 15;
+        id |= next_random(&state);
+        sqlite3_bind_int(stmt, 1, 1 + id % rows);
+        if (sqlite3_step(stmt) != SQLITE_ROW)
+            fail(db, "lookup");
+        sqlite3_reset(stmt);
+    }
+
+    sqlite3_finalize(stmt);
+    return (now() - start) / rows * 1e6;
+}
+
+static double bench_scan(sqlite3 *db)
+{
+    double bytes = (double)query_int(db, "PRAGMA page_count") * query_int(db, "PRAGMA page_size");
+    double start = now();
+
+    query_int(db, "SELECT sum(length(body)) FROM messages");
+    return bytes / (1024 * 1024) / (now() - start);
+}
+
+int main(int argc, char **argv)
+{
+    const char *path;
+    int page_size, kdf_iter, rows, i;
+    double insert_rate, lookup_us, scan_rate, open_ms, start;
+    sqlite3 *db;
+
+    if (argc != 5) {
+        fprintf(stderr, "usage: %s <db path> <cipher page size> <kdf iterations> <rows>\n", argv[0]);
+        return 2;
+    }
+
+    path = argv[1];
+    page_size = atoi(argv[2]);
+    kdf_iter = atoi(argv[3]);
+    rows = atoi(argv[4]);
+    remove(path);
+
+    db = open_keyed(path, page_size, kdf_iter);
+    insert_rate = bench_insert(db, rows);
+    sqlite3_close(db);
+
+    start = now();
+    for (i = 0; i < OPEN_REPEAT; i++) {
+        db = open_keyed(path, page_size, kdf_iter);
+        sqlite3_close(db);
+    }
+    open_ms = (now() - start) / OPEN_REPEAT * 1e3;
+
+    db = open_keyed(path, page_size, kdf_iter);
+    exec(db, "PRAGMA cache_size = 10");
+    lookup_us = bench_lookup(db, rows);
+    scan_rate = bench_scan(db);
+    sqlite3_close(db);
+    remove(path);
+
+    printf("{\"open-ms\": %.3f, \"insert-rows-per-s\": %.1f, \"lookup-us\": %.3f, \"scan-mb-per-s\": %.2f}\n",
+           open_ms, insert_rate, lookup_us, scan_rate);
+    return 0;
+}
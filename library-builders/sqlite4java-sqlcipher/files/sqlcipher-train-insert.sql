@@ -0,0 +1,49 @@
+-- PGO training workload (1/3): a chat client storing incoming messages in an
+-- encrypted database. Run several times, reopening the database each time.
+PRAGMA key = 'pgo-training-key';
+PRAGMA journal_mode = WAL;
+
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    unread_count INTEGER NOT NULL DEFAULT 0,
+    last_timestamp INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    conversation_id INTEGER NOT NULL,
+    sender_id INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL,
+    is_read INTEGER NOT NULL DEFAULT 0,
+    body TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS messages_conversation_timestamp ON messages (conversation_id, timestamp);
+CREATE INDEX IF NOT EXISTS messages_conversation_unread ON messages (conversation_id, is_read);
+
+WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 200)
+INSERT OR IGNORE INTO conversations (id, name) SELECT i, printf('conversation %d', i) FROM n;
+
+-- a few single-message transactions
+INSERT INTO messages (conversation_id, sender_id, timestamp, body)
+VALUES (1, 1, (SELECT ifnull(max(timestamp), 1460000000000) + 1000 FROM messages), 'hello');
+INSERT INTO messages (conversation_id, sender_id, timestamp, body)
+VALUES (2, 7, (SELECT max(timestamp) + 1000 FROM messages), 'are you there?');
+INSERT INTO messages (conversation_id, sender_id, timestamp, body)
+VALUES (1, 3, (SELECT max(timestamp) + 1000 FROM messages), 'on my way');
+
+-- then a sync's worth of messages in one transaction
+BEGIN;
+WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 4000)
+INSERT INTO messages (conversation_id, sender_id, timestamp, is_read, body)
+SELECT abs(random()) % 200 + 1,
+       abs(random()) % 50,
+       (SELECT max(timestamp) FROM messages) + i * 1000,
+       i % 3 = 0,
+       substr(hex(randomblob(200)), 1, 20 + abs(random()) % 380)
+FROM n;
+
+UPDATE conversations SET last_timestamp = (
+    SELECT max(timestamp) FROM messages WHERE conversation_id = conversations.id);
+COMMIT;
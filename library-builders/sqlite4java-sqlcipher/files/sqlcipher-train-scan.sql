@@ -0,0 +1,16 @@
+-- PGO training workload (3/3): index and full table scans.
+PRAGMA key = 'pgo-training-key';
+PRAGMA cache_size = 50;
+
+-- per-conversation counts, using the indexes
+SELECT conversation_id, count(*), max(timestamp) FROM messages GROUP BY conversation_id;
+SELECT conversation_id, count(*) FROM messages WHERE is_read = 0 GROUP BY conversation_id;
+
+-- message search, scanning the whole table
+SELECT count(*) FROM messages WHERE body LIKE '%ABC%';
+SELECT count(*) FROM messages WHERE instr(body, 'F00D') > 0;
+
+-- expire old messages and checkpoint
+DELETE FROM messages WHERE id % 10 = 0 AND timestamp < (SELECT max(timestamp) FROM messages) - 86400000;
+PRAGMA wal_checkpoint(TRUNCATE);
+PRAGMA integrity_check;
@@ -0,0 +1,29 @@
+-- PGO training workload (2/3): opening conversations and looking up messages.
+PRAGMA key = 'pgo-training-key';
+-- a small page cache, so most reads go through the codec's page decryption
+PRAGMA cache_size = 50;
+
+-- conversation list, most recent first
+SELECT id, name, unread_count FROM conversations ORDER BY last_timestamp DESC;
+
+-- open every conversation: the latest page of messages
+SELECT c.id, (SELECT sum(length(body)) FROM (
+    SELECT body FROM messages WHERE conversation_id = c.id ORDER BY timestamp DESC LIMIT 50))
+FROM conversations c;
+
+-- scroll back in a few conversations
+SELECT id, sender_id, timestamp, body FROM messages
+WHERE conversation_id IN (1, 2, 3) AND timestamp < (SELECT max(timestamp) FROM messages) - 3600000
+ORDER BY timestamp DESC LIMIT 500;
+
+-- random point lookups by message id (eg: replies, notifications)
+WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 20000)
+SELECT count(*), sum(length(m.body)) FROM n
+JOIN messages m ON m.id = abs(random()) % (SELECT max(id) FROM messages) + 1;
+
+-- mark conversations as read
+BEGIN;
+UPDATE messages SET is_read = 1 WHERE conversation_id % 7 = 0 AND is_read = 0;
+UPDATE conversations SET unread_count = (
+    SELECT count(*) FROM messages WHERE conversation_id = conversations.id AND is_read = 0);
+COMMIT;
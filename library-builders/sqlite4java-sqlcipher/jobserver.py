@@ -0,0 +1,89 @@
+import shutil
+import tempfile
+import weakref
+from contextlib import contextmanager
+from os import O_RDWR, close, getpid, mkfifo, open as os_open, read, write
+from os.path import join
+
+
+def _remove_fifo_dir(path, owner_pid):
+    #forked children inherit the finalizer, but the fifo belongs to the process that created it
+    if getpid() == owner_pid:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _close_fds(*fds):
+    for fd in fds:
+        close(fd)
+
+
+class JobServer(object):
+    """
+    GNU make compatible jobserver holding the global job budget.
+
+    The pipe starts with one token per job. Each build script takes a token
+    for its top-level make (which is that make's implicit job slot), and
+    every make started with get_env()/fds draws any further parallel jobs
+    from the same pipe, so concurrent builds together never run more than
+    `jobs` jobs at once.
+
+    The pipe is a named fifo, so worker processes that don't inherit the
+    parent's fds (eg: started by a forkserver) share it too: a JobServer
+    passed to a worker reopens the fifo by path. The fifo is removed when
+    the process that created it exits.
+    """
+
+    def __init__(self, jobs):
+        if jobs < 1:
+            raise ValueError('jobs must be >= 1')
+
+        self.jobs = jobs
+        fifo_dir = tempfile.mkdtemp(prefix='jobserver-')
+        self.path = join(fifo_dir, 'fifo')
+        mkfifo(self.path)
+        weakref.finalize(self, _remove_fifo_dir, fifo_dir, getpid())
+
+        self._open()
+        write(self.write_fd, b'+' * jobs)
+
+    def _open(self):
+        #opening both ends read-write never blocks waiting for the other end
+        self.read_fd = os_open(self.path, O_RDWR)
+        self.write_fd = os_open(self.path, O_RDWR)
+        weakref.finalize(self, _close_fds, self.read_fd, self.write_fd)
+
+    def __getstate__(self):
+        return {'jobs': self.jobs, 'path': self.path}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+
+    @property
+    def fds(self):
+        "fds to pass to subprocesses (see subprocess.Popen's pass_fds)"
+        return (self.read_fd, self.write_fd)
+
+    def get_makeflags(self):
+        #a bare -j, like make passes to its submakes: with a number, make < 4.2
+        #(3.81 ships with macOS) disables the jobserver and runs that many jobs.
+        #--jobserver-fds is understood by make < 4.2, --jobserver-auth by later versions
+        return '-j --jobserver-fds=%d,%d --jobserver-auth=%d,%d' % (
+            self.read_fd, self.write_fd, self.read_fd, self.write_fd)
+
+    def get_env(self, env):
+        "Returns a copy of env with MAKEFLAGS pointing make at this jobserver."
+
+        env = dict(env)
+        env['MAKEFLAGS'] = self.get_makeflags()
+        return env
+
+    @contextmanager
+    def token(self):
+        "Holds a job token for the duration of the with block, blocking until one is available."
+
+        token = read(self.read_fd, 1)
+        try:
+            yield
+        finally:
+            write(self.write_fd, token)
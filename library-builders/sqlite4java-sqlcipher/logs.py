@@ -0,0 +1,428 @@
+import codecs
+import os
+import selectors
+import shutil
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from os.path import dirname
+
+
+#lines of a failed build's log printed to the terminal
+FAILURE_TAIL_LINES = 40
+
+#how long to wait for a command's output after it exits; daemons it started
+#(eg: the sccache server) can keep its pipes open
+DRAIN_TIMEOUT = 2.0
+
+#seconds between redraws of the status line
+STATUS_INTERVAL = 0.5
+
+#log lines start with `HH:MM:SS.mmm M `, where M is ! for stderr
+_TIMESTAMP_WIDTH = 15
+
+_local = threading.local()
+_multiplexer = None
+_status = None
+_routers_installed = False
+_global_lock = threading.Lock()
+
+
+def _format_timestamp(t):
+    return '%s.%03d' % (time.strftime('%H:%M:%S', time.localtime(t)), int(t % 1 * 1000))
+
+
+class LogFile(object):
+    "A log of timestamped lines, written to by any number of threads and streams."
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = open(path, 'w', encoding='utf-8')
+        self._lock = threading.Lock()
+        #prints from the thread that owns this log
+        self.stdout = _LineWriter(self, False)
+        self.stderr = _LineWriter(self, True)
+
+    def write_line(self, line, is_error=False):
+        text = '%s %s %s\n' % (_format_timestamp(time.time()), '!' if is_error else ' ', line.rstrip('\r'))
+        with self._lock:
+            self._fd.write(text)
+            self._fd.flush()
+
+    def close(self):
+        self.stdout.flush()
+        self.stderr.flush()
+        with self._lock:
+            self._fd.close()
+
+
+class _LineWriter(object):
+    "Splits text written in arbitrary pieces into lines of a LogFile."
+
+    def __init__(self, log, is_error):
+        self.log = log
+        self.is_error = is_error
+        self._partial = ''
+
+    def write(self, text):
+        lines = (self._partial + text).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            self.log.write_line(line, self.is_error)
+
+    def flush(self):
+        if self._partial:
+            self.log.write_line(self._partial, self.is_error)
+            self._partial = ''
+
+
+class _Stream(object):
+    "A pipe read by the multiplexer into a log."
+
+    def __init__(self, fd, log, is_error):
+        self.fd = fd
+        self.writer = _LineWriter(log, is_error)
+        self.done = threading.Event()
+        self._decoder = codecs.getincrementaldecoder('utf-8')('replace')
+
+    def feed(self, data):
+        self.writer.write(self._decoder.decode(data, final=not data))
+
+
+class _Multiplexer(object):
+    """
+    Reads every registered pipe from a single background thread (with a
+    selector), so no child ever blocks on a full pipe or a slow terminal,
+    and writes their lines to their logs.
+    """
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_w, False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+        self._lock = threading.Lock()
+        self._added = []
+        self._removed = []
+
+        thread = threading.Thread(target=self._run, name='log-multiplexer', daemon=True)
+        thread.start()
+
+    def _wake(self):
+        try:
+            os.write(self._wakeup_w, b'x')
+        except BlockingIOError:
+            #a wakeup is already pending
+            pass
+
+    def add(self, fd, log, is_error):
+        "Starts reading the given pipe fd into log. Returns the stream, whose done event is set at EOF."
+
+        stream = _Stream(fd, log, is_error)
+        with self._lock:
+            self._added.append(stream)
+        self._wake()
+        return stream
+
+    def remove(self, stream):
+        "Stops reading a stream before its EOF (closing the fd), keeping what was read."
+
+        with self._lock:
+            self._removed.append(stream)
+        self._wake()
+        stream.done.wait()
+
+    def _close(self, stream):
+        if stream.done.is_set():
+            return
+        self._selector.unregister(stream.fd)
+        os.close(stream.fd)
+        stream.writer.flush()
+        stream.done.set()
+
+    def _run(self):
+        while True:
+            for key, _ in self._selector.select():
+                if key.fileobj == self._wakeup_r:
+                    os.read(self._wakeup_r, 4096)
+                    with self._lock:
+                        added, self._added = self._added, []
+                        removed, self._removed = self._removed, []
+                    for stream in added:
+                        self._selector.register(stream.fd, selectors.EVENT_READ, stream)
+                    for stream in removed:
+                        self._close(stream)
+                    continue
+
+                stream = key.data
+                if stream.done.is_set():
+                    continue
+
+                try:
+                    data = os.read(stream.fd, 65536)
+                except OSError:
+                    data = b''
+
+                stream.feed(data)
+                if not data:
+                    self._close(stream)
+
+
+def _get_multiplexer():
+    global _multiplexer
+
+    with _global_lock:
+        if _multiplexer is None:
+            _multiplexer = _Multiplexer()
+        return _multiplexer
+
+
+def _read_tail(path, count, max_bytes):
+    "Returns up to the last count lines of the file at path, reading at most its last max_bytes."
+
+    try:
+        with open(path, 'rb') as fd:
+            fd.seek(0, 2)
+            fd.seek(max(0, fd.tell() - max_bytes))
+            data = fd.read()
+    except OSError:
+        return []
+
+    return data.decode('utf-8', 'replace').splitlines()[-count:]
+
+
+def _get_last_message(path):
+    "Returns the text of the last non-empty line of a log, without its timestamp."
+
+    for line in reversed(_read_tail(path, 20, 4096)):
+        text = line[_TIMESTAMP_WIDTH:].strip()
+        if text:
+            return text
+    return ''
+
+
+class StatusLine(object):
+    """
+    A single line at the bottom of the terminal, redrawn in place, showing
+    how long each tracked build has been running and the last line of its
+    log. Logs are read from disk, so builds in worker processes are shown
+    too as long as the parent tracks their logs.
+    """
+
+    def __init__(self, terminal):
+        self.terminal = terminal
+        self.lock = threading.Lock()
+        self._tracked = {}
+        self._drawn = False
+
+        thread = threading.Thread(target=self._run, name='status-line', daemon=True)
+        thread.start()
+
+    def track(self, path, label):
+        with self.lock:
+            self._tracked[path] = (label, time.time())
+
+    def untrack(self, path):
+        with self.lock:
+            self._tracked.pop(path, None)
+            if not self._tracked:
+                self.clear()
+
+    def clear(self):
+        "Erases the status line; the lock must be held."
+
+        if self._drawn:
+            self.terminal.write('\r\x1b[K')
+            self.terminal.flush()
+            self._drawn = False
+
+    def _format(self, tracked, width):
+        now = time.time()
+        segment_width = max(10, width // len(tracked) - 3)
+        segments = []
+        for path, (label, start) in sorted(tracked.items(), key=lambda item: item[1][1]):
+            segment = '%s %ds: %s' % (label, now - start, _get_last_message(path))
+            segments.append(segment[:segment_width])
+        return ' | '.join(segments)[:width - 1]
+
+    def _run(self):
+        while True:
+            time.sleep(STATUS_INTERVAL)
+            with self.lock:
+                tracked = dict(self._tracked)
+            if not tracked:
+                continue
+
+            text = self._format(tracked, shutil.get_terminal_size().columns)
+            with self.lock:
+                if self._tracked:
+                    self.terminal.write('\r%s\x1b[K' % text)
+                    self.terminal.flush()
+                    self._drawn = True
+
+
+class _OutputRouter(object):
+    """
+    Replaces sys.stdout/sys.stderr: writes from a thread that is capturing
+    its output go to that thread's log, the rest to the terminal (below the
+    status line, if any).
+    """
+
+    def __init__(self, stream, is_error):
+        self._stream = stream
+        self._is_error = is_error
+
+    def write(self, text):
+        log = get_current_log()
+        if log is not None:
+            (log.stderr if self._is_error else log.stdout).write(text)
+            return len(text)
+
+        status = _status
+        if status is None:
+            return self._stream.write(text)
+
+        with status.lock:
+            status.clear()
+            result = self._stream.write(text)
+            self._stream.flush()
+        return result
+
+    def flush(self):
+        log = get_current_log()
+        if log is None:
+            self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def _install_routers():
+    global _routers_installed
+
+    with _global_lock:
+        if not _routers_installed:
+            sys.stdout = _OutputRouter(sys.stdout, False)
+            sys.stderr = _OutputRouter(sys.stderr, True)
+            _routers_installed = True
+
+
+def _reset_after_fork():
+    "The multiplexer and status line threads don't survive a fork; workers start their own multiplexer."
+
+    global _multiplexer, _status, _global_lock
+    _multiplexer = None
+    _status = None
+    _global_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def start_status_line():
+    "Shows a status line of the running builds, if stdout is a terminal."
+
+    global _status
+
+    _install_routers()
+    terminal = sys.stdout._stream
+    if _status is None and terminal.isatty():
+        _status = StatusLine(terminal)
+
+
+def track_log(path, label):
+    "Shows the log at path (eg: of a build running in a worker process) on the status line."
+
+    if _status is not None:
+        _status.track(path, label)
+
+
+def untrack_log(path):
+    if _status is not None:
+        _status.untrack(path)
+
+
+def get_current_log():
+    "Returns the LogFile the current thread's output goes to, or None."
+    return getattr(_local, 'log', None)
+
+
+def print_log_tail(path, count=FAILURE_TAIL_LINES):
+    "Prints the last lines of a log to the terminal (or the enclosing log)."
+
+    lines = _read_tail(path, count, 256 * 1024)
+    print('---- last %d lines of %s ----' % (len(lines), path))
+    print('\n'.join(lines))
+    print('---- end of %s ----' % path)
+
+
+@contextmanager
+def capture_output(path, label, print_tail=True):
+    """
+    Sends this thread's output (prints, and the output of commands run with
+    child_output) to a new timestamped log at path while the with block
+    runs, and shows it on the status line under label. If the block raises,
+    the traceback is logged and (with print_tail) the tail of the log is
+    printed.
+    """
+
+    _install_routers()
+    os.makedirs(dirname(path), exist_ok=True)
+    log = LogFile(path)
+    previous = get_current_log()
+    _local.log = log
+    track_log(path, label)
+
+    failed = False
+    try:
+        yield log
+    except BaseException:
+        traceback.print_exc()
+        failed = True
+        raise
+    finally:
+        _local.log = previous
+        untrack_log(path)
+        log.close()
+        if failed and print_tail:
+            print_log_tail(path)
+
+
+@contextmanager
+def child_output(kwargs):
+    """
+    If this thread is capturing its output, points the stdout and stderr
+    of the subprocess.Popen kwargs (unless already redirected) at pipes
+    read into the log. Yields a function to call once the child has been
+    started, and waits for its output to be drained at the end of the block.
+    """
+
+    log = get_current_log()
+    if log is None or 'stdout' in kwargs or 'stderr' in kwargs:
+        yield lambda: None
+        return
+
+    multiplexer = _get_multiplexer()
+    streams = []
+    write_fds = []
+    for key, is_error in [('stdout', False), ('stderr', True)]:
+        read_fd, write_fd = os.pipe()
+        streams.append(multiplexer.add(read_fd, log, is_error))
+        write_fds.append(write_fd)
+        kwargs[key] = write_fd
+
+    def close_write_fds():
+        #the child has its own copies; ours would keep the pipes from reaching EOF
+        while write_fds:
+            os.close(write_fds.pop())
+
+    try:
+        yield close_write_fds
+    finally:
+        close_write_fds()
+        deadline = time.monotonic() + DRAIN_TIMEOUT
+        for stream in streams:
+            if not stream.done.wait(max(0.0, deadline - time.monotonic())):
+                multiplexer.remove(stream)
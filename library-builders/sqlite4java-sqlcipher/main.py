@@ -1,10 +1,17 @@
-import sys
+import argparse
+from os.path import join
 
 from tasks import Tasks
+from state import TaskStateStore
+from jobserver import JobServer
+from logs import start_status_line
+from timing import Timeline, print_summary, format_duration
 from config import read_context_from_config
+from utils import load_templates
 from build import (CreatePlatformDirsTask, CreateWorkDirsTask,
-                   IOSBuildOpenSSLTask, BuildOpenSSLTask, BuildSQLCipher,
-                   BuildSQLite4JavaTask, add_download_tasks)
+                   IOSBuildOpenSSLTask, BuildOpenSSLTask, PrepareSQLCipherAmalgamationTask,
+                   BuildSQLCipher, BuildSQLCipherVariantsTask, BenchSQLCipherTask, BuildSQLite4JavaTask,
+                   ReportSizesTask, add_download_tasks)
 
 
 def get_tasks():
@@ -14,27 +21,105 @@ def get_tasks():
     add_download_tasks(tasks)
     tasks.add(BuildOpenSSLTask())
     tasks.add(IOSBuildOpenSSLTask())
+    tasks.add(PrepareSQLCipherAmalgamationTask())
     tasks.add(BuildSQLCipher())
+    tasks.add(BuildSQLCipherVariantsTask())
+    tasks.add(BenchSQLCipherTask())
     tasks.add(BuildSQLite4JavaTask())
+    tasks.add(ReportSizesTask())
 
     return tasks
 
 
+def get_arg_parser():
+    parser = argparse.ArgumentParser(usage='main.py [-j JOBS] [--plan] [--trace PATH] /path/to/config.conf task_name')
+    parser.add_argument('config_path', nargs='?')
+    parser.add_argument('task_name', nargs='?')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Maximum number of tasks to run concurrently (default: 1)')
+    parser.add_argument('-n', '--plan', action='store_true',
+                        help='Show which tasks and platforms are stale and estimate the build time, without running anything')
+    parser.add_argument('--trace', metavar='PATH',
+                        help='Write a Chrome trace of task/platform/phase timings to PATH and print a summary')
+    return parser
+
+
 def main():
     tasks = get_tasks()
-    if len(sys.argv) < 3:
-        print('Usage: main.py /path/to/config.conf task_name')
+    parser = get_arg_parser()
+    args = parser.parse_args()
+
+    if args.config_path is None or args.task_name is None:
+        parser.print_usage()
         print('Available tasks:')
         tasks.print_tasks(1)
         return
 
-    config_path = sys.argv[1]
-    task_name_to_run = sys.argv[2]
+    if args.jobs < 1:
+        parser.error('--jobs must be >= 1')
+
+    context = read_context_from_config(args.config_path)
+    load_templates()
+    context['jobserver'] = JobServer(context['make-jobs'])
+    context['timeline'] = Timeline()
+    state = TaskStateStore(join(context['root'], 'task-state.json'))
+    context['state'] = state
+
+    if args.plan:
+        print_plan(tasks.plan(args.task_name, context, args.jobs, state), args.jobs, context['platform-jobs'])
+        return
+
+    start_status_line()
+    try:
+        tasks.run(args.task_name, context, args.jobs, state)
+    finally:
+        if args.trace is not None:
+            write_trace(args.trace, context['timeline'], tasks.get_dependencies(args.task_name))
+
 
-    context = read_context_from_config(config_path)
-    tasks.run(task_name_to_run, context)
+def _format_estimate(duration):
+    return '?' if duration is None else '~' + format_duration(duration)
+
+
+def print_plan(plan, jobs, platform_jobs):
+    #items are indented by two spaces under their task
+    width = max([len(task_name) for task_name, _, _, _ in plan['tasks']] +
+                [len(item) + 2 for _, _, _, items in plan['tasks'] for item, _, _ in items] + [0])
+
+    known = 0
+    unknown = 0
+    for task_name, status, estimate, items in plan['tasks']:
+        if status == 'up-to-date':
+            print('%-*s %-12s' % (width, task_name, status))
+            continue
+
+        print('%-*s %-12s %s' % (width, task_name, status, _format_estimate(estimate)))
+        for item, item_status, item_estimate in items:
+            print('  %-*s %-12s %s' % (width - 2, item, item_status,
+                                       _format_estimate(item_estimate) if item_status == 'build' else ''))
+            if item_status == 'build':
+                known += item_estimate is not None
+                unknown += item_estimate is None
+        if not items:
+            known += estimate is not None
+            unknown += estimate is None
+
+    if unknown > 0 and known == 0:
+        #nothing to base an estimate on; 0s would suggest there is nothing to do
+        print('Estimated wall time: unknown (-j %d, platform-jobs %d); critical path: unknown' % (jobs, platform_jobs))
+    else:
+        print('Estimated wall time: %s (-j %d, platform-jobs %d); critical path: %s' % (
+            _format_estimate(plan['estimate']), jobs, platform_jobs, _format_estimate(plan['lower-bound'])))
+    if unknown > 0:
+        print('%d task(s)/platform(s) have no recorded duration and are not included in the estimate' % unknown)
+
+
+def write_trace(path, timeline, dependencies):
+    summary = timeline.get_summary(dependencies)
+    timeline.write_chrome_trace(path, summary)
+    print_summary(summary)
+    print('Wrote trace to %s' % path)
 
 
 if __name__ == '__main__':
     main()
-
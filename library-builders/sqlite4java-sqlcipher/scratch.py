@@ -0,0 +1,179 @@
+import fcntl
+import json
+from contextlib import contextmanager
+from os import statvfs, getpid, kill
+from os.path import join, realpath
+
+from timing import Timeline
+from utils import make_dirs, remove_path
+
+
+#filesystems whose contents are held in memory
+MEMORY_FILESYSTEMS = ['tmpfs', 'ramfs']
+
+
+def get_filesystem_type(path):
+    "Returns the type of the filesystem the given path is on (from /proc/mounts), or None if unknown."
+
+    path = realpath(path)
+    best_mount, best_type = '', None
+    try:
+        with open('/proc/mounts', 'r', encoding='utf-8') as fd:
+            for line in fd:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                #spaces in mount points are escaped as \040
+                mount_point = fields[1].replace('\\040', ' ')
+                if ((path == mount_point or path.startswith(mount_point.rstrip('/') + '/')) and
+                        len(mount_point) >= len(best_mount)):
+                    best_mount, best_type = mount_point, fields[2]
+    except FileNotFoundError:
+        return None
+
+    return best_type
+
+
+def get_available_memory():
+    "Returns MemAvailable from /proc/meminfo in bytes, or None if unknown."
+
+    try:
+        with open('/proc/meminfo', 'r', encoding='utf-8') as fd:
+            for line in fd:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (FileNotFoundError, ValueError, IndexError):
+        pass
+    return None
+
+
+def get_available_space(path):
+    """
+    Returns the bytes that can be written under path: the free space of its
+    filesystem, limited by the available memory for tmpfs/ramfs.
+    """
+
+    st = statvfs(path)
+    available = st.f_bavail * st.f_frsize
+
+    if get_filesystem_type(path) in MEMORY_FILESYSTEMS:
+        memory = get_available_memory()
+        if memory is not None:
+            available = min(available, memory)
+
+    return available
+
+
+def _is_running(pid):
+    try:
+        kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class ScratchSpace(object):
+    """
+    Allocates the build trees builds compile in.
+
+    Without a scratch path, build trees are kept under fallback_path (the
+    root's build dir) as before. With one (eg: a tmpfs or a separate fast
+    volume), each build gets its tree there if the volume has space_per_build
+    bytes free for it and for every other build currently using the scratch
+    volume (tracked in a lock-protected reservations file, so concurrent
+    tasks and platform workers are counted); otherwise it falls back to
+    fallback_path. In scratch mode, trees are removed once their build
+    succeeds; failed builds keep theirs for inspection.
+    """
+
+    def __init__(self, path, fallback_path, space_per_build, timeline=None):
+        self.path = path
+        self.fallback_path = fallback_path
+        self.space_per_build = space_per_build
+        self.timeline = timeline if timeline is not None else Timeline()
+
+    @contextmanager
+    def _lock(self):
+        with open(join(self.path, '.lock'), 'w') as lock_fd:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            yield
+
+    def _get_reservations_path(self):
+        return join(self.path, '.reservations.json')
+
+    def _read_reservations(self):
+        "Returns {build tree: pid} for the builds in progress."
+
+        try:
+            with open(self._get_reservations_path(), 'r', encoding='utf-8') as fd:
+                reservations = json.load(fd)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+        #entries of processes that died without releasing them
+        return {path: pid for path, pid in reservations.items() if _is_running(pid)}
+
+    def _write_reservations(self, reservations):
+        with open(self._get_reservations_path(), 'w', encoding='utf-8') as fd:
+            json.dump(reservations, fd)
+
+    def _reserve(self, scratch_dir):
+        """
+        Reserves space for a build tree at scratch_dir. Returns False (and
+        reserves nothing) if the volume is too small for it and the other
+        builds in progress.
+        """
+
+        make_dirs(self.path)
+        with self._lock():
+            reservations = self._read_reservations()
+            reservations.pop(scratch_dir, None)
+
+            #the builds in progress may not have written their trees yet
+            needed = self.space_per_build * (len(reservations) + 1)
+            available = get_available_space(self.path)
+            if available < needed:
+                print('Not enough scratch space on %s for %d concurrent builds (%d MiB available, %d MiB needed)' % (
+                    self.path, len(reservations) + 1, available // (1024 * 1024), needed // (1024 * 1024)))
+                return False
+
+            reservations[scratch_dir] = getpid()
+            self._write_reservations(reservations)
+            return True
+
+    def _release(self, scratch_dir):
+        with self._lock():
+            reservations = self._read_reservations()
+            reservations.pop(scratch_dir, None)
+            self._write_reservations(reservations)
+
+    @contextmanager
+    def build_dir(self, *names):
+        "Yields the path of the build tree for the given path components (eg: platform, item)."
+
+        fallback_dir = join(self.fallback_path, *names)
+        if self.path is None:
+            yield fallback_dir
+            return
+
+        scratch_dir = join(self.path, *names)
+        #left behind by failed builds or runs without scratch-path
+        for path in [scratch_dir, fallback_dir]:
+            remove_path(path)
+
+        reserved = self._reserve(scratch_dir)
+        build_dir = scratch_dir if reserved else fallback_dir
+        print('Using %s build dir %s' % ('scratch' if reserved else 'disk', build_dir))
+
+        try:
+            yield build_dir
+        finally:
+            if reserved:
+                self._release(scratch_dir)
+
+        #only reached if the build succeeded
+        with self.timeline.span('cleanup', 'phase', path=build_dir):
+            remove_path(build_dir)
+        print('Removed build dir %s' % build_dir)
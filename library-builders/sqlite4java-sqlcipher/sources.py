@@ -0,0 +1,189 @@
+import errno
+import fcntl
+import hashlib
+import json
+import shutil
+import subprocess
+from os import walk, link, symlink, readlink, rename, getpid, makedirs
+from os.path import join, exists, islink, relpath, dirname
+
+from cache import snapshot_tree
+from extract import extract_tarball
+from timing import Timeline
+from utils import make_dirs, remove_path, apply_patch, get_patch_template
+
+
+CLONE_MODES = ['auto', 'reflink', 'hardlink', 'copy']
+
+
+def _clone_reflink(src, dest):
+    "Returns True if src was cloned to dest using copy-on-write reflinks."
+
+    p = subprocess.run(['cp', '-a', '--reflink=always', src, dest],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if p.returncode != 0:
+        remove_path(dest)
+        return False
+    return True
+
+
+def _clone_hardlink(src, dest):
+    for dirpath, dirnames, filenames in walk(src):
+        dest_dir = join(dest, relpath(dirpath, src))
+        makedirs(dest_dir, exist_ok=True)
+        shutil.copystat(dirpath, dest_dir)
+
+        for name in dirnames + filenames:
+            path = join(dirpath, name)
+            if islink(path):
+                symlink(readlink(path), join(dest_dir, name))
+            elif name in filenames:
+                link(path, join(dest_dir, name))
+
+
+def _clone_copy(src, dest):
+    shutil.copytree(src, dest, symlinks=True)
+
+
+class SourceCache(object):
+    """
+    Cache of pristine extracted source trees, keyed by the tarball's hash and
+    the patches applied to it.
+
+    Build dirs are produced by cloning a pristine tree instead of unpacking
+    the tarball again. In `auto` mode reflinks are used where the filesystem
+    supports them, with a plain copy as the fallback. `hardlink` mode shares
+    file data with the pristine tree, so anything modifying a file in place
+    must unlink it first (see utils.unshare_file); the pristine tree is
+    checked against its manifest before each clone and re-extracted if it
+    was modified, and again after each build (check_tree), since concurrent
+    builds cloned from it would see the modification too. Build dirs on
+    another filesystem (eg: a scratch-path tmpfs) are copied instead.
+
+    Unpacking, patching and cloning are recorded to the given timing.Timeline.
+    """
+
+    def __init__(self, path, clone_mode='auto', timeline=None):
+        if clone_mode not in CLONE_MODES:
+            raise ValueError('Unknown clone mode: ' + clone_mode)
+
+        self.path = path
+        self.clone_mode = clone_mode
+        self.timeline = timeline if timeline is not None else Timeline()
+        self._reflink_supported = True
+
+    def _get_key(self, src_hash, patches):
+        rendered = [(name, get_patch_template(name).substitute(**context)) for name, context in patches]
+        return hashlib.sha256(json.dumps([src_hash, rendered]).encode('utf-8')).hexdigest()
+
+    def _get_manifest_path(self, tree_path):
+        return tree_path + '.manifest.json'
+
+    def _matches_manifest(self, tree_path):
+        try:
+            with open(self._get_manifest_path(tree_path), 'r', encoding='utf-8') as fd:
+                manifest = json.load(fd)
+        except FileNotFoundError:
+            return False
+
+        return snapshot_tree(tree_path) == {k: tuple(v) for k, v in manifest.items()}
+
+    def _is_intact(self, tree_path, manifest_path):
+        if not exists(tree_path) or not exists(manifest_path):
+            return False
+
+        if self.clone_mode != 'hardlink':
+            return True
+
+        return self._matches_manifest(tree_path)
+
+    def _create_tree(self, src_path, patches, tree_path, manifest_path):
+        tmp_path = '%s.%d.tmp' % (tree_path, getpid())
+        remove_path(tmp_path)
+        make_dirs(tmp_path)
+
+        print('Unpacking %s into source cache' % src_path)
+        with self.timeline.span('unpack', 'phase', source=src_path):
+            extract_tarball(src_path, tmp_path, threaded=True)
+
+        for patch_name, patch_context in patches:
+            print('Applying %s patch' % patch_name)
+            with self.timeline.span('patch', 'phase', patch=patch_name):
+                apply_patch(tmp_path, patch_name, patch_context)
+
+        remove_path(tree_path)
+        rename(tmp_path, tree_path)
+
+        with open(manifest_path, 'w', encoding='utf-8') as fd:
+            json.dump(snapshot_tree(tree_path), fd)
+
+    def get_tree(self, src_path, src_hash, patches):
+        "Returns the path of the pristine tree for the given source and patches, creating it if needed."
+
+        make_dirs(self.path)
+        key = self._get_key(src_hash, patches)
+        tree_path = join(self.path, key)
+        manifest_path = self._get_manifest_path(tree_path)
+
+        #serialize creation between concurrent platform builds
+        with open(tree_path + '.lock', 'w') as lock_fd:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            if not self._is_intact(tree_path, manifest_path):
+                remove_path(manifest_path)
+                self._create_tree(src_path, patches, tree_path, manifest_path)
+
+        return tree_path
+
+    def clone(self, tree_path, dest):
+        "Clones a pristine tree to dest, which must not exist. Returns the clone mode used."
+
+        if self.clone_mode in ['auto', 'reflink'] and self._reflink_supported:
+            if _clone_reflink(tree_path, dest):
+                return 'reflink'
+            if self.clone_mode == 'reflink':
+                raise RuntimeError('Unable to reflink %s to %s' % (tree_path, dest))
+            self._reflink_supported = False
+
+        if self.clone_mode == 'hardlink':
+            try:
+                _clone_hardlink(tree_path, dest)
+                return 'hardlink'
+            except OSError as e:
+                #dest is on another filesystem, eg: a tmpfs scratch-path
+                if e.errno != errno.EXDEV:
+                    raise
+                remove_path(dest)
+
+        _clone_copy(tree_path, dest)
+        return 'copy'
+
+    def prepare(self, src_path, src_hash, patches, dest):
+        """
+        Replaces dest with a clone of the pristine, patched source tree.
+        Returns the pristine tree's path, to pass to check_tree after the build.
+        """
+
+        tree_path = self.get_tree(src_path, src_hash, patches)
+
+        remove_path(dest)
+        make_dirs(dirname(dest))
+        with self.timeline.span('clone', 'phase') as trace_args:
+            mode = self.clone(tree_path, dest)
+            trace_args['mode'] = mode
+        print('Cloned pristine %s -> %s (%s)' % (tree_path, dest, mode))
+
+        return tree_path
+
+    def check_tree(self, tree_path):
+        """
+        In hardlink mode, raises RuntimeError if the pristine tree was
+        modified (ie: a build wrote to a file it shares with the tree); the
+        tree is re-extracted by the next build using it.
+        """
+
+        if self.clone_mode != 'hardlink':
+            return
+
+        if not self._matches_manifest(tree_path):
+            raise RuntimeError('Pristine source tree %s was modified through a hardlinked build dir; builds cloned '
+                               'from it at the same time may be corrupt' % tree_path)
@@ -0,0 +1,118 @@
+import json
+import hashlib
+import threading
+from os import stat, replace, getpid
+from os.path import exists, dirname
+
+from utils import get_sha256_checksum, make_dirs
+
+
+class TaskStateStore(object):
+    """
+    Persistent record of the input fingerprints of each task's last
+    successful run, used to skip tasks whose inputs are unchanged and whose
+    outputs still exist.
+
+    File hashes are cached by (size, mtime) so unchanged inputs aren't
+    re-read on every run.
+
+    The duration of each task's (and each of its items', eg: platforms) last
+    run is also kept, for estimating and ordering later runs. A copy passed
+    to a worker process can be read but must not record anything.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._tasks = {}
+        self._files = {}
+        self._durations = {}
+
+        if exists(path):
+            with open(path, 'r', encoding='utf-8') as fd:
+                data = json.load(fd)
+            self._tasks = data.get('tasks', {})
+            self._files = data.get('files', {})
+            self._durations = data.get('durations', {})
+
+    def __getstate__(self):
+        with self._lock:
+            return {k: v for k, v in self.__dict__.items() if k != '_lock'}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _save(self):
+        make_dirs(dirname(self.path))
+        tmp_path = '%s.%d.tmp' % (self.path, getpid())
+        data = {'tasks': self._tasks, 'files': self._files, 'durations': self._durations}
+        with open(tmp_path, 'w', encoding='utf-8') as fd:
+            json.dump(data, fd, indent=2, sort_keys=True)
+        replace(tmp_path, self.path)
+
+    def get_file_checksum(self, path):
+        "Returns the SHA256 of the given file, or None if it doesn't exist."
+
+        try:
+            st = stat(path)
+        except FileNotFoundError:
+            return None
+
+        with self._lock:
+            cached = self._files.get(path)
+        if cached is not None and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+
+        checksum = get_sha256_checksum(path)
+        with self._lock:
+            self._files[path] = [st.st_size, st.st_mtime_ns, checksum]
+
+        return checksum
+
+    def get_fingerprint(self, task, task_context):
+        "Returns a hash of the task's declared input files and values."
+
+        inputs = [
+            sorted((path, self.get_file_checksum(path)) for path in task.get_inputs(task_context)),
+            task.get_input_values(task_context),
+        ]
+        return hashlib.sha256(json.dumps(inputs).encode('utf-8')).hexdigest()
+
+    def is_up_to_date(self, task, task_context, fingerprint):
+        "True if the task last succeeded with the given fingerprint and all its outputs exist."
+
+        outputs = task.get_outputs(task_context)
+        if not outputs:
+            return False
+
+        with self._lock:
+            record = self._tasks.get(task.name)
+
+        if record is None or record['fingerprint'] != fingerprint:
+            return False
+
+        return all(exists(path) for path in outputs)
+
+    def record(self, task, fingerprint):
+        "Records a successful run of the given task."
+
+        with self._lock:
+            self._tasks[task.name] = {'fingerprint': fingerprint}
+            self._save()
+
+    def _get_duration_key(self, task_name, item):
+        return task_name if item is None else '%s/%s' % (task_name, item)
+
+    def get_duration(self, task_name, item=None):
+        "Returns the duration in seconds of the last run of the task (or one of its items), or None."
+
+        with self._lock:
+            return self._durations.get(self._get_duration_key(task_name, item))
+
+    def record_duration(self, task_name, duration, item=None):
+        "Records how long a run of the task (or one of its items) took."
+
+        with self._lock:
+            self._durations[self._get_duration_key(task_name, item)] = round(duration, 3)
+            self._save()
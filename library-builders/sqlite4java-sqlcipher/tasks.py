@@ -1,5 +1,22 @@
+import heapq
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from timing import get_timeline
+
+
 class Task(object):
-    "Simple task with dependencies"
+    """
+    Simple task with dependencies
+
+    Tasks may declare input files, input values (eg: context entries) and
+    output paths; when run with a state store, a task whose inputs are
+    unchanged since its last successful run and whose outputs all exist is
+    skipped. Tasks declaring no outputs are always run.
+    """
+
+    #context keys whose values are part of this task's inputs
+    input_context_keys = []
 
     def __init__(self, name, description=None):
         self.name = name
@@ -12,15 +29,94 @@ class Task(object):
     def add_dependency(self, task_name):
         self.depends_on.add(task_name)
 
+    def get_inputs(self, task_context):
+        "Returns the paths of the files this task's outputs are derived from."
+        return []
+
+    def get_input_values(self, task_context):
+        "Returns JSON-serializable values this task's outputs are derived from."
+        return [task_context[key] for key in self.input_context_keys]
+
+    def get_outputs(self, task_context):
+        "Returns the paths of the files this task produces."
+        return []
+
+    def get_plan(self, task_context, state, dependencies_stale):
+        """
+        Returns (estimated duration or None, items) for running this task,
+        where items optionally break the task down as a list of (item name,
+        status, estimated duration or None), eg: one per platform.
+
+        dependencies_stale is True if a dependency producing outputs will be
+        run first, which may change this task's inputs.
+        """
+        return (state.get_duration(self.name) if state is not None else None), []
+
     def run(self, task_context):
         raise NotImplementedError()
 
 
+class TaskGraphError(Exception):
+    "Raised when the task graph references unknown tasks or contains a cycle."
+
+
+def get_critical_path_lengths(durations, dependencies):
+    """
+    Returns {name: length of the longest path from that node to the end of
+    the graph, including its own duration}, given {name: duration} and
+    {name: dependency names}.
+    """
+
+    dependents = {name: [] for name in durations}
+    for name in durations:
+        for dependency in dependencies.get(name, []):
+            if dependency in dependents:
+                dependents[dependency].append(name)
+
+    lengths = {}
+
+    def visit(name):
+        if name not in lengths:
+            lengths[name] = durations[name] + max([visit(d) for d in dependents[name]] or [0.0])
+        return lengths[name]
+
+    for name in durations:
+        visit(name)
+
+    return lengths
+
+
+def estimate_makespan(durations, dependencies, jobs):
+    """
+    Returns the simulated wall time of running every node with at most jobs
+    at once, starting ready nodes with the longest critical path first (which
+    for independent nodes is longest-processing-time-first ordering).
+    """
+
+    priorities = get_critical_path_lengths(durations, dependencies)
+    remaining = {name: set(d for d in dependencies.get(name, []) if d in durations) for name in durations}
+    running = []
+    now = 0.0
+
+    while remaining or running:
+        ready = sorted((name for name in remaining if not remaining[name]), key=lambda name: -priorities[name])
+        for name in ready[:jobs - len(running)]:
+            del remaining[name]
+            heapq.heappush(running, (now + durations[name], name))
+
+        now, name = heapq.heappop(running)
+        for names in remaining.values():
+            names.discard(name)
+
+    return now
+
+
 class Tasks(object):
     "Very simple lists of tasks"
 
     def __init__(self):
         self.tasks_by_name = {}
+        self.state = None
 
     def add(self, task):
         if task.name in self.tasks_by_name:
@@ -29,33 +125,188 @@ class Tasks(object):
         self.tasks_by_name[task.name] = task
 
     def _get_task_by_name(self, task_name):
-        return self.tasks_by_name[task_name]
+        try:
+            return self.tasks_by_name[task_name]
+        except KeyError:
+            raise TaskGraphError('Unknown task `%s`' % task_name)
+
+    def resolve(self, task_name):
+        """
+        Returns the names of the given task and all its transitive
+        dependencies in topological order (dependencies first).
+
+        Raises TaskGraphError if a dependency cycle is found.
+        """
+
+        order = []
+        #task name -> True while being visited, False once done
+        state = {}
+
+        def visit(name, path):
+            if state.get(name) is False:
+                return
+            if state.get(name) is True:
+                cycle = path[path.index(name):] + [name]
+                raise TaskGraphError('Dependency cycle detected: %s' % ' -> '.join(cycle))
 
-    def _run_task(self, task, tasks_completed, task_context):
-        for dependency_name in task.depends_on:
-            dependency = self._get_task_by_name(dependency_name)
+            task = self._get_task_by_name(name)
+            state[name] = True
+            for dependency_name in sorted(task.depends_on):
+                visit(dependency_name, path + [name])
+            state[name] = False
+            order.append(name)
 
-            if dependency.name in tasks_completed:
-                print('Task <<%s>> has already run, skipping' % dependency.name)
+        visit(task_name, [])
+
+        return order
+
+    def _run_task(self, task, task_context):
+        with get_timeline(task_context).span(task.name, 'task', task=task.name) as trace_args:
+            fingerprint = None
+            if self.state is not None and task.get_outputs(task_context):
+                fingerprint = self.state.get_fingerprint(task, task_context)
+                if self.state.is_up_to_date(task, task_context, fingerprint):
+                    print('Task <<%s>> is up to date, skipping' % task.name)
+                    trace_args['skipped'] = True
+                    return
+
+            print('Running task <<%s>>' % task.name)
+            start = time.time()
+            task.run(task_context)
+
+            if self.state is not None:
+                self.state.record_duration(task.name, time.time() - start)
+
+            if fingerprint is not None:
+                self.state.record(task, fingerprint)
+
+    def _run_serial(self, order, task_context):
+        for task_name in order:
+            self._run_task(self._get_task_by_name(task_name), task_context)
+
+    def _get_priorities(self, order):
+        "Returns each task's critical path length based on the durations of previous runs."
+
+        durations = {}
+        for name in order:
+            duration = self.state.get_duration(name) if self.state is not None else None
+            durations[name] = duration or 0.0
+
+        return get_critical_path_lengths(durations, {name: self._get_task_by_name(name).depends_on for name in order})
+
+    def _run_parallel(self, order, task_context, jobs):
+        remaining = {name: set(self._get_task_by_name(name).depends_on) for name in order}
+        running = {}
+        failure = None
+        priorities = self._get_priorities(order)
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            while remaining or running:
+                if failure is None:
+                    #start the ready tasks with the longest (historical) critical path first,
+                    #otherwise keep topological order for deterministic starts
+                    ready = [name for name in order if name in remaining and not remaining[name]]
+                    ready.sort(key=lambda name: -priorities[name])
+                    for name in ready[:jobs - len(running)]:
+                        del remaining[name]
+                        task = self._get_task_by_name(name)
+                        running[executor.submit(self._run_task, task, task_context)] = name
+                elif not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    exc = future.exception()
+                    if exc is not None:
+                        print('Task <<%s>> failed: %s' % (name, exc))
+                        if failure is None:
+                            failure = exc
+                        continue
+
+                    for dependencies in remaining.values():
+                        dependencies.discard(name)
+
+        if failure is not None:
+            raise failure
+
+    def get_dependencies(self, task_name):
+        "Returns {task name: dependency names} for the given task and its transitive dependencies."
+        return {name: sorted(self._get_task_by_name(name).depends_on) for name in self.resolve(task_name)}
+
+    def plan(self, task_name, task_context, jobs=1, state=None):
+        """
+        Works out what running the given task would do, without running
+        anything. Returns a dict with:
+
+            tasks: list of (task name, status, estimated duration or None,
+                   items) in run order; status is one of up-to-date, stale
+                   or always-run (tasks without declared outputs), and items
+                   are as returned by Task.get_plan
+            estimate: simulated wall time of the run with the given jobs
+            lower-bound: the critical path, ie: the wall time with unlimited jobs
+        """
+
+        for task in self.tasks_by_name.values():
+            task.configure(task_context)
+
+        order = self.resolve(task_name)
+        dependencies = {name: self._get_task_by_name(name).depends_on for name in order}
+        stale = set()
+        durations = {}
+        entries = []
+
+        for name in order:
+            task = self._get_task_by_name(name)
+            has_outputs = len(task.get_outputs(task_context)) > 0
+            dependencies_stale = any(d in stale for d in task.depends_on)
+
+            if (state is not None and has_outputs and not dependencies_stale and
+                    state.is_up_to_date(task, task_context, state.get_fingerprint(task, task_context))):
+                entries.append((name, 'up-to-date', 0.0, []))
+                durations[name] = 0.0
                 continue
 
-            self._run_task(dependency, tasks_completed, task_context)
+            if has_outputs:
+                stale.add(name)
 
-            tasks_completed.add(dependency.name)
+            estimate, items = task.get_plan(task_context, state, dependencies_stale)
+            entries.append((name, 'stale' if has_outputs else 'always-run', estimate, items))
+            durations[name] = estimate or 0.0
 
-        print('Running task <<%s>>' % task.name)
-        task.run(task_context)
+        return {
+            'tasks': entries,
+            'estimate': estimate_makespan(durations, dependencies, jobs),
+            'lower-bound': max(get_critical_path_lengths(durations, dependencies).values()),
+        }
 
     def print_tasks(self, indent_level=0):
         for task_name, task in self.tasks_by_name.items():
             print('%s%s: %s' % ('  '*indent_level, task_name, task.description))
 
-    def run(self, task_name, task_context):
+    def run(self, task_name, task_context, jobs=1, state=None):
+        """
+        Runs the given task after all of its dependencies.
+
+        Up to `jobs` tasks whose dependencies have completed are run
+        concurrently; jobs=1 runs everything serially in topological order.
+
+        If a TaskStateStore is given, up-to-date tasks are skipped and
+        successful runs are recorded to it. If the context has a `timeline`
+        (see timing.Timeline), each task is recorded to it.
+        """
+
+        if jobs < 1:
+            raise ValueError('jobs must be >= 1')
+
+        self.state = state
+
         for task in self.tasks_by_name.values():
             task.configure(task_context)
 
-        task = self._get_task_by_name(task_name)
-
-        tasks_completed = set()
+        order = self.resolve(task_name)
 
-        self._run_task(task, tasks_completed, task_context)
+        if jobs == 1:
+            self._run_serial(order, task_context)
+        else:
+            self._run_parallel(order, task_context, jobs)
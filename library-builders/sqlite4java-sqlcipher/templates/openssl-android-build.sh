@@ -1,13 +1,38 @@
 #!/bin/bash
 #no -eu since setenv-android fails otherwise
 
-#CAST causes some text relocations to be generated so we need to disable it
-OPENSSL_CONFIGURE_OPTIONS="no-ssl2 no-ssl3 no-cast no-comp no-dso no-hw no-engine no-shared"
+OPENSSL_CONFIGURE_OPTIONS="{{configure-options}}"
+MINIMAL_INSTALL={{minimal-install}}
 
 export ANDROID_SDK_ROOT={{sdk-root}}
 export ANDROID_NDK_ROOT={{ndk-root}}
 
 . setenv-android.sh
-./config $OPENSSL_CONFIGURE_OPTIONS --prefix="{{prefix}}" -fPIC
-make depend
-make install
+
+#NDK r16+ only ship unified headers (in sysroot/, with the API level given as a
+#define); the libraries are still per API level in ANDROID_DEV. The android
+#openssl targets add ANDROID_DEV themselves, the linux one used for x86_64
+#needs it passed.
+if [ -d "$ANDROID_DEV/include" ]; then
+    NDK_CFLAGS="-I$ANDROID_DEV/include"
+else
+    NDK_CFLAGS="-isystem $ANDROID_NDK_ROOT/sysroot/usr/include/${CROSS_COMPILE%-} -isystem $ANDROID_NDK_ROOT/sysroot/usr/include -D__ANDROID_API__=${ANDROID_API#android-}"
+fi
+
+#the target is given explicitly since ./config picks the generic android target
+#(without any assembly) for some ABIs
+./Configure {{target}} $OPENSSL_CONFIGURE_OPTIONS --prefix="{{prefix}}" -fPIC $NDK_CFLAGS -B$ANDROID_DEV/lib {{size-cflags}}
+#the 1.0.2 makefiles are only safe to run in parallel for the libraries, so
+#depend and install (which also builds apps and tests) are run serially
+env -u MAKEFLAGS make depend
+#CC is overridden on the command line so it also reaches the sub-makes
+if [ "$MINIMAL_INSTALL" = yes ]; then
+    #only libcrypto and the headers are used, by sqlcipher and sqlite4java
+    make build_crypto CC="{{cc-launcher}}${CROSS_COMPILE}gcc"
+    mkdir -p "{{prefix}}/lib" "{{prefix}}/include/openssl"
+    cp -p libcrypto.a "{{prefix}}/lib/"
+    cp -L include/openssl/*.h "{{prefix}}/include/openssl/"
+else
+    make build_libs CC="{{cc-launcher}}${CROSS_COMPILE}gcc"
+    env -u MAKEFLAGS make install
+fi
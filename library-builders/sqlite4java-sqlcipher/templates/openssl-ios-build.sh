@@ -2,4 +2,11 @@
 
 export CONFIG_OPTIONS="{{configure-options}}"
 ./build-libssl.sh --branch=1.0.2 --archs="armv7 armv7s arm64 x86_64 i386" --tvos-sdk=''
-mv lib include bin "{{prefix}}/"
+if [ "{{minimal-install}}" = yes ]; then
+    #only libcrypto and the headers are used, by sqlcipher and sqlite4java
+    mkdir -p "{{prefix}}/lib"
+    mv lib/libcrypto.a "{{prefix}}/lib/"
+    mv include "{{prefix}}/"
+else
+    mv lib include bin "{{prefix}}/"
+fi
@@ -2,6 +2,7 @@
 set -eu
 
 OPENSSL_CONFIGURE_OPTIONS="{{configure-options}}"
+MINIMAL_INSTALL={{minimal-install}}
 
 #using --cross-compile-prefix causes the build system to attempt to call
 #`makedepend`, which no longer exists on modern OSX versions
@@ -9,5 +10,18 @@ export CC=x86_64-apple-darwin15-clang
 export AR=x86_64-apple-darwin15-ar
 export RANLIB=x86_64-apple-darwin15-ranlib
 
-./Configure darwin64-x86_64-cc $OPENSSL_CONFIGURE_OPTIONS --prefix="{{prefix}}" -fPIC
-make depend install
+./Configure darwin64-x86_64-cc $OPENSSL_CONFIGURE_OPTIONS --prefix="{{prefix}}" -fPIC {{size-cflags}}
+#the 1.0.2 makefiles are only safe to run in parallel for the libraries, so
+#depend and install (which also builds apps and tests) are run serially
+env -u MAKEFLAGS make depend
+#CC is overridden on the command line so it also reaches the sub-makes
+if [ "$MINIMAL_INSTALL" = yes ]; then
+    #only libcrypto and the headers are used, by sqlcipher and sqlite4java
+    make build_crypto CC="{{cc-launcher}}$CC"
+    mkdir -p "{{prefix}}/lib" "{{prefix}}/include/openssl"
+    cp -p libcrypto.a "{{prefix}}/lib/"
+    cp -L include/openssl/*.h "{{prefix}}/include/openssl/"
+else
+    make build_libs CC="{{cc-launcher}}$CC"
+    env -u MAKEFLAGS make install
+fi
@@ -2,9 +2,23 @@
 set -eu
 
 OPENSSL_CONFIGURE_OPTIONS="{{configure-options}}"
+MINIMAL_INSTALL={{minimal-install}}
 
 #-DOPENSSL_SYS_WIN32_CYGWIN is used to remove a dependency on gdi
 #if this isn't set, RAND_screen will call out to gdi to read the contents of the screen
 #as this function is unused in openssl itself and in sqlcipher, there's no harm in doing this
-./Configure mingw64 $OPENSSL_CONFIGURE_OPTIONS --prefix="{{prefix}}" --cross-compile-prefix=x86_64-w64-mingw32- -DOPENSSL_SYS_WIN32_CYGWIN
-make depend install
+./Configure mingw64 $OPENSSL_CONFIGURE_OPTIONS --prefix="{{prefix}}" --cross-compile-prefix=x86_64-w64-mingw32- -DOPENSSL_SYS_WIN32_CYGWIN {{size-cflags}}
+#the 1.0.2 makefiles are only safe to run in parallel for the libraries, so
+#depend and install (which also builds apps and tests) are run serially
+env -u MAKEFLAGS make depend
+#CC is overridden on the command line so it also reaches the sub-makes
+if [ "$MINIMAL_INSTALL" = yes ]; then
+    #only libcrypto and the headers are used, by sqlcipher and sqlite4java
+    make build_crypto CC="{{cc-launcher}}x86_64-w64-mingw32-gcc"
+    mkdir -p "{{prefix}}/lib" "{{prefix}}/include/openssl"
+    cp -p libcrypto.a "{{prefix}}/lib/"
+    cp -L include/openssl/*.h "{{prefix}}/include/openssl/"
+else
+    make build_libs CC="{{cc-launcher}}x86_64-w64-mingw32-gcc"
+    env -u MAKEFLAGS make install
+fi
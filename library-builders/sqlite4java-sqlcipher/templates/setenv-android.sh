@@ -1,5 +1,5 @@
 #!/bin/bash
-# Cross-compile environment for Android on ARMv7 and x86
+# Cross-compile environment for Android on ARMv7, ARMv8 (arm64), x86 and x86_64
 #
 # Contents licensed under the terms of the OpenSSL license
 # http://www.openssl.org/source/license.html
@@ -124,6 +124,12 @@ case $_ANDROID_ARCH in
 	arch-x86)
       ANDROID_TOOLS="i686-linux-android-gcc i686-linux-android-ranlib i686-linux-android-ld"
 	  ;;
+	arch-arm64)
+      ANDROID_TOOLS="aarch64-linux-android-gcc aarch64-linux-android-ranlib aarch64-linux-android-ld"
+	  ;;
+	arch-x86_64)
+      ANDROID_TOOLS="x86_64-linux-android-gcc x86_64-linux-android-ranlib x86_64-linux-android-ld"
+	  ;;
 	*)
 	  echo "ERROR ERROR ERROR"
 	  ;;
@@ -206,6 +212,22 @@ if [ "$_ANDROID_ARCH" == "arch-x86" ]; then
 	export CROSS_COMPILE="i686-linux-android-"
 fi
 
+if [ "$_ANDROID_ARCH" == "arch-arm64" ]; then
+	export MACHINE=aarch64
+	export RELEASE=2.6.37
+	export SYSTEM=android
+	export ARCH=arm64
+	export CROSS_COMPILE="aarch64-linux-android-"
+fi
+
+if [ "$_ANDROID_ARCH" == "arch-x86_64" ]; then
+	export MACHINE=x86_64
+	export RELEASE=2.6.37
+	export SYSTEM=android
+	export ARCH=x86_64
+	export CROSS_COMPILE="x86_64-linux-android-"
+fi
+
 # For the Android toolchain
 # https://android.googlesource.com/platform/ndk/+/ics-mr0/docs/STANDALONE-TOOLCHAIN.html
 export ANDROID_SYSROOT="$ANDROID_NDK_ROOT/platforms/$_ANDROID_API/$_ANDROID_ARCH"
@@ -0,0 +1,14 @@
+#!/bin/bash
+set -eu
+
+#configure passes the SQLITE_OMIT/SQLITE_ENABLE defines in CFLAGS on to lemon
+#and mkkeywordhash, which is all that makes the amalgamation depend on them
+export CFLAGS="{{feature-flags}}"
+
+#generating the sources doesn't link anything, so no crypto library (and no
+#openssl development files on the host) is needed
+./configure --disable-tcl --disable-shared --with-crypto-lib=none
+make sqlite3.c sqlite3.h
+
+mkdir -p "{{output-dir}}"
+cp sqlite3.c sqlite3.h "{{output-dir}}/"
@@ -2,10 +2,21 @@
 set -eu
 
 PREFIX="{{prefix}}"
+#openssl is installed in the platform prefix, which differs from PREFIX for variants
+DEPS_PREFIX="{{deps-prefix}}"
+MINIMAL_INSTALL={{minimal-install}}
+#sqlite3.c/h are generated once, for every platform, by prepare-sqlcipher-amalgamation;
+#-o stops make from regenerating them, which needs tclsh and host-built tools
+AMALGAMATION_DIR="{{amalgamation-dir}}"
+AMALGAMATION_MAKE_ARGS="-o .target_source -o sqlite3.c -o sqlite3.h"
+#configure results are cached per platform, toolchain and flags; a failed
+#configure removes its cache so the next run probes from scratch
+AUTOCONF_CACHE="{{autoconf-cache}}"
+mkdir -p "$(dirname "$AUTOCONF_CACHE")"
 INSTALL_ROOT="$(pwd)/prefix"
 
-INC_DIRS="-I$PREFIX/include"
-LIB_DIRS="-L$PREFIX/lib"
+INC_DIRS="-I$DEPS_PREFIX/include"
+LIB_DIRS="-L$DEPS_PREFIX/lib"
 
 IOS_TARGET=7.0
 HOST=arm-apple-darwin
@@ -14,13 +25,21 @@ buildForSDK() {
     local SDK="$1"
     local ARCH_FLAGS="$2"
 
-    export CC="$(xcrun --sdk $SDK --find clang) -isysroot $(xcrun --sdk $SDK --show-sdk-path)"
+    export CC="{{cc-launcher}}$(xcrun --sdk $SDK --find clang) -isysroot $(xcrun --sdk $SDK --show-sdk-path)"
     export CPP="$(xcrun --sdk $SDK --find cc) -E"
 
-    export CFLAGS="$INC_DIRS $LIB_DIRS -fembed-bitcode -DSQLITE_TEMP_STORE=3 -DSQLITE_ENABLE_COLUMN_METADATA -DSQLITE_HAS_CODEC -DSQLITE_OMIT_DEPRECATED $ARCH_FLAGS -mios-version-min=$IOS_TARGET"
+    export CFLAGS="$INC_DIRS $LIB_DIRS -fembed-bitcode {{sqlcipher-cflags}} $ARCH_FLAGS -mios-version-min=$IOS_TARGET"
 
-    ./configure --host=$HOST --disable-tcl --disable-editline --disable-readline --disable-shared --prefix="$INSTALL_ROOT/$SDK" --enable-tempstore=yes
-    make install
+    ./configure --host=$HOST --disable-tcl --disable-editline --disable-readline --disable-shared --prefix="$INSTALL_ROOT/$SDK" --enable-tempstore=yes --cache-file="$AUTOCONF_CACHE-$SDK.cache" || { rm -f "$AUTOCONF_CACHE-$SDK.cache"; exit 1; }
+    cp "$AMALGAMATION_DIR/sqlite3.c" "$AMALGAMATION_DIR/sqlite3.h" .
+    if [ "$MINIMAL_INSTALL" = yes ]; then
+        #only the library and its header are used, by sqlite4java
+        make $AMALGAMATION_MAKE_ARGS lib_install
+        mkdir -p "$INSTALL_ROOT/$SDK/include/sqlcipher"
+        cp sqlite3.h "$INSTALL_ROOT/$SDK/include/sqlcipher/"
+    else
+        make $AMALGAMATION_MAKE_ARGS install
+    fi
 
     make clean
 }
@@ -28,4 +47,8 @@ buildForSDK() {
 buildForSDK iphoneos "-arch armv7 -arch armv7s -arch arm64"
 buildForSDK iphonesimulator "-arch x86_64 -arch i386"
 
+mkdir -p "$PREFIX/lib"
 lipo -create "$INSTALL_ROOT/iphoneos/lib/libsqlcipher.a" "$INSTALL_ROOT/iphonesimulator/lib/libsqlcipher.a" -output "$PREFIX/lib/libsqlcipher.a"
+#the header is generated, and removed by make clean
+mkdir -p "$PREFIX/include/sqlcipher"
+cp "$INSTALL_ROOT/iphoneos/include/sqlcipher/sqlite3.h" "$PREFIX/include/sqlcipher/"
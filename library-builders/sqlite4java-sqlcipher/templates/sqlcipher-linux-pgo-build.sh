@@ -0,0 +1,60 @@
+#!/bin/bash
+set -eu
+
+PREFIX="{{prefix}}"
+#openssl is installed in the platform prefix, which differs from PREFIX for variants
+DEPS_PREFIX="{{deps-prefix}}"
+MINIMAL_INSTALL={{minimal-install}}
+#sqlite3.c/h are generated once, for every platform, by prepare-sqlcipher-amalgamation;
+#-o stops make from regenerating them, which needs tclsh and host-built tools
+AMALGAMATION_DIR="{{amalgamation-dir}}"
+AMALGAMATION_MAKE_ARGS="-o .target_source -o sqlite3.c -o sqlite3.h"
+#configure results are cached per platform, toolchain and flags; a failed
+#configure removes its cache so the next run probes from scratch
+AUTOCONF_CACHE="{{autoconf-cache}}"
+mkdir -p "$(dirname "$AUTOCONF_CACHE")"
+INC_DIRS="-I$DEPS_PREFIX/include "
+LIB_DIRS="-L$DEPS_PREFIX/lib "
+
+PROFILE_DIR="$(pwd)/pgo-profile"
+TRAIN_DIR="$(pwd)/pgo-train"
+BASE_CFLAGS="$INC_DIRS $LIB_DIRS {{sqlcipher-cflags}} -fPIC"
+
+export CC="{{cc-launcher}}gcc"
+export CPPFLAGS="$BASE_CFLAGS"
+
+rm -rf "$PROFILE_DIR" "$TRAIN_DIR"
+mkdir -p "$TRAIN_DIR"
+
+#1) instrumented build; libtool may drop -fprofile-generate when linking, so
+#link libgcov explicitly
+export CFLAGS="$BASE_CFLAGS -fprofile-generate=$PROFILE_DIR"
+LIBS="-lgcov" ./configure --disable-tcl --disable-shared --prefix="$PREFIX" --enable-tempstore=yes --cache-file="$AUTOCONF_CACHE-instrumented.cache" || { rm -f "$AUTOCONF_CACHE-instrumented.cache"; exit 1; }
+cp "$AMALGAMATION_DIR/sqlite3.c" "$AMALGAMATION_DIR/sqlite3.h" .
+make $AMALGAMATION_MAKE_ARGS
+
+#2) run the training workload through the shell, which links the instrumented lib
+SHELL_BIN=./sqlcipher
+if [ ! -x "$SHELL_BIN" ]; then
+    SHELL_BIN=./sqlite3
+fi
+
+for i in 1 2 3 4 5; do
+    "$SHELL_BIN" -bail "$TRAIN_DIR/messages.db" < sqlcipher-train-insert.sql > /dev/null
+done
+"$SHELL_BIN" -bail "$TRAIN_DIR/messages.db" < sqlcipher-train-select.sql > /dev/null
+"$SHELL_BIN" -bail "$TRAIN_DIR/messages.db" < sqlcipher-train-scan.sql > /dev/null
+
+#3) rebuild using the collected profile
+make distclean
+export CFLAGS="$BASE_CFLAGS -fprofile-use=$PROFILE_DIR -fprofile-correction"
+./configure --disable-tcl --disable-shared --prefix="$PREFIX" --enable-tempstore=yes --cache-file="$AUTOCONF_CACHE.cache" || { rm -f "$AUTOCONF_CACHE.cache"; exit 1; }
+cp "$AMALGAMATION_DIR/sqlite3.c" "$AMALGAMATION_DIR/sqlite3.h" .
+if [ "$MINIMAL_INSTALL" = yes ]; then
+    #only the library and its header are used, by sqlite4java and bench-sqlcipher
+    make $AMALGAMATION_MAKE_ARGS lib_install
+    mkdir -p "$PREFIX/include/sqlcipher"
+    cp sqlite3.h "$PREFIX/include/sqlcipher/"
+else
+    make $AMALGAMATION_MAKE_ARGS install
+fi
@@ -2,17 +2,36 @@
 set -eu
 
 PREFIX="{{prefix}}"
-INC_DIRS="-I$PREFIX/include"
-LIB_DIRS="-L$PREFIX/lib"
+#openssl is installed in the platform prefix, which differs from PREFIX for variants
+DEPS_PREFIX="{{deps-prefix}}"
+MINIMAL_INSTALL={{minimal-install}}
+#sqlite3.c/h are generated once, for every platform, by prepare-sqlcipher-amalgamation;
+#-o stops make from regenerating them, which needs tclsh and host-built tools
+AMALGAMATION_DIR="{{amalgamation-dir}}"
+AMALGAMATION_MAKE_ARGS="-o .target_source -o sqlite3.c -o sqlite3.h"
+#configure results are cached per platform, toolchain and flags; a failed
+#configure removes its cache so the next run probes from scratch
+AUTOCONF_CACHE="{{autoconf-cache}}"
+mkdir -p "$(dirname "$AUTOCONF_CACHE")"
+INC_DIRS="-I$DEPS_PREFIX/include"
+LIB_DIRS="-L$DEPS_PREFIX/lib"
 
 #FIXME
 #since we're not using gcc, I can't find a way to tell configure to check for
 #<host>-cc, so doing this instead
 HOST=x86_64-apple-darwin15
-export CC=${HOST}-clang
+export CC="{{cc-launcher}}${HOST}-clang"
 
-export CFLAGS="$INC_DIRS $LIB_DIRS -DSQLITE_TEMP_STORE=3 -DSQLITE_ENABLE_COLUMN_METADATA -DSQLITE_HAS_CODEC -DSQLITE_OMIT_DEPRECATED -fPIC"
+export CFLAGS="$INC_DIRS $LIB_DIRS {{sqlcipher-cflags}} -fPIC"
 export CPPFLAGS="$CFLAGS"
 
-./configure --host=$HOST --disable-tcl --disable-shared --prefix="$PREFIX" --enable-tempstore=yes
-make install
+./configure --host=$HOST --disable-tcl --disable-shared --prefix="$PREFIX" --enable-tempstore=yes --cache-file="$AUTOCONF_CACHE.cache" || { rm -f "$AUTOCONF_CACHE.cache"; exit 1; }
+cp "$AMALGAMATION_DIR/sqlite3.c" "$AMALGAMATION_DIR/sqlite3.h" .
+if [ "$MINIMAL_INSTALL" = yes ]; then
+    #only the library and its header are used, by sqlite4java and bench-sqlcipher
+    make $AMALGAMATION_MAKE_ARGS lib_install
+    mkdir -p "$PREFIX/include/sqlcipher"
+    cp sqlite3.h "$PREFIX/include/sqlcipher/"
+else
+    make $AMALGAMATION_MAKE_ARGS install
+fi
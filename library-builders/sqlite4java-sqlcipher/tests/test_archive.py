@@ -0,0 +1,147 @@
+import shutil
+import struct
+import subprocess
+import tempfile
+import unittest
+from os.path import join
+
+from archive import (AR_MAGIC, FAT_MAGIC, ArchiveError, get_archive_symbols, find_missing_symbols, get_elf_machines,
+                     get_elf_symbol_sizes)
+
+
+def ar_member(name, data):
+    "Returns an ar member with a 60 byte header, padded to an even size."
+
+    header = '%-16s%-12s%-6s%-6s%-8s%-10s`\n' % (name, 0, 0, 0, 644, len(data))
+    return header.encode('ascii') + data + (b'\n' if len(data) % 2 else b'')
+
+
+def bsd_archive(symbols):
+    "Returns a BSD archive with a __.SYMDEF SORTED index (stored under a #1/ long name) of the given symbols."
+
+    strtab = b''.join(s.encode('ascii') + b'\0' for s in symbols)
+    ranlibs = b''
+    offset = 0
+    for s in symbols:
+        ranlibs += struct.pack('<II', offset, 0)
+        offset += len(s) + 1
+
+    name = b'__.SYMDEF SORTED'.ljust(20, b'\0')
+    index = name + struct.pack('<I', len(ranlibs)) + ranlibs + struct.pack('<I', len(strtab)) + strtab
+    return AR_MAGIC + ar_member('#1/%d' % len(name), index)
+
+
+def fat_binary(archives):
+    "Returns a universal binary holding the given archives."
+
+    header = FAT_MAGIC + struct.pack('>I', len(archives))
+    offset = len(header) + 20 * len(archives)
+    data = b''
+    for archive in archives:
+        header += struct.pack('>5I', 7, 3, offset + len(data), len(archive), 0)
+        data += archive
+    return header + data
+
+
+@unittest.skipUnless(shutil.which('cc') and shutil.which('ar'), 'cc and ar are required')
+class CompiledArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        source = join(self.dir, 'lib.c')
+        with open(source, 'w') as fd:
+            fd.write('int table[100] = {1};\n'
+                     'int aes_encrypt(int x) { return x + table[x]; }\n'
+                     'static int helper(int x) { return x * 2; }\n'
+                     'int sha1_update(int x) { return helper(x); }\n'
+                     'extern int undefined_symbol(int);\n'
+                     'int uses_undefined(int x) { return undefined_symbol(x); }\n')
+
+        self.object = join(self.dir, 'lib.o')
+        subprocess.check_call(['cc', '-c', '-O0', '-fPIC', source, '-o', self.object])
+
+    def _ar(self, *flags):
+        path = join(self.dir, 'lib.a')
+        subprocess.check_call(['ar'] + list(flags) + [path, self.object])
+        return path
+
+    def test_gnu_archive_symbols(self):
+        path = self._ar('rcs')
+        symbols = get_archive_symbols(path)
+        self.assertEqual(symbols, {'table', 'aes_encrypt', 'sha1_update', 'uses_undefined'})
+        self.assertEqual(find_missing_symbols(path, ['aes_encrypt', 'helper', 'aes_v8_encrypt']),
+                         ['helper', 'aes_v8_encrypt'])
+
+    def test_archive_without_index(self):
+        path = self._ar('rcS')
+        with self.assertRaises(ArchiveError) as cm:
+            get_archive_symbols(path)
+        self.assertIn('no symbol index', str(cm.exception))
+
+    def test_elf_machines(self):
+        machines = get_elf_machines(self._ar('rcs'))
+        self.assertEqual(len(machines), 1)
+        self.assertNotIn('unknown', list(machines)[0])
+
+    def test_symbol_sizes(self):
+        lib = join(self.dir, 'lib.so')
+        subprocess.check_call(['cc', '-shared', self.object, '-o', lib])
+
+        sizes = get_elf_symbol_sizes(lib)
+        self.assertEqual(sizes['table'], 400)
+        self.assertGreater(sizes['aes_encrypt'], 0)
+        self.assertIn('helper', sizes)
+        self.assertNotIn('undefined_symbol', sizes)
+
+        #stripped libraries fall back to the dynamic symbol table
+        subprocess.check_call(['strip', lib])
+        sizes = get_elf_symbol_sizes(lib)
+        self.assertEqual(sizes['table'], 400)
+        self.assertNotIn('helper', sizes)
+
+
+class ArchiveIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def _write(self, data):
+        path = join(self.dir, 'lib.a')
+        with open(path, 'wb') as fd:
+            fd.write(data)
+        return path
+
+    def test_gnu_64_bit_index(self):
+        names = b'_aes_encrypt\0_sha1_update\0'
+        index = struct.pack('>QQQ', 2, 0, 0) + names
+        path = self._write(AR_MAGIC + ar_member('/SYM64/', index))
+        self.assertEqual(get_archive_symbols(path), {'_aes_encrypt', '_sha1_update'})
+
+    def test_bsd_index(self):
+        path = self._write(bsd_archive(['_aes_encrypt', '_sha1_update']))
+        self.assertEqual(get_archive_symbols(path), {'_aes_encrypt', '_sha1_update'})
+        #mach-o symbols have a leading underscore
+        self.assertEqual(find_missing_symbols(path, ['aes_encrypt', 'sha256_update']), ['sha256_update'])
+
+    def test_fat_archive(self):
+        path = self._write(fat_binary([bsd_archive(['_aes_encrypt']), bsd_archive(['_aesv8_encrypt'])]))
+        self.assertEqual(get_archive_symbols(path), {'_aes_encrypt', '_aesv8_encrypt'})
+
+    def test_not_an_archive(self):
+        path = self._write(b'not an archive')
+        self.assertRaises(ArchiveError, get_archive_symbols, path)
+
+    def test_truncated_fat_archive(self):
+        path = self._write(FAT_MAGIC + struct.pack('>I', 1))
+        self.assertRaises(ArchiveError, get_archive_symbols, path)
+
+    def test_elf_machines_of_non_elf_file(self):
+        self.assertEqual(get_elf_machines(self._write(b'not an elf file')), set())
+
+    def test_symbol_sizes_of_non_elf_file(self):
+        path = self._write(b'not an elf file')
+        self.assertRaises(ArchiveError, get_elf_symbol_sizes, path)
+
+
+if __name__ == '__main__':
+    unittest.main()
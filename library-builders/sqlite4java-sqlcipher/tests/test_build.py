@@ -0,0 +1,137 @@
+import os
+import shutil
+import tempfile
+import unittest
+from os.path import dirname, join
+from unittest import mock
+
+from build import BuildSQLCipher, BuildSQLite4JavaTask, compare_bench_results, compare_size_reports
+from config import process_config_file
+
+
+def create_context(**options):
+    config = {
+        'root': '/build',
+        'android-ndk-home': '/ndk',
+        'android-sdk-home': '/sdk',
+        'groovy-home': '/groovy',
+        'libtool-home': '/libtool',
+        'platforms': 'linux-x86_64, android-x86',
+        'linux-jdk-home': '/jdk',
+        'osx-jdk-home': '/jdk',
+        'win32-jdk-home': '/jdk',
+        'gant-home': '/gant',
+    }
+    config.update(options)
+    return process_config_file(config)
+
+
+class AutoconfCacheTest(unittest.TestCase):
+    def test_cache_depends_on_flags_and_toolchain(self):
+        task = BuildSQLCipher()
+        context = create_context()
+        path = task.get_autoconf_cache(context, 'linux-x86_64', None)
+
+        self.assertEqual(dirname(path), '/build/cache/autoconf')
+        self.assertEqual(path, task.get_autoconf_cache(create_context(), 'linux-x86_64', None))
+        self.assertNotEqual(path, task.get_autoconf_cache(context, 'linux-x86_64', 'release'))
+        self.assertNotEqual(path, task.get_autoconf_cache(create_context(**{'sqlcipher-profile': 'release'}),
+                                                          'linux-x86_64', None))
+
+        android_path = task.get_autoconf_cache(context, 'android-x86', None)
+        self.assertNotEqual(android_path, task.get_autoconf_cache(create_context(**{'android-ndk-home': '/ndk-r12'}),
+                                                                  'android-x86', None))
+
+
+class BuildSQLite4JavaTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.context = create_context(root=self.dir)
+        self.task = BuildSQLite4JavaTask()
+
+    def _touch(self, path, data='x'):
+        os.makedirs(dirname(path), exist_ok=True)
+        with open(path, 'w') as fd:
+            fd.write(data)
+
+    def _build(self, task_context, src_path, platform, print_tail=True):
+        for path in self.task._get_platform_outputs(task_context, platform):
+            self._touch(path)
+        key = self.task.get_platform_key(task_context, platform)
+        self._touch(self.task._get_stamp_path(task_context, platform), key)
+        return 1.0
+
+    def _run(self):
+        with mock.patch.object(self.task, '_build_platform', side_effect=self._build) as build_platform:
+            self.task.run(self.context)
+        return [call[0][2] for call in build_platform.call_args_list]
+
+    def test_only_out_of_date_platforms_are_rebuilt(self):
+        for platform in self.context['platforms']:
+            self._touch(join(self.context['root-prefix-path'], platform, 'lib', 'libsqlcipher.a'))
+        self.assertEqual(self._run(), ['linux-x86_64', 'android-x86'])
+        self.assertEqual(self._run(), [])
+
+        #a rebuilt dependency
+        self._touch(join(self.context['root-prefix-path'], 'android-x86', 'lib', 'libsqlcipher.a'), 'y')
+        self.assertEqual(self._run(), ['android-x86'])
+
+        #a missing output
+        os.remove(self.task._get_platform_outputs(self.context, 'linux-x86_64')[0])
+        self.assertEqual(self._run(), ['linux-x86_64'])
+
+    def test_plan(self):
+        self._run()
+        self._touch(join(self.context['root-prefix-path'], 'android-x86', 'lib', 'libsqlcipher.a'), 'y')
+
+        _, items = self.task.get_plan(self.context, None, False)
+        self.assertEqual(items, [('linux-x86_64', 'up-to-date', 0.0), ('android-x86', 'build', None)])
+        _, items = self.task.get_plan(self.context, None, True)
+        self.assertEqual([status for _, status, _ in items], ['build', 'build'])
+
+
+class CompareBenchResultsTest(unittest.TestCase):
+    def test_changes_are_positive_for_improvements(self):
+        baseline = {'linux': {'4096/64000': {'open-ms': 100.0, 'insert-rows-per-s': 1000.0,
+                                             'lookup-us': 10.0, 'scan-mb-per-s': 50.0}}}
+        results = {'linux': {'4096/64000': {'open-ms': 50.0, 'insert-rows-per-s': 1500.0,
+                                            'lookup-us': 20.0, 'scan-mb-per-s': 50.0}}}
+
+        self.assertEqual(compare_bench_results(results, baseline), {'linux': {'4096/64000': {
+            'open-ms': 100.0,
+            'insert-rows-per-s': 50.0,
+            'lookup-us': -50.0,
+            'scan-mb-per-s': 0.0,
+        }}})
+
+    def test_missing_baselines_and_zero_values_are_skipped(self):
+        results = {'linux': {'1024/4000': {'open-ms': 0.0, 'insert-rows-per-s': 10.0,
+                                           'lookup-us': 1.0, 'scan-mb-per-s': 1.0}},
+                   'osx': {'1024/4000': {}}}
+        baseline = {'linux': {'1024/4000': {'open-ms': 1.0, 'insert-rows-per-s': 5.0}}}
+
+        self.assertEqual(compare_bench_results(results, baseline), {'linux': {'1024/4000': {
+            'insert-rows-per-s': 100.0,
+        }}})
+
+
+class CompareSizeReportsTest(unittest.TestCase):
+    def test_symbol_changes(self):
+        libraries = {'linux': {'size': 900, 'symbols': {'a': 100, 'b': 50, 'added': 10}}}
+        previous = {'linux': {'size': 1000, 'symbols': {'a': 100, 'b': 80, 'removed': 20}},
+                    'osx': {'size': 10, 'symbols': None}}
+
+        self.assertEqual(compare_size_reports(libraries, previous), {'linux': {
+            'size': -100,
+            'symbols': {'b': -30, 'added': 10, 'removed': -20},
+        }})
+
+    def test_libraries_without_symbols(self):
+        libraries = {'osx': {'size': 12, 'symbols': None}, 'new-platform': {'size': 5, 'symbols': None}}
+        previous = {'osx': {'size': 10, 'symbols': None}}
+        self.assertEqual(compare_size_reports(libraries, previous), {'osx': {'size': 2}})
+
+
+if __name__ == '__main__':
+    unittest.main()
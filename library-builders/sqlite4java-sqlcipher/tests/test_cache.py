@@ -0,0 +1,96 @@
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from os.path import exists, getsize, join
+
+from cache import BuildCache, snapshot_tree, get_changed_files
+
+
+class BuildCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.prefix_dir = join(self.dir, 'prefix')
+        os.makedirs(join(self.prefix_dir, 'lib'))
+
+    def _store(self, cache, key, mtime):
+        "Stores a one-file entry under key, last used at mtime."
+
+        path = join(self.prefix_dir, 'lib', key + '.a')
+        with open(path, 'w') as fd:
+            fd.write(key * 100)
+        cache.store(key, self.prefix_dir, [join('lib', key + '.a')])
+        entry_path = join(cache.path, key + '.tar')
+        if exists(entry_path):
+            os.utime(entry_path, (mtime, mtime))
+        return entry_path
+
+    def test_restore_round_trip(self):
+        cache = BuildCache(join(self.dir, 'cache'), 1024 * 1024)
+        self._store(cache, 'k1', 1000)
+
+        restore_dir = join(self.dir, 'restored')
+        self.assertTrue(cache.restore('k1', restore_dir))
+        with open(join(restore_dir, 'lib', 'k1.a')) as fd:
+            self.assertEqual(fd.read(), 'k1' * 100)
+
+    def test_restore_miss(self):
+        cache = BuildCache(join(self.dir, 'cache'), 1024 * 1024)
+        self.assertFalse(cache.contains('missing'))
+        self.assertFalse(cache.restore('missing', join(self.dir, 'restored')))
+
+    def test_evicts_least_recently_used(self):
+        cache_path = join(self.dir, 'cache')
+        entry_size = getsize(self._store(BuildCache(cache_path, 1024 * 1024), 'a', 1000))
+        cache = BuildCache(cache_path, entry_size * 3)
+        self._store(cache, 'b', 2000)
+        self._store(cache, 'c', 3000)
+
+        #a hit makes a the most recently used entry
+        self.assertTrue(cache.restore('a', join(self.dir, 'restored')))
+
+        self._store(cache, 'd', 4000)
+        self.assertEqual([k for k in 'abcd' if cache.contains(k)], ['a', 'c', 'd'])
+
+    def test_evicts_down_to_max_size(self):
+        cache_path = join(self.dir, 'cache')
+        entry_size = getsize(self._store(BuildCache(cache_path, 1024 * 1024), 'a', 1000))
+        cache = BuildCache(cache_path, entry_size)
+        self._store(cache, 'b', 2000)
+        self.assertEqual([k for k in 'ab' if cache.contains(k)], ['b'])
+
+    def test_restore_rejects_paths_outside_prefix(self):
+        cache = BuildCache(join(self.dir, 'cache'), 1024 * 1024)
+        os.makedirs(cache.path)
+        with tarfile.open(join(cache.path, 'evil.tar'), 'w') as tar:
+            info = tarfile.TarInfo('../outside')
+            info.size = 1
+            tar.addfile(info, io.BytesIO(b'x'))
+
+        restore_dir = join(self.dir, 'restored')
+        self.assertRaises(tarfile.FilterError, cache.restore, 'evil', restore_dir)
+        self.assertFalse(exists(join(self.dir, 'outside')))
+
+
+class SnapshotTest(unittest.TestCase):
+    def test_changed_files(self):
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        for name in ['same', 'modified']:
+            with open(join(d, name), 'w') as fd:
+                fd.write('x')
+        before = snapshot_tree(d)
+
+        with open(join(d, 'modified'), 'w') as fd:
+            fd.write('longer')
+        with open(join(d, 'added'), 'w') as fd:
+            fd.write('x')
+
+        self.assertEqual(get_changed_files(before, snapshot_tree(d)), ['added', 'modified'])
+
+
+if __name__ == '__main__':
+    unittest.main()
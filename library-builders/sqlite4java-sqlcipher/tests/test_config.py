@@ -0,0 +1,121 @@
+import unittest
+
+from config import (ConfigError, get_int, get_int_list, get_choice, get_profiles, get_sqlcipher_profiles,
+                    process_config_file, SQLCIPHER_PROFILES)
+
+
+REQUIRED = {
+    'root': '/build',
+    'android-ndk-home': '/ndk',
+    'android-sdk-home': '/sdk',
+    'groovy-home': '/groovy',
+    'libtool-home': '/libtool',
+    'platforms': 'linux-x86-64, android-x86',
+    'linux-jdk-home': '/jdk',
+    'osx-jdk-home': '/jdk',
+    'win32-jdk-home': '/jdk',
+    'gant-home': '/gant',
+}
+
+
+class GetIntTest(unittest.TestCase):
+    def test_default(self):
+        self.assertEqual(get_int({}, 'jobs', 4), 4)
+
+    def test_value(self):
+        self.assertEqual(get_int({'jobs': '8'}, 'jobs', 4), 8)
+
+    def test_not_an_integer(self):
+        with self.assertRaises(ConfigError) as cm:
+            get_int({'jobs': 'many'}, 'jobs', 4)
+        self.assertIn('jobs must be an integer, got many', str(cm.exception))
+
+    def test_minimum(self):
+        self.assertRaises(ConfigError, get_int, {'jobs': '0'}, 'jobs', 4)
+        self.assertEqual(get_int({'size': '0'}, 'size', 4, minimum=0), 0)
+
+    def test_int_list(self):
+        self.assertEqual(get_int_list({'sizes': '1024, 4096'}, 'sizes', '1'), [1024, 4096])
+        self.assertEqual(get_int_list({}, 'sizes', '512'), [512])
+        self.assertRaises(ConfigError, get_int_list, {'sizes': '1024, big'}, 'sizes', '1')
+        self.assertRaises(ConfigError, get_int_list, {'sizes': '1024, 256'}, 'sizes', '1', minimum=512)
+
+
+class GetChoiceTest(unittest.TestCase):
+    def test_default(self):
+        self.assertEqual(get_choice({}, 'mode', ['a', 'b'], 'a'), 'a')
+
+    def test_value(self):
+        self.assertEqual(get_choice({'mode': 'b'}, 'mode', ['a', 'b'], 'a'), 'b')
+
+    def test_unknown_choice(self):
+        with self.assertRaises(ConfigError) as cm:
+            get_choice({'mode': 'c'}, 'mode', ['a', 'b'], 'a')
+        self.assertIn('mode must be one of a, b, got c', str(cm.exception))
+
+
+class GetProfilesTest(unittest.TestCase):
+    def test_builtin_default(self):
+        profiles, profile = get_profiles({}, 'openssl', {'default': 'x'})
+        self.assertEqual(profiles, {'default': 'x'})
+        self.assertEqual(profile, 'default')
+
+    def test_custom_profiles(self):
+        config = {
+            'openssl-profile': 'fast',
+            'openssl-profile-fast': ' no-asm\n  no-idea ',
+            #an empty profile name isn't a profile
+            'openssl-profile-': 'ignored',
+        }
+        profiles, profile = get_profiles(config, 'openssl', {'default': 'x'})
+        self.assertEqual(profiles, {'default': 'x', 'fast': 'no-asm no-idea'})
+        self.assertEqual(profile, 'fast')
+
+    def test_custom_profile_overrides_builtin(self):
+        profiles, _ = get_profiles({'openssl-profile-default': 'y'}, 'openssl', {'default': 'x'})
+        self.assertEqual(profiles, {'default': 'y'})
+
+    def test_unknown_profile(self):
+        self.assertRaises(ConfigError, get_profiles, {'openssl-profile': 'missing'}, 'openssl', {'default': 'x'})
+
+    def test_sqlcipher_variants(self):
+        config = {'sqlcipher-profile': 'release', 'sqlcipher-variants': 'default, release-o3,'}
+        profiles, profile, variants = get_sqlcipher_profiles(config)
+        self.assertEqual(profiles, SQLCIPHER_PROFILES)
+        self.assertEqual(profile, 'release')
+        self.assertEqual(variants, ['default', 'release-o3'])
+
+    def test_unknown_sqlcipher_variant(self):
+        with self.assertRaises(ConfigError) as cm:
+            get_sqlcipher_profiles({'sqlcipher-variants': 'release, missing'})
+        self.assertIn('unknown profile missing', str(cm.exception))
+
+
+class ProcessConfigFileTest(unittest.TestCase):
+    def test_missing_key(self):
+        config = dict(REQUIRED)
+        del config['gant-home']
+        with self.assertRaises(ConfigError) as cm:
+            process_config_file(config)
+        self.assertIn('Missing key: gant-home', str(cm.exception))
+
+    def test_defaults(self):
+        r = process_config_file(REQUIRED)
+        self.assertEqual(r['platforms'], ['linux-x86-64', 'android-x86'])
+        self.assertEqual(r['platform-jobs'], 1)
+        self.assertEqual(r['source-clone-mode'], 'auto')
+        self.assertEqual(r['build-artifacts'], 'full')
+        self.assertFalse(r['size-optimize'])
+        self.assertEqual(r['build-cache-path'], '/build/cache/builds')
+        self.assertIsNone(r['scratch-path'])
+
+    def test_optional_keys(self):
+        config = dict(REQUIRED, **{'platform-jobs': '3', 'build-artifacts': 'minimal', 'size-optimize': 'yes'})
+        r = process_config_file(config)
+        self.assertEqual(r['platform-jobs'], 3)
+        self.assertEqual(r['build-artifacts'], 'minimal')
+        self.assertTrue(r['size-optimize'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os.path import exists, join
+from unittest import mock
+from urllib.error import HTTPError
+
+from download import DownloadError, download_file, is_downloaded
+
+
+CONTENT = bytes(range(256)) * 1024
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """
+    Serves server.files ({path: bytes}), honouring `Range: bytes=N-` unless
+    server.ignore_range is set, and records each request's Range header.
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        range_header = self.headers.get('Range')
+        server.requests.append((self.path, range_header))
+
+        data = server.files.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+
+        m = re.match(r'bytes=(\d+)-$', range_header or '')
+        if m is None or server.ignore_range:
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self._send_body(data)
+            return
+
+        start = int(m.group(1))
+        if start >= len(data):
+            self.send_response(416)
+            self.send_header('Content-Range', 'bytes */%d' % len(data))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(206)
+        self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, len(data) - 1, len(data)))
+        self.send_header('Content-Length', str(len(data) - start))
+        self.end_headers()
+        self._send_body(data[start:])
+
+    def _send_body(self, data):
+        half = len(data) // 2
+        self.wfile.write(data[:half])
+        self.wfile.flush()
+        if self.server.on_half_sent is not None:
+            self.server.on_half_sent()
+        self.wfile.write(data[half:])
+
+
+class DownloadTestCase(unittest.TestCase):
+    def setUp(self):
+        #requests to the local server must not go through a proxy
+        patcher = mock.patch.dict(os.environ, {'no_proxy': '*', 'NO_PROXY': '*'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+        self.server.files = {'/src.tar.gz': CONTENT}
+        self.server.requests = []
+        self.server.ignore_range = False
+        self.server.on_half_sent = None
+        thread = threading.Thread(target=self.server.serve_forever, args=(0.01,), daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.save_path = join(self.dir, 'src.tar.gz')
+        self.part_path = self.save_path + '.part'
+
+    def get_url(self, path='/src.tar.gz'):
+        return 'http://127.0.0.1:%d%s' % (self.server.server_address[1], path)
+
+    def write_part(self, data):
+        with open(self.part_path, 'wb') as fd:
+            fd.write(data)
+
+    def read_saved(self):
+        with open(self.save_path, 'rb') as fd:
+            return fd.read()
+
+
+class DownloadFileTest(DownloadTestCase):
+    def test_fresh_download(self):
+        download_file(self.get_url(), self.save_path, sha256(CONTENT))
+        self.assertEqual(self.read_saved(), CONTENT)
+        self.assertFalse(exists(self.part_path))
+        self.assertEqual(self.server.requests, [('/src.tar.gz', None)])
+
+    def test_resumes_part_file_on_206(self):
+        self.write_part(CONTENT[:1000])
+        download_file(self.get_url(), self.save_path, sha256(CONTENT))
+
+        self.assertEqual(self.read_saved(), CONTENT)
+        self.assertFalse(exists(self.part_path))
+        self.assertEqual(self.server.requests, [('/src.tar.gz', 'bytes=1000-')])
+
+    def test_restarts_on_200(self):
+        self.server.ignore_range = True
+        #if this were appended to, the checksum would fail
+        self.write_part(b'stale data')
+        download_file(self.get_url(), self.save_path, sha256(CONTENT))
+
+        self.assertEqual(self.read_saved(), CONTENT)
+        self.assertEqual(self.server.requests, [('/src.tar.gz', 'bytes=10-')])
+
+    def test_416_with_complete_part_file(self):
+        self.write_part(CONTENT)
+        download_file(self.get_url(), self.save_path, sha256(CONTENT))
+
+        self.assertEqual(self.read_saved(), CONTENT)
+        self.assertFalse(exists(self.part_path))
+        self.assertEqual(self.server.requests, [('/src.tar.gz', 'bytes=%d-' % len(CONTENT))])
+
+    def test_416_with_bogus_part_file(self):
+        self.write_part(b'\0' * len(CONTENT))
+        download_file(self.get_url(), self.save_path, sha256(CONTENT))
+
+        self.assertEqual(self.read_saved(), CONTENT)
+        self.assertEqual(self.server.requests, [('/src.tar.gz', 'bytes=%d-' % len(CONTENT)), ('/src.tar.gz', None)])
+
+    def test_checksum_mismatch(self):
+        with self.assertRaises(DownloadError):
+            download_file(self.get_url(), self.save_path, sha256(b'something else'))
+
+        self.assertFalse(exists(self.part_path))
+        self.assertFalse(exists(self.save_path))
+
+    def test_checksum_mismatch_after_resume(self):
+        self.write_part(b'\0' * 1000)
+        self.assertRaises(DownloadError, download_file, self.get_url(), self.save_path, sha256(CONTENT))
+
+        self.assertFalse(exists(self.part_path))
+        self.assertFalse(exists(self.save_path))
+
+    def test_save_path_only_appears_after_verification(self):
+        seen = []
+        self.server.on_half_sent = lambda: seen.append(exists(self.save_path))
+
+        download_file(self.get_url(), self.save_path, sha256(CONTENT))
+        self.assertEqual(seen, [False])
+        self.assertTrue(exists(self.save_path))
+
+    def test_http_errors_are_raised(self):
+        with self.assertRaises(HTTPError) as cm:
+            download_file(self.get_url('/missing'), self.save_path, sha256(CONTENT))
+        self.assertEqual(cm.exception.code, 404)
+        self.assertFalse(exists(self.save_path))
+
+
+class IsDownloadedTest(DownloadTestCase):
+    def test_matching_file(self):
+        with open(self.save_path, 'wb') as fd:
+            fd.write(CONTENT)
+        self.assertTrue(is_downloaded(self.save_path, sha256(CONTENT)))
+
+    def test_mismatching_file_is_removed(self):
+        with open(self.save_path, 'wb') as fd:
+            fd.write(b'old version')
+        self.assertFalse(is_downloaded(self.save_path, sha256(CONTENT)))
+        self.assertFalse(exists(self.save_path))
+
+    def test_missing_file(self):
+        self.assertFalse(is_downloaded(self.save_path, sha256(CONTENT)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from os.path import exists, islink, join
+
+from extract import ExtractError, extract_tarball, _strip_path
+
+
+class StripPathTest(unittest.TestCase):
+    def test_strips_top_level(self):
+        self.assertEqual(_strip_path('src-1.0/lib/a.c', 1, None), ('lib/a.c', 'src-1.0'))
+        self.assertEqual(_strip_path('./src-1.0/./a.c', 1, 'src-1.0'), ('a.c', 'src-1.0'))
+
+    def test_top_level_entry_itself(self):
+        self.assertEqual(_strip_path('src-1.0/', 1, None), ('', 'src-1.0'))
+
+    def test_rejects_parent_components(self):
+        for name in ['../evil', 'src/../../evil', 'src/lib/../../../evil', '..']:
+            self.assertRaises(ExtractError, _strip_path, name, 1, None)
+
+    def test_rejects_absolute_paths(self):
+        for name in ['/etc/passwd', '//etc/passwd']:
+            self.assertRaises(ExtractError, _strip_path, name, 1, None)
+
+    def test_rejects_second_top_level_entry(self):
+        self.assertRaises(ExtractError, _strip_path, 'other/a.c', 1, 'src-1.0')
+
+
+def _add_file(tar, name, data, mode=0o644):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mode = mode
+    info.mtime = 1000000000
+    tar.addfile(info, io.BytesIO(data))
+
+
+class ExtractTarballTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.output_path = join(self.dir, 'out')
+        os.makedirs(self.output_path)
+
+    def _make_tarball(self, add_members):
+        path = join(self.dir, 'src.tar.gz')
+        with tarfile.open(path, 'w:gz') as tar:
+            add_members(tar)
+        return path
+
+    def _make_source_tarball(self):
+        def add_members(tar):
+            info = tarfile.TarInfo('src-1.0')
+            info.type = tarfile.DIRTYPE
+            info.mode = 0o755
+            tar.addfile(info)
+            _add_file(tar, 'src-1.0/configure', b'#!/bin/sh\n', 0o755)
+            _add_file(tar, 'src-1.0/lib/a.c', b'int a;\n' * 10000)
+            info = tarfile.TarInfo('src-1.0/lib/b.c')
+            info.type = tarfile.SYMTYPE
+            info.linkname = 'a.c'
+            tar.addfile(info)
+            info = tarfile.TarInfo('src-1.0/c.c')
+            info.type = tarfile.LNKTYPE
+            info.linkname = 'src-1.0/lib/a.c'
+            tar.addfile(info)
+        return self._make_tarball(add_members)
+
+    def _check_source_tree(self):
+        with open(join(self.output_path, 'lib', 'a.c'), 'rb') as fd:
+            self.assertEqual(fd.read(), b'int a;\n' * 10000)
+        self.assertTrue(os.access(join(self.output_path, 'configure'), os.X_OK))
+        self.assertTrue(islink(join(self.output_path, 'lib', 'b.c')))
+        self.assertEqual(os.readlink(join(self.output_path, 'lib', 'b.c')), 'a.c')
+        self.assertTrue(os.path.samefile(join(self.output_path, 'c.c'), join(self.output_path, 'lib', 'a.c')))
+        self.assertEqual(os.stat(join(self.output_path, 'lib', 'a.c')).st_mtime, 1000000000)
+
+    def test_extract(self):
+        extract_tarball(self._make_source_tarball(), self.output_path)
+        self._check_source_tree()
+
+    def test_extract_threaded(self):
+        extract_tarball(self._make_source_tarball(), self.output_path, threaded=True)
+        self._check_source_tree()
+
+    def test_rejects_unsafe_member(self):
+        def add_members(tar):
+            _add_file(tar, 'src-1.0/a.c', b'a')
+            _add_file(tar, 'src-1.0/../../evil', b'x')
+        path = self._make_tarball(add_members)
+
+        for threaded in [False, True]:
+            self.assertRaises(ExtractError, extract_tarball, path, self.output_path, threaded=threaded)
+            self.assertFalse(exists(join(self.dir, 'evil')))
+
+    def test_rejects_multiple_top_level_entries(self):
+        def add_members(tar):
+            _add_file(tar, 'src-1.0/a.c', b'a')
+            _add_file(tar, 'other/b.c', b'b')
+        self.assertRaises(ExtractError, extract_tarball, self._make_tarball(add_members), self.output_path)
+
+    def _assert_rejected(self, add_members):
+        path = self._make_tarball(add_members)
+        for threaded in [False, True]:
+            shutil.rmtree(self.output_path)
+            os.makedirs(self.output_path)
+            self.assertRaises(ExtractError, extract_tarball, path, self.output_path, threaded=threaded)
+
+    def _add_link(self, tar, name, linkname, type=tarfile.SYMTYPE):
+        info = tarfile.TarInfo(name)
+        info.type = type
+        info.linkname = linkname
+        tar.addfile(info)
+
+    def test_rejects_symlinks_out_of_the_tree(self):
+        evil = join(self.dir, 'evil')
+        os.makedirs(evil)
+        for linkname in [evil, '../evil', 'lib/../../evil']:
+            def add_members(tar):
+                self._add_link(tar, 'src-1.0/lib/a', linkname)
+                _add_file(tar, 'src-1.0/lib/a/x', b'x')
+            self._assert_rejected(add_members)
+            self.assertEqual(os.listdir(evil), [])
+
+    def test_rejects_members_through_symlinks(self):
+        def add_members(tar):
+            _add_file(tar, 'src-1.0/lib/a.c', b'a')
+            self._add_link(tar, 'src-1.0/src', 'lib')
+            _add_file(tar, 'src-1.0/src/b.c', b'b')
+        self._assert_rejected(add_members)
+
+        def add_members(tar):
+            self._add_link(tar, 'src-1.0/a.c', 'b.c')
+            _add_file(tar, 'src-1.0/a.c', b'a')
+        self._assert_rejected(add_members)
+
+    def test_rejects_hardlinks_out_of_the_tree(self):
+        def add_members(tar):
+            _add_file(tar, 'src-1.0/a.c', b'a')
+            self._add_link(tar, 'src-1.0/b.c', 'src-1.0', tarfile.LNKTYPE)
+        self._assert_rejected(add_members)
+
+        def add_members(tar):
+            _add_file(tar, 'src-1.0/lib/a.c', b'a')
+            self._add_link(tar, 'src-1.0/src', 'lib')
+            self._add_link(tar, 'src-1.0/b.c', 'src-1.0/src/a.c', tarfile.LNKTYPE)
+        self._assert_rejected(add_members)
+
+    def test_rejects_unsupported_members(self):
+        for type in [tarfile.FIFOTYPE, tarfile.CHRTYPE, tarfile.BLKTYPE]:
+            def add_members(tar):
+                _add_file(tar, 'src-1.0/a.c', b'a')
+                info = tarfile.TarInfo('src-1.0/dev')
+                info.type = type
+                tar.addfile(info)
+            self._assert_rejected(add_members)
+            self.assertFalse(exists(join(self.output_path, 'dev')))
+
+
+if __name__ == '__main__':
+    unittest.main()
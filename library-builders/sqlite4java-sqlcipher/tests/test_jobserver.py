@@ -0,0 +1,100 @@
+import os
+import pickle
+import shutil
+import subprocess
+import tempfile
+import unittest
+from os.path import dirname, exists, join
+
+from jobserver import JobServer
+
+
+def count_tokens(jobserver):
+    "Takes every available token, then puts them back; returns how many there were."
+
+    os.set_blocking(jobserver.read_fd, False)
+    try:
+        tokens = b''
+        while True:
+            try:
+                tokens += os.read(jobserver.read_fd, 64)
+            except BlockingIOError:
+                break
+    finally:
+        os.set_blocking(jobserver.read_fd, True)
+
+    os.write(jobserver.write_fd, tokens)
+    return len(tokens)
+
+
+class JobServerTest(unittest.TestCase):
+    def test_starts_with_one_token_per_job(self):
+        self.assertEqual(count_tokens(JobServer(3)), 3)
+
+    def test_jobs_must_be_positive(self):
+        self.assertRaises(ValueError, JobServer, 0)
+
+    def test_token_is_returned(self):
+        jobserver = JobServer(2)
+        with jobserver.token():
+            self.assertEqual(count_tokens(jobserver), 1)
+        self.assertEqual(count_tokens(jobserver), 2)
+
+    def test_token_is_returned_on_error(self):
+        jobserver = JobServer(1)
+        with self.assertRaises(RuntimeError):
+            with jobserver.token():
+                raise RuntimeError('failed')
+        self.assertEqual(count_tokens(jobserver), 1)
+
+    def test_env_points_make_at_fds(self):
+        jobserver = JobServer(4)
+        env = jobserver.get_env({'PATH': '/bin'})
+        self.assertEqual(env['PATH'], '/bin')
+        makeflags = env['MAKEFLAGS'].split()
+        self.assertIn('--jobserver-fds=%d,%d' % jobserver.fds, makeflags)
+        self.assertIn('--jobserver-auth=%d,%d' % jobserver.fds, makeflags)
+        #make < 4.2 ignores the jobserver when given a job count
+        self.assertIn('-j', makeflags)
+        self.assertFalse([flag for flag in makeflags if flag.startswith('-j') and flag[2:].isdigit()])
+
+    def test_unpickled_copy_shares_tokens(self):
+        jobserver = JobServer(2)
+        copy = pickle.loads(pickle.dumps(jobserver))
+        self.assertNotEqual(copy.fds, jobserver.fds)
+
+        with copy.token():
+            self.assertEqual(count_tokens(jobserver), 1)
+        self.assertEqual(count_tokens(jobserver), 2)
+
+    def test_fifo_is_removed_with_its_owner(self):
+        jobserver = JobServer(1)
+        fifo_dir = dirname(jobserver.path)
+        copy = pickle.loads(pickle.dumps(jobserver))
+
+        #a copy going away doesn't remove the fifo
+        del copy
+        self.assertTrue(exists(jobserver.path))
+
+        del jobserver
+        self.assertFalse(exists(fifo_dir))
+
+    @unittest.skipUnless(shutil.which('make'), 'make is not installed')
+    def test_make_uses_the_jobserver(self):
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        with open(join(d, 'Makefile'), 'w') as fd:
+            fd.write('all: a b\na b:\n\t@touch $@\n')
+
+        jobserver = JobServer(2)
+        with jobserver.token():
+            subprocess.check_call(['make', '-C', d, '-s'], env=jobserver.get_env(os.environ),
+                                  pass_fds=jobserver.fds)
+
+        self.assertTrue(exists(join(d, 'a')) and exists(join(d, 'b')))
+        #make gives back every token it took
+        self.assertEqual(count_tokens(jobserver), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
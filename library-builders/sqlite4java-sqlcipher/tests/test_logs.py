@@ -0,0 +1,140 @@
+import io
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from os.path import join
+from unittest import mock
+
+import logs
+from logs import LogFile, capture_output, child_output, get_current_log, _OutputRouter, _read_tail, _get_last_message
+
+
+def read_lines(path):
+    "Returns the lines of a log without their timestamps."
+
+    with open(path, encoding='utf-8') as fd:
+        return [line[13:].rstrip('\n') for line in fd]
+
+
+def run(argv, **kwargs):
+    with child_output(kwargs) as started:
+        p = subprocess.Popen(argv, **kwargs)
+        started()
+        p.wait()
+    return kwargs
+
+
+class LogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = join(self.dir, 'logs', 'build.log')
+
+
+class LogFileTest(LogTestCase):
+    def test_lines_are_split_and_marked(self):
+        path = join(self.dir, 'build.log')
+        log = LogFile(path)
+        log.stdout.write('one\ntw')
+        log.stdout.write('o\nthree')
+        log.stderr.write('error\r\n')
+        log.close()
+
+        self.assertEqual(read_lines(path), ['  one', '  two', '! error', '  three'])
+
+    def test_read_tail(self):
+        path = join(self.dir, 'build.log')
+        with open(path, 'w') as fd:
+            fd.write(''.join('line %d\n' % i for i in range(100)))
+
+        self.assertEqual(_read_tail(path, 2, 1000), ['line 98', 'line 99'])
+        self.assertEqual(_read_tail(join(self.dir, 'missing'), 2, 1000), [])
+
+    def test_last_message(self):
+        log = LogFile(join(self.dir, 'build.log'))
+        log.write_line('compiling sqlite3.c')
+        log.write_line('')
+        log.close()
+        self.assertEqual(_get_last_message(join(self.dir, 'build.log')), 'compiling sqlite3.c')
+
+
+class CaptureOutputTest(LogTestCase):
+    def test_child_output_goes_to_the_log(self):
+        with capture_output(self.path, 'linux') as log:
+            self.assertIs(get_current_log(), log)
+            run(['sh', '-c', 'echo out; echo err >&2'])
+        self.assertIsNone(get_current_log())
+
+        self.assertEqual(sorted(read_lines(self.path)), ['  out', '! err'])
+
+    def test_prints_go_to_the_log(self):
+        terminal = io.StringIO()
+        router = _OutputRouter(terminal, False)
+        router.write('before\n')
+        with capture_output(self.path, 'linux'):
+            router.write('captured\n')
+        router.write('after\n')
+
+        self.assertEqual(terminal.getvalue(), 'before\nafter\n')
+        self.assertEqual(read_lines(self.path), ['  captured'])
+
+    def test_without_capture(self):
+        kwargs = run(['true'])
+        self.assertEqual(kwargs, {})
+
+    def test_redirected_output_is_left_alone(self):
+        with capture_output(self.path, 'linux'):
+            kwargs = run(['echo', 'hidden'], stdout=subprocess.DEVNULL)
+        self.assertNotIn('stderr', kwargs)
+        self.assertEqual(read_lines(self.path), [])
+
+    def test_failure_is_logged(self):
+        terminal = io.StringIO()
+        with mock.patch('sys.stderr', _OutputRouter(terminal, True)):
+            with self.assertRaises(RuntimeError):
+                with capture_output(self.path, 'linux', print_tail=False):
+                    raise RuntimeError('build failed')
+
+        self.assertEqual(terminal.getvalue(), '')
+
+        lines = read_lines(self.path)
+        self.assertIn('! Traceback (most recent call last):', lines)
+        self.assertIn('! RuntimeError: build failed', lines)
+
+    def test_output_of_daemons_is_not_waited_for(self):
+        with mock.patch.object(logs, 'DRAIN_TIMEOUT', 0.1):
+            start = time.monotonic()
+            with capture_output(self.path, 'linux'):
+                #the background sleep keeps the pipes open after sh exits
+                run(['sh', '-c', 'echo started; sleep 3 &'])
+            self.assertLess(time.monotonic() - start, 2)
+
+        self.assertEqual(read_lines(self.path), ['  started'])
+
+    def test_concurrent_builds(self):
+        #more than a pipe buffer of output from each build
+        script = 'for i in $(seq 20000); do echo "line $i"; done; echo done >&2'
+        paths = [join(self.dir, 'logs', '%d.log' % i) for i in range(4)]
+
+        def build(path):
+            with capture_output(path, path):
+                run(['sh', '-c', script])
+
+        threads = [threading.Thread(target=build, args=(path,)) for path in paths]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for path in paths:
+            lines = read_lines(path)
+            self.assertEqual(len(lines), 20001)
+            self.assertEqual(lines[19999], '  line 20000')
+            self.assertIn('! done', lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from os.path import exists, join
+from unittest import mock
+
+import scratch
+from scratch import ScratchSpace, get_available_space, get_filesystem_type
+
+
+MiB = 1024 * 1024
+
+
+class ScratchSpaceTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.scratch_path = join(self.dir, 'scratch')
+        self.fallback_path = join(self.dir, 'build')
+
+        self.available = 100 * MiB
+        patcher = mock.patch.object(scratch, 'get_available_space', lambda path: self.available)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _read_reservations(self):
+        with open(join(self.scratch_path, '.reservations.json')) as fd:
+            return json.load(fd)
+
+    def test_without_scratch_path(self):
+        space = ScratchSpace(None, self.fallback_path, 10 * MiB)
+        with space.build_dir('linux', 'openssl') as build_dir:
+            self.assertEqual(build_dir, join(self.fallback_path, 'linux', 'openssl'))
+            os.makedirs(build_dir)
+
+        #trees under the fallback path are kept
+        self.assertTrue(exists(build_dir))
+
+    def test_scratch_dir_is_reserved_and_removed(self):
+        space = ScratchSpace(self.scratch_path, self.fallback_path, 10 * MiB)
+        with space.build_dir('linux', 'openssl') as build_dir:
+            self.assertEqual(build_dir, join(self.scratch_path, 'linux', 'openssl'))
+            self.assertEqual(self._read_reservations(), {build_dir: os.getpid()})
+            os.makedirs(build_dir)
+
+        self.assertFalse(exists(build_dir))
+        self.assertEqual(self._read_reservations(), {})
+
+    def test_failed_build_keeps_its_tree(self):
+        space = ScratchSpace(self.scratch_path, self.fallback_path, 10 * MiB)
+        with self.assertRaises(RuntimeError):
+            with space.build_dir('linux', 'openssl') as build_dir:
+                os.makedirs(build_dir)
+                raise RuntimeError('build failed')
+
+        self.assertTrue(exists(build_dir))
+        self.assertEqual(self._read_reservations(), {})
+
+    def test_falls_back_when_concurrent_builds_need_more_space(self):
+        self.available = 25 * MiB
+        space = ScratchSpace(self.scratch_path, self.fallback_path, 10 * MiB)
+        with space.build_dir('linux', 'openssl') as first, space.build_dir('android-x86', 'openssl') as second:
+            with space.build_dir('osx', 'openssl') as third:
+                self.assertEqual(first, join(self.scratch_path, 'linux', 'openssl'))
+                self.assertEqual(second, join(self.scratch_path, 'android-x86', 'openssl'))
+                self.assertEqual(third, join(self.fallback_path, 'osx', 'openssl'))
+                self.assertEqual(len(self._read_reservations()), 2)
+
+    def test_reservations_of_dead_processes_are_ignored(self):
+        os.makedirs(self.scratch_path)
+        with open(join(self.scratch_path, '.reservations.json'), 'w') as fd:
+            #pids are never this large
+            json.dump({join(self.scratch_path, 'old'): 2 ** 30}, fd)
+
+        self.available = 15 * MiB
+        space = ScratchSpace(self.scratch_path, self.fallback_path, 10 * MiB)
+        with space.build_dir('linux') as build_dir:
+            self.assertEqual(build_dir, join(self.scratch_path, 'linux'))
+
+    def test_stale_trees_are_removed(self):
+        space = ScratchSpace(self.scratch_path, self.fallback_path, 10 * MiB)
+        stale = join(self.fallback_path, 'linux', 'stale-file')
+        os.makedirs(join(self.fallback_path, 'linux'))
+        open(stale, 'w').close()
+
+        with space.build_dir('linux'):
+            self.assertFalse(exists(stale))
+
+
+class AvailableSpaceTest(unittest.TestCase):
+    def test_filesystem_type(self):
+        self.assertIsNotNone(get_filesystem_type(tempfile.gettempdir()))
+
+    def test_memory_filesystems_are_limited_by_memory(self):
+        with mock.patch.object(scratch, 'get_filesystem_type', return_value='tmpfs'), \
+                mock.patch.object(scratch, 'get_available_memory', return_value=MiB):
+            self.assertEqual(get_available_space(tempfile.gettempdir()), MiB)
+
+    def test_disk_filesystems_are_not(self):
+        with mock.patch.object(scratch, 'get_filesystem_type', return_value='ext4'), \
+                mock.patch.object(scratch, 'get_available_memory', return_value=1):
+            self.assertGreater(get_available_space(tempfile.gettempdir()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from os.path import exists, islink, join
+
+from sources import SourceCache
+
+
+def write_tarball(path, files):
+    "Writes a .tar.gz of the given {name: data} under a src-1.0 top-level directory."
+
+    with tarfile.open(path, 'w:gz') as tar:
+        for name, data in sorted(files.items()):
+            info = tarfile.TarInfo('src-1.0/' + name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+        info = tarfile.TarInfo('src-1.0/link')
+        info.type = tarfile.SYMTYPE
+        info.linkname = 'configure'
+        tar.addfile(info)
+
+
+class SourceCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.src_path = join(self.dir, 'src.tar.gz')
+        write_tarball(self.src_path, {'configure': b'#!/bin/sh\n', 'lib/a.c': b'int a;\n'})
+
+    def _create(self, clone_mode):
+        return SourceCache(join(self.dir, 'cache'), clone_mode)
+
+    def _read(self, path):
+        with open(path, 'rb') as fd:
+            return fd.read()
+
+    def test_tree_is_reused(self):
+        cache = self._create('copy')
+        tree_path = cache.get_tree(self.src_path, 'hash', [])
+        self.assertEqual(self._read(join(tree_path, 'lib', 'a.c')), b'int a;\n')
+
+        os.remove(self.src_path)
+        self.assertEqual(cache.get_tree(self.src_path, 'hash', []), tree_path)
+
+    def test_trees_are_keyed_by_source_hash(self):
+        cache = self._create('copy')
+        self.assertNotEqual(cache.get_tree(self.src_path, 'hash', []), cache.get_tree(self.src_path, 'other', []))
+
+    def test_copy_clone(self):
+        cache = self._create('copy')
+        dest = join(self.dir, 'build', 'linux')
+        tree_path = cache.prepare(self.src_path, 'hash', [], dest)
+
+        self.assertEqual(self._read(join(dest, 'lib', 'a.c')), b'int a;\n')
+        self.assertTrue(islink(join(dest, 'link')))
+        self.assertNotEqual(os.stat(join(dest, 'lib', 'a.c')).st_ino, os.stat(join(tree_path, 'lib', 'a.c')).st_ino)
+
+    def test_prepare_replaces_dest(self):
+        cache = self._create('copy')
+        dest = join(self.dir, 'build', 'linux')
+        os.makedirs(dest)
+        open(join(dest, 'stale.o'), 'w').close()
+
+        cache.prepare(self.src_path, 'hash', [], dest)
+        self.assertFalse(exists(join(dest, 'stale.o')))
+
+    def test_hardlink_clone_shares_files(self):
+        cache = self._create('hardlink')
+        dest = join(self.dir, 'build', 'linux')
+        tree_path = cache.prepare(self.src_path, 'hash', [], dest)
+
+        self.assertEqual(os.stat(join(dest, 'lib', 'a.c')).st_ino, os.stat(join(tree_path, 'lib', 'a.c')).st_ino)
+        self.assertTrue(islink(join(dest, 'link')))
+        #new files in the build dir don't affect the pristine tree
+        open(join(dest, 'a.o'), 'w').close()
+        self.assertFalse(exists(join(tree_path, 'a.o')))
+
+    def test_modified_hardlinked_tree_is_re_extracted(self):
+        cache = self._create('hardlink')
+        dest = join(self.dir, 'build', 'linux')
+        tree_path = cache.prepare(self.src_path, 'hash', [], dest)
+
+        with open(join(dest, 'lib', 'a.c'), 'ab') as fd:
+            fd.write(b'int b;\n')
+        self.assertEqual(self._read(join(tree_path, 'lib', 'a.c')), b'int a;\nint b;\n')
+
+        cache.prepare(self.src_path, 'hash', [], join(self.dir, 'build', 'android-x86'))
+        self.assertEqual(self._read(join(tree_path, 'lib', 'a.c')), b'int a;\n')
+
+    def test_check_tree(self):
+        cache = self._create('hardlink')
+        dest = join(self.dir, 'build', 'linux')
+        tree_path = cache.prepare(self.src_path, 'hash', [], dest)
+
+        #replacing a file (like unshare_file does) is fine
+        os.remove(join(dest, 'configure'))
+        with open(join(dest, 'configure'), 'w') as fd:
+            fd.write('modified')
+        cache.check_tree(tree_path)
+
+        with open(join(dest, 'lib', 'a.c'), 'ab') as fd:
+            fd.write(b'int b;\n')
+        with self.assertRaises(RuntimeError) as cm:
+            cache.check_tree(tree_path)
+        self.assertIn(tree_path, str(cm.exception))
+
+    def test_check_tree_only_applies_to_hardlinks(self):
+        cache = self._create('copy')
+        tree_path = cache.get_tree(self.src_path, 'hash', [])
+        with open(join(tree_path, 'lib', 'a.c'), 'ab') as fd:
+            fd.write(b'int b;\n')
+        cache.check_tree(tree_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from os.path import join
+
+from state import TaskStateStore
+from tasks import Task, Tasks
+
+
+class FileTask(Task):
+    "Copies its input file to its output, recording each run."
+
+    input_context_keys = ['flags']
+
+    def __init__(self, input_path, output_path):
+        super().__init__('copy')
+        self.input_path = input_path
+        self.output_path = output_path
+        self.runs = 0
+
+    def get_inputs(self, task_context):
+        return [self.input_path]
+
+    def get_outputs(self, task_context):
+        return [self.output_path]
+
+    def run(self, task_context):
+        self.runs += 1
+        shutil.copy(self.input_path, self.output_path)
+
+
+class TaskStateStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.state_path = join(self.dir, 'task-state.json')
+        self.input_path = join(self.dir, 'input')
+        self._write_input('v1')
+        self.task = FileTask(self.input_path, join(self.dir, 'output'))
+        self.context = {'flags': ['-O2']}
+
+    def _write_input(self, text):
+        with open(self.input_path, 'w') as fd:
+            fd.write(text)
+
+    def _fingerprint(self, state=None):
+        state = state or TaskStateStore(self.state_path)
+        return state.get_fingerprint(self.task, self.context)
+
+    def test_fingerprint_is_stable(self):
+        self.assertEqual(self._fingerprint(), self._fingerprint())
+
+    def test_fingerprint_changes_with_input_content(self):
+        before = self._fingerprint()
+        self._write_input('v2')
+        self.assertNotEqual(self._fingerprint(), before)
+
+    def test_fingerprint_ignores_touching_input(self):
+        before = self._fingerprint()
+        os.utime(self.input_path, (1, 1))
+        self.assertEqual(self._fingerprint(), before)
+
+    def test_fingerprint_changes_with_input_values(self):
+        before = self._fingerprint()
+        self.context['flags'] = ['-Os']
+        self.assertNotEqual(self._fingerprint(), before)
+
+    def test_missing_input_has_a_fingerprint(self):
+        os.unlink(self.input_path)
+        self.assertEqual(self._fingerprint(), self._fingerprint())
+
+    def test_up_to_date_after_record_only(self):
+        state = TaskStateStore(self.state_path)
+        fingerprint = state.get_fingerprint(self.task, self.context)
+        self.task.run(self.context)
+        self.assertFalse(state.is_up_to_date(self.task, self.context, fingerprint))
+
+        state.record(self.task, fingerprint)
+        self.assertTrue(state.is_up_to_date(self.task, self.context, fingerprint))
+
+        #persisted across instances
+        self.assertTrue(TaskStateStore(self.state_path).is_up_to_date(self.task, self.context, fingerprint))
+
+    def test_missing_output_is_not_up_to_date(self):
+        state = TaskStateStore(self.state_path)
+        fingerprint = state.get_fingerprint(self.task, self.context)
+        self.task.run(self.context)
+        state.record(self.task, fingerprint)
+
+        os.unlink(self.task.output_path)
+        self.assertFalse(state.is_up_to_date(self.task, self.context, fingerprint))
+
+    def test_tasks_skips_unchanged_and_reruns_changed(self):
+        tasks = Tasks()
+        tasks.add(self.task)
+
+        tasks.run('copy', self.context, state=TaskStateStore(self.state_path))
+        tasks.run('copy', self.context, state=TaskStateStore(self.state_path))
+        self.assertEqual(self.task.runs, 1)
+
+        self._write_input('v2')
+        tasks.run('copy', self.context, state=TaskStateStore(self.state_path))
+        self.assertEqual(self.task.runs, 2)
+
+    def test_durations(self):
+        state = TaskStateStore(self.state_path)
+        state.record_duration('copy', 1.23456)
+        state.record_duration('copy', 2.0, 'linux-x86_64')
+
+        state = TaskStateStore(self.state_path)
+        self.assertEqual(state.get_duration('copy'), 1.235)
+        self.assertEqual(state.get_duration('copy', 'linux-x86_64'), 2.0)
+        self.assertIsNone(state.get_duration('copy', 'ios'))
+
+    def test_pickled_copy_can_be_read(self):
+        state = TaskStateStore(self.state_path)
+        state.record_duration('copy', 1.0)
+        self.assertEqual(pickle.loads(pickle.dumps(state)).get_duration('copy'), 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from os.path import join
+
+from state import TaskStateStore
+from tasks import Task, Tasks, TaskGraphError, estimate_makespan, get_critical_path_lengths
+
+
+class RecordingTask(Task):
+    def __init__(self, name, dependencies=(), log=None, duration=0.0, error=None):
+        super().__init__(name)
+        self.log = log if log is not None else []
+        self.duration = duration
+        self.error = error
+        for dependency in dependencies:
+            self.add_dependency(dependency)
+
+    def run(self, task_context):
+        self.log.append(('start', self.name))
+        time.sleep(self.duration)
+        if self.error is not None:
+            raise self.error
+        self.log.append(('end', self.name))
+
+
+def make_tasks(*tasks):
+    r = Tasks()
+    for task in tasks:
+        r.add(task)
+    return r
+
+
+class ResolveTest(unittest.TestCase):
+    def test_dependencies_come_first(self):
+        tasks = make_tasks(RecordingTask('a'), RecordingTask('b', ['a']), RecordingTask('c', ['a', 'b']))
+        self.assertEqual(tasks.resolve('c'), ['a', 'b', 'c'])
+
+    def test_only_includes_transitive_dependencies(self):
+        tasks = make_tasks(RecordingTask('a'), RecordingTask('b', ['a']), RecordingTask('unrelated'))
+        self.assertEqual(tasks.resolve('b'), ['a', 'b'])
+
+    def test_cycle_is_reported(self):
+        tasks = make_tasks(RecordingTask('a', ['c']), RecordingTask('b', ['a']), RecordingTask('c', ['b']))
+        with self.assertRaises(TaskGraphError) as cm:
+            tasks.resolve('c')
+        self.assertIn('c -> b -> a -> c', str(cm.exception))
+
+    def test_self_dependency_is_a_cycle(self):
+        tasks = make_tasks(RecordingTask('a', ['a']))
+        self.assertRaises(TaskGraphError, tasks.resolve, 'a')
+
+    def test_unknown_dependency(self):
+        tasks = make_tasks(RecordingTask('a', ['missing']))
+        with self.assertRaises(TaskGraphError) as cm:
+            tasks.resolve('a')
+        self.assertIn('missing', str(cm.exception))
+
+
+class RunParallelTest(unittest.TestCase):
+    def test_independent_tasks_run_concurrently(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        class BarrierTask(RecordingTask):
+            def run(self, task_context):
+                #deadlocks (and times out) unless both run at once
+                barrier.wait()
+                super().run(task_context)
+
+        log = []
+        tasks = make_tasks(BarrierTask('a', log=log), BarrierTask('b', log=log), RecordingTask('c', ['a', 'b'], log))
+        tasks.run('c', {}, jobs=2)
+        self.assertEqual(log[-1], ('end', 'c'))
+        self.assertEqual(len(log), 6)
+
+    def test_dependents_wait_for_dependencies(self):
+        log = []
+        tasks = make_tasks(RecordingTask('slow', log=log, duration=0.1), RecordingTask('fast', log=log),
+                           RecordingTask('after', ['slow'], log))
+        tasks.add(RecordingTask('all', ['after', 'fast'], log))
+        tasks.run('all', {}, jobs=3)
+        self.assertLess(log.index(('end', 'slow')), log.index(('start', 'after')))
+
+    def test_failure_stops_dependents_and_is_raised(self):
+        log = []
+        error = RuntimeError('broken')
+        tasks = make_tasks(RecordingTask('bad', log=log, error=error), RecordingTask('good', log=log, duration=0.1),
+                           RecordingTask('after-bad', ['bad'], log), RecordingTask('all', ['after-bad', 'good'], log))
+
+        with self.assertRaises(RuntimeError) as cm:
+            tasks.run('all', {}, jobs=2)
+
+        self.assertIs(cm.exception, error)
+        started = [name for event, name in log if event == 'start']
+        self.assertNotIn('after-bad', started)
+        self.assertNotIn('all', started)
+        #tasks already running when the failure happened are allowed to finish
+        self.assertIn(('end', 'good'), log)
+
+    def test_failure_in_serial_run(self):
+        log = []
+        tasks = make_tasks(RecordingTask('bad', log=log, error=ValueError('x')), RecordingTask('after', ['bad'], log))
+        self.assertRaises(ValueError, tasks.run, 'after', {}, jobs=1)
+        self.assertEqual(log, [('start', 'bad')])
+
+
+class EstimateTest(unittest.TestCase):
+    def test_critical_path_lengths(self):
+        durations = {'a': 1.0, 'b': 2.0, 'c': 3.0}
+        self.assertEqual(get_critical_path_lengths(durations, {'b': ['a'], 'c': ['a']}), {'a': 4.0, 'b': 2.0, 'c': 3.0})
+
+    def test_serial_makespan_is_the_total(self):
+        durations = {'a': 1.0, 'b': 2.0, 'c': 3.0}
+        self.assertEqual(estimate_makespan(durations, {}, 1), 6.0)
+
+    def test_longest_first(self):
+        #longest first: 5+1 on one job, 3+2+1 on the other
+        durations = {'a': 1.0, 'b': 2.0, 'c': 3.0, 'd': 5.0, 'e': 1.0}
+        self.assertEqual(estimate_makespan(durations, {}, 2), 6.0)
+
+    def test_dependencies(self):
+        durations = {'download': 1.0, 'openssl': 4.0, 'amalgamation': 1.0, 'sqlcipher': 2.0}
+        dependencies = {'openssl': ['download'], 'amalgamation': ['download'], 'sqlcipher': ['openssl', 'amalgamation']}
+        self.assertEqual(estimate_makespan(durations, dependencies, 4), 7.0)
+        self.assertEqual(estimate_makespan(durations, dependencies, 1), 8.0)
+
+    def test_unknown_dependencies_are_ignored(self):
+        self.assertEqual(estimate_makespan({'b': 2.0}, {'b': ['a']}, 2), 2.0)
+
+
+class PlanTest(unittest.TestCase):
+    def test_plan_uses_recorded_durations(self):
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        state = TaskStateStore(join(d, 'task-state.json'))
+        for name, duration in [('a', 2.0), ('b', 3.0), ('c', 1.0)]:
+            state.record_duration(name, duration)
+
+        log = []
+        tasks = make_tasks(RecordingTask('a', log=log), RecordingTask('b', log=log),
+                           RecordingTask('c', ['a', 'b'], log))
+        plan = tasks.plan('c', {}, jobs=2, state=state)
+
+        self.assertEqual([entry[:3] for entry in plan['tasks']],
+                         [('a', 'always-run', 2.0), ('b', 'always-run', 3.0), ('c', 'always-run', 1.0)])
+        self.assertEqual(plan['estimate'], 4.0)
+        self.assertEqual(plan['lower-bound'], 4.0)
+        self.assertEqual(tasks.plan('c', {}, jobs=1, state=state)['estimate'], 6.0)
+        #nothing is run
+        self.assertEqual(log, [])
+
+    def test_plan_without_durations(self):
+        tasks = make_tasks(RecordingTask('a'))
+        self.assertEqual(tasks.plan('a', {})['tasks'], [('a', 'always-run', None, [])])
+
+
+if __name__ == '__main__':
+    unittest.main()
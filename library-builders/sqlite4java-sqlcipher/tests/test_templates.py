@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+import unittest
+from os.path import join
+
+from utils import Template, TemplateError, TemplateRegistry, get_template, load_templates
+
+
+class TemplateTest(unittest.TestCase):
+    def test_substitute(self):
+        template = Template('./configure --prefix={{prefix}} {{size-cflags}}{{prefix}}')
+        self.assertEqual(template.placeholders, {'prefix', 'size-cflags'})
+        self.assertEqual(template.substitute(**{'prefix': '/p', 'size-cflags': '-Os'}), './configure --prefix=/p -Os/p')
+
+    def test_missing_keys(self):
+        template = Template('{{a}} {{b}} {{c}}', 'build.sh')
+        with self.assertRaises(TemplateError) as cm:
+            template.substitute(b='x')
+        self.assertEqual(str(cm.exception), 'Template build.sh has no values for: a, c')
+
+    def test_extra_keys_are_ignored(self):
+        self.assertEqual(Template('{{a}}').substitute(a='x', unused='y'), 'x')
+
+    def test_malformed(self):
+        for text in ['{{a b}}', 'x {{a', 'a}} x', '{{a}}{{']:
+            self.assertRaises(TemplateError, Template, text)
+
+    def test_shipped_templates_parse(self):
+        load_templates()
+        self.assertIn('prefix', get_template('openssl-linux-build.sh').placeholders)
+
+
+class TemplateRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = join(self.dir, 'build.sh')
+
+    def _write(self, text, mtime):
+        with open(self.path, 'w') as fd:
+            fd.write(text)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_parsed_once_and_reloaded_when_changed(self):
+        registry = TemplateRegistry()
+        self._write('{{a}}', 1000)
+        template = registry.get(self.path)
+        self.assertIs(registry.get(self.path), template)
+
+        self._write('{{b}}', 2000)
+        self.assertEqual(registry.get(self.path).placeholders, {'b'})
+
+    def test_load_all_reports_malformed_templates(self):
+        self._write('{{a', 1000)
+        self.assertRaises(TemplateError, TemplateRegistry().load_all, [self.path])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from os.path import join
+
+from timing import Timeline, _get_command_phase, get_critical_path, format_duration
+
+
+class CommandPhaseTest(unittest.TestCase):
+    def test_configure(self):
+        self.assertEqual(_get_command_phase('./configure --prefix=/x'), 'configure')
+        self.assertEqual(_get_command_phase('../src/configure'), 'configure')
+        self.assertEqual(_get_command_phase('./config no-shared'), 'configure')
+        self.assertEqual(_get_command_phase('perl ./Configure linux-x86_64'), 'perl')
+        self.assertEqual(_get_command_phase('./Configure linux-x86_64'), 'configure')
+
+    def test_make_targets(self):
+        self.assertEqual(_get_command_phase('make'), 'make')
+        self.assertEqual(_get_command_phase('make CC=gcc install_sw'), 'make install_sw')
+        self.assertEqual(_get_command_phase('make -j4 CC=gcc install_sw'), 'make install_sw')
+        self.assertEqual(_get_command_phase('env X=1 make build_libs libcrypto.a'), 'make build_libs libcrypto.a')
+
+    def test_other_commands(self):
+        self.assertEqual(_get_command_phase('cp a b'), 'cp')
+        self.assertIsNone(_get_command_phase('  '))
+
+
+class CriticalPathTest(unittest.TestCase):
+    def test_empty(self):
+        self.assertEqual(get_critical_path({}, {}), ([], 0.0))
+
+    def test_longest_chain(self):
+        durations = {'download': 1.0, 'openssl': 10.0, 'amalgamation': 2.0, 'sqlcipher': 5.0, 'docs': 12.0}
+        dependencies = {
+            'openssl': ['download'],
+            'amalgamation': ['download'],
+            'sqlcipher': ['openssl', 'amalgamation'],
+        }
+        self.assertEqual(get_critical_path(durations, dependencies), (['download', 'openssl', 'sqlcipher'], 16.0))
+
+    def test_ignores_dependencies_without_durations(self):
+        self.assertEqual(get_critical_path({'b': 2.0}, {'b': ['a']}), (['b'], 2.0))
+
+
+class TimelineTest(unittest.TestCase):
+    def test_spans_inherit_task_and_platform(self):
+        timeline = Timeline()
+        with timeline.span('build-openssl', 'task', task='build-openssl'):
+            with timeline.span('linux', 'platform', platform='linux'):
+                timeline.add('make', 'phase', 0.0, 1.0)
+
+        phase = [e for e in timeline.events if e['cat'] == 'phase'][0]
+        self.assertEqual(phase['args'], {'task': 'build-openssl', 'platform': 'linux'})
+
+    def test_failed_spans_are_marked(self):
+        timeline = Timeline()
+        with self.assertRaises(ValueError):
+            with timeline.span('x', 'task'):
+                raise ValueError()
+        self.assertTrue(timeline.events[0]['args']['failed'])
+
+    def test_summary(self):
+        timeline = Timeline()
+        timeline.add('a', 'task', 0.0, 2.0, {'task': 'a'})
+        timeline.add('b', 'task', 2.0, 5.0, {'task': 'b'})
+        timeline.add('make', 'phase', 2.0, 3.0, {'task': 'b'})
+        timeline.add('make', 'phase', 3.0, 4.5, {'task': 'b'})
+
+        summary = timeline.get_summary({'b': ['a']})
+        self.assertEqual(summary['critical-path'], ['a', 'b'])
+        self.assertEqual(summary['critical-path-time'], 5.0)
+        self.assertEqual(summary['tasks']['b']['phases'], {'make': 2.5})
+
+    def test_chrome_trace(self):
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+
+        timeline = Timeline()
+        timeline.add('a', 'task', 10.0, 10.5)
+        timeline.write_chrome_trace(join(d, 'trace.json'), {'jobs': 1})
+
+        with open(join(d, 'trace.json')) as fd:
+            trace = json.load(fd)
+        self.assertEqual(trace['otherData'], {'jobs': 1})
+        self.assertEqual(trace['traceEvents'][0]['ts'], 0)
+        self.assertEqual(trace['traceEvents'][0]['dur'], 500000)
+
+    def test_run_command_failure(self):
+        timeline = Timeline()
+        self.assertRaises(subprocess.CalledProcessError, timeline.run_command, ['false'], 'false')
+        self.assertEqual(timeline.events[0]['args']['returncode'], 1)
+
+    @unittest.skipUnless(shutil.which('bash'), 'bash is not installed')
+    def test_script_phases(self):
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        script = join(d, 'build.sh')
+        with open(script, 'w') as fd:
+            #the nested bash script must not be traced
+            fd.write('sleep 0.1\nbash -c "sleep 0.1; true"\ntrue\n')
+
+        timeline = Timeline()
+        timeline.run_script(script, 'build', {'task': 't'}, env=dict(os.environ), cwd=d)
+
+        phases = [(e['name'], e['args']['command']) for e in timeline.events if e['cat'] == 'phase']
+        self.assertEqual(phases, [('sleep', 'sleep 0.1'), ('bash', 'bash -c "sleep 0.1; true"')])
+
+
+class FormatDurationTest(unittest.TestCase):
+    def test_format(self):
+        self.assertEqual(format_duration(12.34), '12.3s')
+        self.assertEqual(format_duration(185), '3m05s')
+        self.assertEqual(format_duration(3720), '1h02m')
+
+
+if __name__ == '__main__':
+    unittest.main()
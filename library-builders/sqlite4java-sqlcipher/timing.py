@@ -0,0 +1,313 @@
+import json
+import os
+import re
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from os.path import join
+
+from logs import child_output
+
+
+#commands in build scripts shorter than this aren't recorded as phases
+MIN_PHASE_DURATION = 0.05
+
+#sourced by bash (via BASH_ENV) before a build script runs; logs the start of
+#each top-level command so configure/make steps can be timed individually.
+#BASH_ENV is unset and the log path kept in an unexported variable, so bash
+#scripts the build script runs (eg: openssl-ios's build-libssl.sh) aren't traced
+_COMMAND_TRACE_SCRIPT = r'''unset BASH_ENV
+_build_command_log=%s
+trap 'printf "%%s\t%%s\n" "${EPOCHREALTIME:-$(date +%%s)}" "$BASH_COMMAND" >> "$_build_command_log"' DEBUG
+'''
+
+_make_target_re = re.compile(r'^[\w.][\w.-]*$')
+
+
+def _get_command_phase(command):
+    "Returns a phase name for a build script command (eg: configure, make install)."
+
+    words = command.split()
+    if not words:
+        return None
+
+    if words[0].endswith(('configure', '/config', 'Configure')):
+        return 'configure'
+
+    if 'make' in words:
+        #targets are the plain words after make, ignoring options and VAR=value overrides
+        targets = [w for w in words[words.index('make') + 1:] if _make_target_re.match(w)]
+        return ' '.join(['make'] + targets)
+
+    return words[0]
+
+
+def _get_maxrss_kb(rusage):
+    #ru_maxrss is in bytes on OSX and KiB on Linux
+    if sys.platform == 'darwin':
+        return rusage.ru_maxrss // 1024
+    return rusage.ru_maxrss
+
+
+class Timeline(object):
+    """
+    Thread-safe record of timed spans (tasks, platforms, build phases and
+    commands), exportable as a Chrome trace (chrome://tracing, Perfetto).
+
+    Each span has a category (task, platform, phase or command) and args;
+    command spans include the CPU time and peak RSS of the command and all
+    of its children. Spans inherit the task and platform args of the span
+    enclosing them on the same thread.
+
+    A Timeline passed to a worker process arrives empty; the worker's events
+    are returned to the parent and merged with add_events().
+    """
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def __getstate__(self):
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+    def _get_inherited_args(self):
+        parent = getattr(self._local, 'args', {})
+        return {k: parent[k] for k in ['task', 'platform'] if k in parent}
+
+    def add(self, name, category, start, end, args=None):
+        args = dict(self._get_inherited_args(), **(args or {}))
+        event = {
+            'name': name,
+            'cat': category,
+            'start': start,
+            'end': end,
+            'pid': os.getpid(),
+            'tid': threading.get_native_id(),
+            'args': args,
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def add_events(self, events):
+        with self._lock:
+            self.events.extend(events)
+
+    @contextmanager
+    def span(self, name, category, **args):
+        "Records the duration of the with block. The yielded args dict may be updated inside the block."
+
+        args = dict(self._get_inherited_args(), **args)
+        parent = getattr(self._local, 'args', {})
+        self._local.args = args
+        start = time.time()
+        try:
+            yield args
+        except BaseException:
+            args['failed'] = True
+            raise
+        finally:
+            self._local.args = parent
+            self.add(name, category, start, time.time(), args)
+
+    def run_command(self, argv, name, category='command', args=None, **kwargs):
+        """
+        Runs argv like subprocess.check_call, recording its wall time and the
+        CPU time and peak RSS of the process and all of its children. Its
+        output goes to the calling thread's log, if it's capturing one (see
+        logs.capture_output).
+        """
+
+        args = dict(args or {})
+        start = time.time()
+        with child_output(kwargs) as started:
+            p = subprocess.Popen(argv, **kwargs)
+            started()
+            try:
+                #unlike Popen.wait, wait4 returns the resource usage of the process tree
+                _, status, rusage = os.wait4(p.pid, 0)
+            except BaseException:
+                p.kill()
+                p.wait()
+                raise
+
+        p.returncode = os.waitstatus_to_exitcode(status)
+        args.update(returncode=p.returncode, user_time=rusage.ru_utime, sys_time=rusage.ru_stime,
+                    maxrss_kb=_get_maxrss_kb(rusage))
+        self.add(name, category, start, time.time(), args)
+
+        if p.returncode != 0:
+            raise subprocess.CalledProcessError(p.returncode, argv)
+
+    def _add_script_phases(self, log_path, end, args):
+        try:
+            with open(log_path, 'r', encoding='utf-8', errors='replace') as fd:
+                lines = [line.rstrip('\n').split('\t', 1) for line in fd]
+        except FileNotFoundError:
+            return
+
+        commands = []
+        for line in lines:
+            try:
+                commands.append((float(line[0]), line[1]))
+            except (ValueError, IndexError):
+                continue
+
+        for i, (start, command) in enumerate(commands):
+            command_end = commands[i + 1][0] if i + 1 < len(commands) else end
+            phase = _get_command_phase(command)
+            if phase is not None and command_end - start >= MIN_PHASE_DURATION:
+                self.add(phase, 'phase', start, command_end, dict(args, command=command))
+
+    def run_script(self, script_name, name, args=None, env=None, **kwargs):
+        """
+        Runs a bash script with run_command, also recording each of its
+        top-level commands that takes a noticeable time as a phase span.
+        """
+
+        args = dict(args or {})
+        env = dict(env if env is not None else os.environ)
+
+        with tempfile.TemporaryDirectory(prefix='build-trace-') as trace_dir:
+            command_log_path = join(trace_dir, 'commands.log')
+            env['BASH_ENV'] = join(trace_dir, 'trace.sh')
+            with open(env['BASH_ENV'], 'w', encoding='utf-8') as fd:
+                fd.write(_COMMAND_TRACE_SCRIPT % shlex.quote(command_log_path))
+
+            try:
+                self.run_command(['bash', script_name], name, 'command', args, env=env, **kwargs)
+            finally:
+                self._add_script_phases(command_log_path, time.time(), args)
+
+    def write_chrome_trace(self, path, metadata=None):
+        "Writes the timeline as Chrome trace-event JSON."
+
+        with self._lock:
+            events = list(self.events)
+
+        origin = min([e['start'] for e in events] or [0])
+        trace_events = []
+        for e in sorted(events, key=lambda e: e['start']):
+            trace_events.append({
+                'name': e['name'],
+                'cat': e['cat'],
+                'ph': 'X',
+                'ts': int((e['start'] - origin) * 1e6),
+                'dur': int((e['end'] - e['start']) * 1e6),
+                'pid': e['pid'],
+                'tid': e['tid'],
+                'args': e['args'],
+            })
+
+        with open(path, 'w', encoding='utf-8') as fd:
+            json.dump({'traceEvents': trace_events, 'otherData': metadata or {}}, fd, indent=1, sort_keys=True)
+
+    def get_summary(self, dependencies):
+        """
+        Returns a JSON-serializable summary of the recorded tasks: wall time,
+        child CPU time and peak RSS per task, platform and phase, plus the
+        critical path through the task graph given as {task name: dependency names}.
+        """
+
+        with self._lock:
+            events = list(self.events)
+
+        tasks = {}
+        for e in events:
+            if e['cat'] == 'task':
+                tasks[e['name']] = {
+                    'wall': e['end'] - e['start'],
+                    'skipped': e['args'].get('skipped', False),
+                    'cpu': 0.0,
+                    'maxrss_kb': 0,
+                    'platforms': {},
+                    'phases': {},
+                }
+
+        for e in events:
+            task = tasks.get(e['args'].get('task'))
+            if task is None:
+                continue
+
+            duration = e['end'] - e['start']
+            if e['cat'] == 'platform':
+                task['platforms'][e['name']] = duration
+            elif e['cat'] == 'phase':
+                task['phases'][e['name']] = task['phases'].get(e['name'], 0.0) + duration
+            elif e['cat'] == 'command':
+                task['cpu'] += e['args']['user_time'] + e['args']['sys_time']
+                task['maxrss_kb'] = max(task['maxrss_kb'], e['args']['maxrss_kb'])
+
+        path, length = get_critical_path({name: t['wall'] for name, t in tasks.items()}, dependencies)
+
+        return {'tasks': tasks, 'critical-path': path, 'critical-path-time': length}
+
+
+def get_critical_path(durations, dependencies):
+    """
+    Returns (task names, total time) of the longest chain of dependent tasks,
+    given {task name: duration} and {task name: dependency names}.
+    """
+
+    finish = {}
+    previous = {}
+
+    def visit(name):
+        if name in finish:
+            return finish[name]
+
+        longest = 0.0
+        for dependency in dependencies.get(name, []):
+            if dependency in durations and visit(dependency) > longest:
+                longest = finish[dependency]
+                previous[name] = dependency
+
+        finish[name] = longest + durations[name]
+        return finish[name]
+
+    if not durations:
+        return [], 0.0
+
+    end = max(durations, key=visit)
+    path = [end]
+    while path[-1] in previous:
+        path.append(previous[path[-1]])
+
+    return list(reversed(path)), finish[end]
+
+
+def format_duration(seconds):
+    "Returns eg: 1h02m, 3m05s or 12.3s."
+
+    if seconds >= 3600:
+        return '%dh%02dm' % (seconds // 3600, seconds % 3600 // 60)
+    if seconds >= 60:
+        return '%dm%02ds' % (seconds // 60, seconds % 60)
+    return '%.1fs' % seconds
+
+
+def print_summary(summary):
+    print('%-28s %10s %10s %10s' % ('Task', 'Wall', 'Child CPU', 'Peak RSS'))
+    for name, task in sorted(summary['tasks'].items(), key=lambda i: -i[1]['wall']):
+        status = ' (skipped)' if task['skipped'] else ''
+        print('%-28s %9.1fs %9.1fs %7d MiB%s' % (name, task['wall'], task['cpu'], task['maxrss_kb'] // 1024, status))
+        for platform, duration in sorted(task['platforms'].items(), key=lambda i: -i[1]):
+            print('  %-26s %9.1fs' % (platform, duration))
+        for phase, duration in sorted(task['phases'].items(), key=lambda i: -i[1]):
+            print('  %-26s %9.1fs' % ('[%s]' % phase, duration))
+
+    print('Critical path (%.1fs): %s' % (summary['critical-path-time'], ' -> '.join(summary['critical-path'])))
+
+
+def get_timeline(task_context):
+    "Returns the context's Timeline, or a throwaway one if timing isn't being recorded."
+
+    timeline = task_context.get('timeline')
+    return timeline if timeline is not None else Timeline()
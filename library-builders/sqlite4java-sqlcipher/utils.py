@@ -1,11 +1,14 @@
 import errno
 import re
-import tarfile
 import subprocess
 import shutil
 import hashlib
-from os import environ, makedirs, listdir, rmdir, rename, pathsep
-from os.path import exists, join, basename, dirname, abspath
+import threading
+from os import environ, makedirs, listdir, rmdir, rename, pathsep, unlink, lstat, stat, uname
+from os.path import exists, lexists, isdir, islink, join, basename, dirname, abspath
+
+from extract import extract_tarball
+from logs import child_output
 
 
 TEMPLATE_DIR = abspath(join(dirname(__file__), 'templates'))
@@ -46,8 +49,11 @@ def locate_command(cmd):
 def apply_patch(cwd, patch_name, context):
     "Apply the given patch template by name in the given directly."
     patch_data = get_patch_template(patch_name).substitute(**context)
-    p = subprocess.Popen(['patch', '-p1'], cwd=cwd, stdin=subprocess.PIPE)
-    p.communicate(patch_data.encode('utf8'))
+    kwargs = {'cwd': cwd, 'stdin': subprocess.PIPE}
+    with child_output(kwargs) as started:
+        p = subprocess.Popen(['patch', '-p1'], **kwargs)
+        started()
+        p.communicate(patch_data.encode('utf8'))
     if p.returncode != 0:
         raise RuntimeError('Failed to apply patch %s' % patch_name)
 
@@ -58,27 +64,68 @@ def get_android_configure_host_type(platform):
     return {
         'android-x86': 'i686-linux-android',
         'android-armeabi-v7a': 'arm-linux-androideabi',
+        'android-x86_64': 'x86_64-linux-android',
+        'android-arm64-v8a': 'aarch64-linux-android',
+    }[platform]
+
+
+def get_android_openssl_target(platform):
+    """
+    Used for ./Configure <target>; ./config falls back to the generic (no-asm)
+    android target for x86. 1.0.2 has no android x86_64 target, so the linux
+    one (which keeps the assembly) is used with the NDK toolchain.
+    """
+
+    return {
+        'android-x86': 'android-x86',
+        'android-armeabi-v7a': 'android-armv7',
+        'android-x86_64': 'linux-x86_64',
+        'android-arm64-v8a': 'android64-aarch64',
     }[platform]
 
 
+def get_android_api(platform):
+    "Returns the android API level built against; the 64-bit ABIs only exist from API 21."
+
+    if platform in ('android-x86_64', 'android-arm64-v8a'):
+        return 21
+    return 19
+
+
 def arch_to_setenv_info(platform):
     "Returns (platform, abi-compiler-prefix)"
 
     cpu = platform.split('-', 1)[1]
-    #platforms/platform-* (arm/mips/x86)
+    #platforms/android-*/arch-* (arm/arm64/mips/x86/x86_64)
     android_arch = {
         'x86': 'x86',
         'armeabi-v7a': 'arm',
+        'x86_64': 'x86_64',
+        'arm64-v8a': 'arm64',
     }[cpu]
 
     android_eabi = {
         'x86': 'x86-4.9',
         'armeabi-v7a': 'arm-linux-androideabi-4.9',
+        'x86_64': 'x86_64-4.9',
+        'arm64-v8a': 'aarch64-linux-android-4.9',
     }[cpu]
 
     return android_arch, android_eabi
 
 
+def get_elf_machine_for_platform(platform):
+    "Returns the ELF architecture (see archive.ELF_MACHINES) of a platform's binaries, or None if they aren't ELF."
+
+    return {
+        'linux-x86_64': 'x86_64',
+        'android-x86': 'x86',
+        'android-armeabi-v7a': 'arm',
+        'android-x86_64': 'x86_64',
+        'android-arm64-v8a': 'aarch64',
+    }.get(platform)
+
+
 def get_static_lib_name_for_platform(platform, lib):
     return 'lib%s.a' % lib
 
@@ -100,18 +147,38 @@ def platform_is_android(platform):
     return platform.startswith('android-')
 
 
+def get_host_platform():
+    "Returns the platform builds run on natively on this machine, or None."
+
+    host = uname()
+    return {
+        ('Linux', 'x86_64'): 'linux-x86_64',
+        ('Darwin', 'x86_64'): 'osx-x86_64',
+    }.get((host.sysname, host.machine))
+
+
+def get_template_path(name):
+    "Returns the path of the given template under templates/."
+
+    return join(TEMPLATE_DIR, name)
+
+
+def get_patch_path(name):
+    "Returns the path of the given patch name under patches/."
+
+    return join(PATCH_DIR, name + '.diff')
+
+
 def get_template(name):
     "Returns a Template for the given template under templates/."
 
-    path = join(TEMPLATE_DIR, name)
-    return Template.from_file(path)
+    return _template_registry.get(get_template_path(name))
 
 
 def get_patch_template(name):
     "Returns a Template instance for the given patch name under patches/."
 
-    path = join(PATCH_DIR, name + '.diff')
-    return Template.from_file(path)
+    return _template_registry.get(get_patch_path(name))
 
 
 def get_file_path(name):
@@ -121,9 +188,40 @@ def get_file_path(name):
     return path
 
 
+def unshare_file(path):
+    """
+    Removes the given file if it's hardlinked elsewhere (eg: to a pristine
+    source tree), so writing to the path doesn't modify the other copies.
+    """
+
+    try:
+        if lstat(path).st_nlink > 1:
+            unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def copy_file(src, dest):
+    "Copies src to the dest file or directory, without writing through hardlinks"
+
+    if isdir(dest):
+        dest = join(dest, basename(src))
+
+    unshare_file(dest)
+    shutil.copy(src, dest)
+
+
+def read_file(path):
+    "Returns the contents of the given UTF-8 file"
+
+    with open(path, 'r', encoding='utf-8') as fd:
+        return fd.read()
+
+
 def write_to_file(path, text):
     "Writes the given text as UTF-8 to the given path"
 
+    unshare_file(path)
     with open(path, 'w', encoding='utf-8') as fd:
         fd.write(text)
 
@@ -134,6 +232,15 @@ def list_files(path):
     return [join(path, child) for child in listdir(path)]
 
 
+def remove_path(path):
+    "Removes the given file or directory tree, if it exists"
+
+    if isdir(path) and not islink(path):
+        shutil.rmtree(path)
+    elif lexists(path):
+        unlink(path)
+
+
 def unhoist_directory(path):
     """
     If the given directory contains only a single directory, move all the
@@ -153,17 +260,14 @@ def unhoist_directory(path):
 
 
 def unpack_source(src_path, output_path):
-    "Unpacks the src archive to the given path and unhoist it."
+    "Unpacks the src archive to the given path, stripping its top-level directory."
 
     if exists(output_path):
         shutil.rmtree(output_path)
 
     make_dirs(output_path)
 
-    with tarfile.open(src_path) as tar:
-        tar.extractall(output_path)
-
-    unhoist_directory(output_path)
+    extract_tarball(src_path, output_path, threaded=True)
 
 
 def make_dirs(path):
@@ -176,18 +280,92 @@ def make_dirs(path):
             raise
 
 
+class TemplateError(Exception):
+    "Raised for malformed templates, and templates rendered without values for all of their placeholders."
+
+
 class Template(object):
-    "Basic template which substitutes items within {{}} using a dictionary."
+    """
+    Basic template which substitutes items within {{}} using a dictionary.
+
+    The text is split into literal and placeholder segments once, so
+    rendering is a single join.
+    """
 
     _substitute_re = re.compile('{{([^}]+)}}')
+    _placeholder_re = re.compile(r'^[\w.-]+$')
 
     @classmethod
     def from_file(cls, path):
         with open(path, 'r', encoding='utf-8') as fd:
-            return cls(fd.read())
+            return cls(fd.read(), basename(path))
 
-    def __init__(self, template_text):
+    def __init__(self, template_text, name='<string>'):
         self.template_text = template_text
+        self.name = name
+        #alternating literal text and placeholder names, starting and ending with literals
+        self._segments = self._substitute_re.split(template_text)
+        self.placeholders = frozenset(self._segments[1::2])
+
+        for placeholder in self.placeholders:
+            if not self._placeholder_re.match(placeholder):
+                raise TemplateError('Template %s has an invalid placeholder: {{%s}}' % (name, placeholder))
+        for literal in self._segments[0::2]:
+            if '{{' in literal or '}}' in literal:
+                raise TemplateError('Template %s has an unterminated placeholder near: %s' % (
+                    name, literal[literal.find('{{' if '{{' in literal else '}}'):][:40]))
+
+    def check_context(self, context):
+        "Raises TemplateError if the context is missing values for any placeholders."
+
+        missing = self.placeholders.difference(context)
+        if missing:
+            raise TemplateError('Template %s has no values for: %s' % (self.name, ', '.join(sorted(missing))))
 
     def substitute(self, **context):
-        return self._substitute_re.sub(lambda m: context[m.group(1)], self.template_text)
+        self.check_context(context)
+
+        segments = list(self._segments)
+        for i in range(1, len(segments), 2):
+            segments[i] = context[segments[i]]
+        return ''.join(segments)
+
+
+class TemplateRegistry(object):
+    """
+    Cache of parsed Templates loaded from files, reloaded when a file's
+    mtime or size changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._templates = {}
+
+    def get(self, path):
+        st = stat(path)
+        version = (st.st_mtime_ns, st.st_size)
+
+        with self._lock:
+            cached = self._templates.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        template = Template.from_file(path)
+        with self._lock:
+            self._templates[path] = (version, template)
+        return template
+
+    def load_all(self, paths):
+        "Parses the given template files, so a malformed one is reported before any build starts."
+
+        for path in paths:
+            self.get(path)
+
+
+_template_registry = TemplateRegistry()
+
+
+def load_templates():
+    "Parses every template under templates/ and patch under patches/. Raises TemplateError for malformed ones."
+
+    _template_registry.load_all(sorted(list_files(TEMPLATE_DIR)) + sorted(list_files(PATCH_DIR)))